@@ -5,20 +5,50 @@ import logging
 import os
 from PIL import Image
 import numpy as np
+from registro import configurar_logging_asincrono, configurar_predicciones, registrar_predicciones
+from backends_deteccion import BackendClipTransformers, BackendYoloUltralytics, backend_desde_entorno
+from preflight_imagen import ImagenRechazadaError, LimitesImagen, verificar_imagen
 
-# Configurar logging COMPLETO
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("moderacion_completa.log", encoding='utf-8'),
-    ]
+# Configurar logging COMPLETO (escritura en segundo plano, ver registro.py)
+configurar_logging_asincrono(
+    [logging.FileHandler("moderacion_completa.log", encoding='utf-8')],
+    formato="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
+# Volcados de predicciones por etiqueta: JSONL muestreado
+configurar_predicciones("predicciones_moderacion.jsonl")
 logger = logging.getLogger("MODERACION_COMPLETA")
 
 # SILENCIAR YOLO
 os.environ['YOLO_VERBOSE'] = 'False'
 
+# Modos de análisis, del más completo al más barato (ver control_sobrecarga.py)
+MODOS_ANALISIS = ("completo", "etiquetas_reducidas", "resolucion_reducida", "solo_yolo")
+
+# Categorías para violencia (modo completo)
+ETIQUETAS_VIOLENCIA = [
+    # CONTENIDO EXPLÍCITO Y ARMAS (ALTA PRIORIDAD)
+    "blood", "gore", "injured person", "bloody scene", "violence",
+    "gun", "knife", "weapon", "firearm", "pistol", "rifle",
+    "porn", "sexual content", "explicit content", "nudity",
+
+    # SITUACIONES PELIGROSAS (BAJA PRIORIDAD)
+    "fight", "battle", "war", "horror", "terror",
+
+    # CONTENIDO SEGURO (para contraste)
+    "landscape", "peaceful image", "normal scene", "safe content",
+    "person smiling", "everyday life", "nature", "building"
+]
+
+# Subconjunto de etiquetas de violencia para los modos degradados
+ETIQUETAS_REDUCIDAS = [
+    "blood", "gore", "violence", "gun", "knife", "weapon",
+    "porn", "explicit content", "nudity",
+    "landscape", "normal scene", "person smiling", "nature"
+]
+
+# Tamaño de entrada de YOLO en los modos de resolución reducida (por defecto 640)
+IMGSZ_REDUCIDO = 320
+
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, (np.bool_,)):
@@ -30,8 +60,9 @@ class CustomJSONEncoder(json.JSONEncoder):
         return super().default(obj)
 
 class WeaponDetector:
-    def __init__(self):
-        self.model = None
+    def __init__(self, backend=None):
+        # Backend de inferencia (backends_deteccion.py); None = YOLO con fallback a CLIP
+        self.backend = backend
         self.cargado = False
         self.model_name = "YOLOv8n"
         self.model_type = None
@@ -39,71 +70,71 @@ class WeaponDetector:
     def load_model(self):
         """Carga el mejor modelo disponible para detección de armas"""
         try:
-            # Intentar cargar YOLO primero
-            try:
-                from ultralytics import YOLO
-                
-                logger.info("Cargando YOLOv8 para deteccion de armas...")
-                
-                self.model = YOLO('yolov8n.pt')
-                self.model_type = 'yolo'
-                self.model_name = "YOLOv8n"
-                self.cargado = True
-                
-                logger.info("YOLOv8 cargado correctamente")
-                logger.info("   - Tipo: Object detection")
-                logger.info("   - Clases: 80 categorias incluyendo armas")
-                
-            except ImportError:
-                logger.warning("YOLO no disponible, usando CLIP como fallback")
-                from transformers import pipeline
-                self.classifier = pipeline(
-                    "zero-shot-image-classification", 
-                    model="openai/clip-vit-base-patch32"
-                )
-                self.model_type = 'clip'
-                self.model_name = "CLIP (fallback)"
-                self.cargado = True
-                logger.info("CLIP cargado como fallback para armas")
+            if self.backend is None:
+                self.backend = backend_desde_entorno("armas")
+
+            if self.backend is not None:
+                self.backend.cargar()
+                logger.info(f"Backend de armas: {self.backend.nombre}")
+            else:
+                # Intentar cargar YOLO primero
+                try:
+                    logger.info("Cargando YOLOv8 para deteccion de armas...")
+                    
+                    self.backend = BackendYoloUltralytics('yolov8n.pt')
+                    self.backend.cargar()
+                    
+                    logger.info("YOLOv8 cargado correctamente")
+                    logger.info("   - Tipo: Object detection")
+                    logger.info("   - Clases: 80 categorias incluyendo armas")
+                    
+                except ImportError:
+                    logger.warning("YOLO no disponible, usando CLIP como fallback")
+                    self.backend = BackendClipTransformers()
+                    self.backend.cargar()
+                    logger.info("CLIP cargado como fallback para armas")
+
+            self.model_type = 'yolo' if self.backend.tarea == 'deteccion' else 'clip'
+            self.model_name = self.backend.nombre
+            self.cargado = True
             
         except Exception as e:
             logger.error(f"ERROR CARGANDO MODELO DE ARMAS: {e}")
             self.cargado = False
 
-    def analyze_weapons(self, image_path: str):
+    def analyze_weapons(self, image_path: str, imgsz: int = None):
         """Detección de armas con modelo ESPECIALIZADO"""
         if not self.cargado:
             return {"armas_detectadas": False, "confianza": 0.0, "error": "Modelo no cargado"}
 
         try:
-            logger.info(f"Analizando armas en: {image_path}")
+            logger.debug("Analizando armas en: %s", image_path)
             
             if self.model_type == 'yolo':
                 # ✅ MEJORAR CONFIGURACIÓN YOLO - CONFIANZA MÁS BAJA
-                results = self.model(image_path, verbose=False, conf=0.25)
+                detecciones = self.backend.detectar(image_path, conf=0.25, imgsz=imgsz)
                 weapons_detected = []
                 
-                for result in results:
-                    for box in result.boxes:
-                        class_id = int(box.cls[0])
-                        class_name = result.names[class_id]
-                        confidence = float(box.conf[0])
-                        
-                        # ✅ MÁS CATEGORÍAS DE ARMAS Y OBJETOS PELIGROSOS
-                        weapon_categories = [
-                            'knife', 'gun', 'pistol', 'rifle', 'firearm', 'weapon',
-                            'sword', 'dagger', 'machete', 'shotgun', 'revolver',
-                            'scissors', 'axe', 'bat', 'hammer'
-                        ]
-                        
-                        # ✅ UMBRAL MÁS BAJO PARA DETECCIÓN
-                        if class_name in weapon_categories and confidence > 0.25:
-                            weapons_detected.append({
-                                'weapon': class_name,
-                                'confidence': confidence
-                            })
-                            logger.info(f"   Detectado: {class_name} (confianza: {confidence:.4f})")
+                # ✅ MÁS CATEGORÍAS DE ARMAS Y OBJETOS PELIGROSOS
+                weapon_categories = [
+                    'knife', 'gun', 'pistol', 'rifle', 'firearm', 'weapon',
+                    'sword', 'dagger', 'machete', 'shotgun', 'revolver',
+                    'scissors', 'axe', 'bat', 'hammer'
+                ]
+                
+                for deteccion in detecciones:
+                    class_name = deteccion['clase']
+                    confidence = deteccion['confianza']
+                    
+                    # ✅ UMBRAL MÁS BAJO PARA DETECCIÓN
+                    if class_name in weapon_categories and confidence > 0.25:
+                        weapons_detected.append({
+                            'weapon': class_name,
+                            'confidence': confidence
+                        })
+                        logger.debug("   Detectado: %s (confianza: %.4f)", class_name, confidence)
                 
+                registrar_predicciones("armas_yolo", image_path, weapons_detected)
                 armas_detectadas = len(weapons_detected) > 0
                 confianza_max = max([w['confidence'] for w in weapons_detected]) if weapons_detected else 0.0
                 
@@ -112,7 +143,7 @@ class WeaponDetector:
                     "confianza": confianza_max,
                     "detalles_armas": weapons_detected,
                     "total_armas_detectadas": len(weapons_detected),
-                    "modelo_utilizado": "YOLOv8"
+                    "modelo_utilizado": self.backend.nombre
                 }
                 
             else:
@@ -122,14 +153,11 @@ class WeaponDetector:
                     "sword", "dagger", "machete", "shotgun", "revolver"
                 ]
                 
-                logger.info(f"Buscando {len(candidate_labels)} tipos de armas...")
-                result = self.classifier(image_path, candidate_labels=candidate_labels)
+                logger.debug("Buscando %d tipos de armas...", len(candidate_labels))
+                result = self.backend.clasificar(image_path, candidate_labels)
                 
-                # Log de predicciones de armas
-                logger.info("PREDICCIONES DE ARMAS:")
-                for i, pred in enumerate(result):
-                    if pred['score'] > 0.1:
-                        logger.info(f"   {i+1:2d}. {pred['label']:15s} : {pred['score']:.4f}")
+                # Predicciones de armas (registro JSONL muestreado)
+                registrar_predicciones("armas_clip", image_path, result)
                 
                 # ✅ UMBRAL MÁS BAJO PARA CLIP
                 weapons_detected = [pred for pred in result if pred['score'] > 0.2]
@@ -141,18 +169,19 @@ class WeaponDetector:
                     "confianza": confianza_max,
                     "detalles_armas": weapons_detected,
                     "total_armas_detectadas": len(weapons_detected),
-                    "modelo_utilizado": "CLIP"
+                    "modelo_utilizado": self.backend.nombre
                 }
             
             # Log del resultado
             if armas_detectadas:
-                logger.warning(f"ARMAS DETECTADAS: {resultado['total_armas_detectadas']} armas encontradas")
-                for arma in resultado['detalles_armas']:
-                    logger.warning(f"   - {arma.get('weapon', arma.get('label', 'arma'))} (confianza: {arma.get('confidence', arma.get('score', 0)):.4f})")
+                logger.warning("ARMAS DETECTADAS: %d - %s", resultado['total_armas_detectadas'], [
+                    (arma.get('weapon', arma.get('label', 'arma')), round(arma.get('confidence', arma.get('score', 0)), 4))
+                    for arma in resultado['detalles_armas']
+                ])
             else:
-                logger.info("No se detectaron armas")
+                logger.debug("No se detectaron armas")
             
-            logger.info(f"RESULTADO ARMAS: detectadas={armas_detectadas}, confianza_max={confianza_max:.4f}")
+            logger.debug("RESULTADO ARMAS: detectadas=%s, confianza_max=%.4f", armas_detectadas, confianza_max)
             return resultado
             
         except Exception as e:
@@ -162,33 +191,44 @@ class WeaponDetector:
             return {"armas_detectadas": False, "confianza": 0.0, "error": str(e)}
 
 class ViolenceDetector:
-    def __init__(self):
-        self.model = None
+    def __init__(self, backend=None, etiquetas: list = None):
+        # Backend de inferencia (backends_deteccion.py); None = CLIP zero-shot
+        self.backend = backend
+        self.etiquetas = list(etiquetas) if etiquetas else ETIQUETAS_VIOLENCIA
         self.cargado = False
         self.model_name = "CLIP (Zero-Shot)"
 
     def load_model(self):
         """Carga modelo ESPECIALIZADO para detección de violencia"""
         try:
-            from transformers import pipeline
-            
-            logger.info("Cargando modelo CLIP para clasificacion flexible...")
+            if self.backend is None:
+                self.backend = backend_desde_entorno("violencia")
+
+            if self.backend is not None:
+                self.backend.cargar()
+                self.model_name = self.backend.nombre
+                logger.info(f"Backend de violencia: {self.backend.nombre}")
+            else:
+                logger.info("Cargando modelo CLIP para clasificacion flexible...")
+                
+                self.backend = BackendClipTransformers("openai/clip-vit-base-patch32")
+                self.backend.cargar()
+                self.model_name = "openai/clip-vit-base-patch32"
+                logger.info("Modelo CLIP cargado correctamente")
+                logger.info("   - Tipo: Zero-shot image classification")
+                logger.info("   - Capacidad: Clasificacion flexible con categorias personalizadas")
             
-            self.classifier = pipeline(
-                "zero-shot-image-classification",
-                model="openai/clip-vit-base-patch32"
-            )
             self.cargado = True
-            self.model_name = "openai/clip-vit-base-patch32"
-            logger.info("Modelo CLIP cargado correctamente")
-            logger.info("   - Tipo: Zero-shot image classification")
-            logger.info("   - Capacidad: Clasificacion flexible con categorias personalizadas")
             
         except Exception as e:
             logger.error(f"Error cargando modelo CLIP: {e}")
             self.cargado = False
 
-    def analyze_violence(self, image_path: str):
+    def embedding_imagen(self, image_path: str):
+        """Embedding CLIP normalizado de la imagen (para el banco de rechazadas)"""
+        return self.backend.embedding(image_path)
+
+    def analyze_violence(self, image_path: str, candidate_labels: list = None):
         """Analiza contenido violento con modelo ESPECIALIZADO"""
         if not self.cargado:
             return {
@@ -198,32 +238,18 @@ class ViolenceDetector:
             }
 
         try:
-            logger.info(f"Analizando violencia en: {image_path}")
+            logger.debug("Analizando violencia en: %s", image_path)
             
             # Categorías para violencia
-            candidate_labels = [
-                # CONTENIDO EXPLÍCITO Y ARMAS (ALTA PRIORIDAD)
-                "blood", "gore", "injured person", "bloody scene", "violence",
-                "gun", "knife", "weapon", "firearm", "pistol", "rifle",
-                "porn", "sexual content", "explicit content", "nudity",
-                
-                # SITUACIONES PELIGROSAS (BAJA PRIORIDAD)
-                "fight", "battle", "war", "horror", "terror",
-                
-                # CONTENIDO SEGURO (para contraste)
-                "landscape", "peaceful image", "normal scene", "safe content",
-                "person smiling", "everyday life", "nature", "building"
-            ]
+            candidate_labels = candidate_labels or self.etiquetas
             
-            logger.info(f"Buscando {len(candidate_labels)} categorias...")
+            logger.debug("Buscando %d categorias...", len(candidate_labels))
             
             # Ejecutar clasificación
-            result = self.classifier(image_path, candidate_labels=candidate_labels)
+            result = self.backend.clasificar(image_path, candidate_labels)
             
-            # Log de todas las predicciones
-            logger.info("PREDICCIONES DE VIOLENCIA (Top 10):")
-            for i, pred in enumerate(result[:10]):
-                logger.info(f"   {i+1:2d}. {pred['label']:25s} : {pred['score']:.4f}")
+            # Predicciones por etiqueta (registro JSONL muestreado)
+            registrar_predicciones("violencia", image_path, result)
             
             # Filtrar predicciones de violencia
             violencia_detectada = []
@@ -269,11 +295,11 @@ class ViolenceDetector:
             
             # Log de detecciones específicas
             if violencia_detectada:
-                logger.warning("DETECCIONES DE VIOLENCIA ENCONTRADAS:")
-                for deteccion in violencia_detectada:
-                    logger.warning(f"   - {deteccion['label']} ({deteccion['score']:.4f}) - Tipo: {deteccion['tipo']} - Prioridad: {deteccion['prioridad']}")
+                logger.warning("DETECCIONES DE VIOLENCIA: %s", [
+                    (d['label'], round(d['score'], 4), d['tipo'], d['prioridad']) for d in violencia_detectada
+                ])
             else:
-                logger.info("No se detecto contenido violento")
+                logger.debug("No se detecto contenido violento")
             
             resultado = {
                 "es_violento": es_violento,
@@ -283,7 +309,7 @@ class ViolenceDetector:
                 "categorias_encontradas": [v['label'] for v in violencia_detectada]
             }
             
-            logger.info(f"RESULTADO VIOLENCIA: es_violento={es_violento}, prob={probabilidad_violencia:.4f}")
+            logger.debug("RESULTADO VIOLENCIA: es_violento=%s, prob=%.4f", es_violento, probabilidad_violencia)
             return resultado
             
         except Exception as e:
@@ -297,10 +323,26 @@ class ViolenceDetector:
             }
 
 class ImageAnalyzer:
-    def __init__(self):
-        self.weapon_detector = WeaponDetector()
-        self.violence_detector = ViolenceDetector()
+    def __init__(self, banco=None, umbral_banco: float = 0.95, backend_violencia=None, backend_armas=None,
+                 limites_preflight: LimitesImagen = None, etiquetas_violencia: list = None):
+        self.weapon_detector = WeaponDetector(backend=backend_armas)
+        self.violence_detector = ViolenceDetector(backend=backend_violencia, etiquetas=etiquetas_violencia)
         self.cargado = False
+        self.limites_preflight = limites_preflight or LimitesImagen.desde_entorno()
+        # Banco opcional de embeddings (banco_embeddings.BancoEmbeddings)
+        self.banco = banco
+        self.umbral_banco = umbral_banco
+
+    def _consultar_banco(self, image_path: str):
+        """Busca la imagen en el banco de rechazadas. Retorna (embedding, coincidencia o None)"""
+        embedding = self.violence_detector.embedding_imagen(image_path)
+        if self.banco.total == 0:
+            return embedding, None
+        coincidencias = self.banco.buscar(embedding, k=1, solo_rechazadas=True)
+        if coincidencias and coincidencias[0][1] >= self.umbral_banco:
+            fila, similitud = coincidencias[0]
+            return embedding, {"fila": fila, "similitud": similitud, **self.banco.metadatos(fila)}
+        return embedding, None
 
     def load_models(self):
         """Carga todos los modelos necesarios"""
@@ -327,22 +369,77 @@ class ImageAnalyzer:
             logger.error(f"Stack trace: {traceback.format_exc()}")
             self.cargado = False
 
-    def analyze_image(self, image_path: str):
-        """Analiza una imagen para contenido inapropiado"""
+    def liberar(self):
+        """Suelta los modelos (recarga en caliente, cuando ya no quedan peticiones en vuelo)"""
+        self.cargado = False
+        for detector in (self.weapon_detector, self.violence_detector):
+            detector.backend = None
+            detector.cargado = False
+
+    def analyze_image(self, image_path, modo: str = "completo", preflight: bool = True, hash_contenido: str = None,
+                      alimentar_banco: bool = True, usar_banco: bool = True):
+        """
+        Analiza una imagen para contenido inapropiado (ver MODOS_ANALISIS).
+        preflight=False omite la verificación de cabecera si el llamador ya la hizo.
+        alimentar_banco=False consulta el banco pero no le agrega el embedding
+        (p.ej. el calentamiento de una recarga); usar_banco=False ni lo consulta
+        ni lo alimenta (p.ej. la evaluación en sombra).
+        image_path también puede ser una PIL.Image ya decodificada (memoria
+        compartida): el preflight lo hizo quien la decodificó, y hash_contenido
+        identifica la imagen en el banco.
+        """
         if not self.cargado:
             return {"es_apto": False, "error": "Modelos no cargados", "puntuacion_riesgo": 1.0}
 
+        en_memoria = isinstance(image_path, Image.Image)
         try:
-            logger.info(f"INICIANDO ANALISIS DE IMAGEN: {image_path}")
+            logger.debug("INICIANDO ANALISIS DE IMAGEN: %s", "<memoria>" if en_memoria else image_path)
             
-            if not os.path.exists(image_path):
+            if not en_memoria and not os.path.exists(image_path):
                 return {"es_apto": False, "error": "Archivo no encontrado", "puntuacion_riesgo": 1.0}
 
-            logger.info("Ejecutando analisis de violencia...")
-            resultado_violencia = self.violence_detector.analyze_violence(image_path)
+            # Preflight: sólo cabecera, antes de que ningún modelo decodifique la imagen
+            tiempo_preflight = None
+            if preflight and not en_memoria:
+                try:
+                    tiempo_preflight = verificar_imagen(image_path, self.limites_preflight)["tiempo_preflight"]
+                except ImagenRechazadaError as e:
+                    logger.warning("IMAGEN RECHAZADA EN PREFLIGHT (%s): %s", e.codigo, e)
+                    return e.como_resultado()
+
+            # Banco de rechazadas: una coincidencia evita el scoring completo de etiquetas
+            embedding = None
+            if self.banco is not None and usar_banco and modo != "solo_yolo":
+                try:
+                    embedding, coincidencia = self._consultar_banco(image_path)
+                except Exception as e:
+                    logger.warning("Error consultando banco de embeddings: %s", e)
+                    coincidencia = None
+                if coincidencia:
+                    logger.warning("IMAGEN RECHAZADA POR BANCO - similitud %.4f", coincidencia['similitud'])
+                    return {
+                        "es_apto": False,
+                        "puntuacion_riesgo": float(coincidencia["similitud"]),
+                        "coincidencia_banco": coincidencia,
+                        "analisis_violencia": {"es_violento": False, "probabilidad_violencia": 0.0},
+                        "analisis_armas": {"armas_detectadas": False, "confianza": 0.0},
+                        "modo_analisis": modo
+                    }
+
+            if modo == "solo_yolo":
+                resultado_violencia = {
+                    "es_violento": False,
+                    "probabilidad_violencia": 0.0,
+                    "omitido": "modo solo_yolo"
+                }
+            else:
+                logger.debug("Ejecutando analisis de violencia...")
+                etiquetas = ETIQUETAS_REDUCIDAS if modo != "completo" else None
+                resultado_violencia = self.violence_detector.analyze_violence(image_path, etiquetas)
             
-            logger.info("Ejecutando analisis de armas...")
-            resultado_armas = self.weapon_detector.analyze_weapons(image_path)
+            logger.debug("Ejecutando analisis de armas...")
+            imgsz = IMGSZ_REDUCIDO if modo in ("resolucion_reducida", "solo_yolo") else None
+            resultado_armas = self.weapon_detector.analyze_weapons(image_path, imgsz=imgsz)
             
             # Calcular riesgos
             riesgo_violencia = resultado_violencia.get("probabilidad_violencia", 0)
@@ -372,10 +469,10 @@ class ImageAnalyzer:
             
             puntuacion_riesgo = max(riesgo_violencia, riesgo_armas)
             
-            # Log del resultado
-            logger.info("RESULTADOS OBTENIDOS:")
-            logger.info(f"    Violencia: es_violento={resultado_violencia.get('es_violento')}, prob={riesgo_violencia:.4f}")
-            logger.info(f"    Armas: detectadas={resultado_armas.get('armas_detectadas')}, confianza={riesgo_armas:.4f}")
+            # Detalle por etapa sólo en DEBUG (argumentos perezosos): una línea INFO por análisis, al final
+            logger.debug("RESULTADOS OBTENIDOS: violencia es_violento=%s prob=%.4f | armas detectadas=%s confianza=%.4f",
+                         resultado_violencia.get('es_violento'), riesgo_violencia,
+                         resultado_armas.get('armas_detectadas'), riesgo_armas)
             
             if not es_apto:
                 razones = []
@@ -386,10 +483,7 @@ class ImageAnalyzer:
                 if armas_en_violencia and confianza_armas_violencia > 0.15:
                     razones.append(f"armas en violencia ({confianza_armas_violencia:.4f})")
                 
-                logger.warning(f"IMAGEN RECHAZADA - Puntuacion riesgo: {puntuacion_riesgo:.4f}")
-                logger.warning(f"    - Razon: {'; '.join(razones)}")
-            else:
-                logger.info(f"IMAGEN APROBADA - Puntuacion riesgo: {puntuacion_riesgo:.4f}")
+                logger.warning("IMAGEN RECHAZADA - Puntuacion riesgo: %.4f - Razon: %s", puntuacion_riesgo, '; '.join(razones))
             
             resultado_final = {
                 "es_apto": es_apto,
@@ -397,10 +491,27 @@ class ImageAnalyzer:
                 "analisis_armas": resultado_armas,
                 "puntuacion_riesgo": float(puntuacion_riesgo),
                 "armas_detectadas_en_violencia": armas_en_violencia,
-                "confianza_armas_violencia": float(confianza_armas_violencia)
+                "confianza_armas_violencia": float(confianza_armas_violencia),
+                "modo_analisis": modo
             }
-            
-            logger.info(f"RESUMEN FINAL: es_apto={es_apto}, riesgo={puntuacion_riesgo:.4f}")
+            if tiempo_preflight is not None:
+                resultado_final["tiempo_preflight"] = tiempo_preflight
+            
+            if embedding is not None and alimentar_banco:
+                try:
+                    from cola_trabajos import calcular_hash_archivo
+                    # unico: la misma imagen analizada de nuevo (caché desactivada, reescaneo) no duplica filas
+                    self.banco.agregar(embedding, {
+                        "hash": hash_contenido or calcular_hash_archivo(image_path),
+                        "ruta": None if en_memoria else image_path,
+                        "es_apto": bool(es_apto)
+                    }, unico=True)
+                except Exception as e:
+                    logger.warning("Error guardando embedding en el banco: %s", e)
+
+            logger.info("ANALISIS %s: es_apto=%s riesgo=%.4f violencia=%.4f armas=%.4f modo=%s",
+                        hash_contenido if en_memoria else image_path, es_apto, puntuacion_riesgo,
+                        riesgo_violencia, riesgo_armas, modo)
             return resultado_final
 
         except Exception as e:
@@ -422,6 +533,7 @@ def main():
     
     try:
         analyzer = ImageAnalyzer()
+        analyzer.load_models()
         result = analyzer.analyze_image(image_path)
         print(json.dumps(result, cls=CustomJSONEncoder, ensure_ascii=False, indent=2))
         
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Backends de inferencia para WeaponDetector y ViolenceDetector.
+
+Un backend de clasificación responde como el pipeline zero-shot de
+transformers ([{"label", "score"}] ordenado); uno de detección responde
+[{"clase", "confianza"}] como las cajas de YOLO. Los detectores sólo aplican
+umbrales sobre esa salida, así que el backend se puede cambiar sin tocar la
+lógica de moderación. La imagen llega como ruta o como PIL.Image ya
+decodificada (transporte por memoria compartida, ver memoria_compartida.py).
+
+El backend sintético no descarga pesos ni usa CPU en inferencia: duerme una
+latencia configurable (por lote + por imagen) y genera scores deterministas
+a partir de la ruta de la imagen. Sirve para perfilar el servidor (colas,
+lotes, cachés) de forma rápida y reproducible:
+
+    MODERACION_BACKEND=sintetico
+    MODERACION_SINTETICO='{"por_item_ms": 120, "por_lote_ms": 30, "alpha": 0.3}'
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from ejecucion_torch import (
+    OpcionesTorch, compilar_modulo, contexto_inferencia, optimizar_modulo, revertir_compilacion
+)
+
+logger = logging.getLogger("BACKENDS_DETECCION")
+
+MODELO_CLIP = "openai/clip-vit-base-patch32"
+MODELO_YOLO = "yolov8n.pt"
+
+# Clases de YOLO (COCO) que devuelve el backend sintético de detección
+CLASES_SINTETICAS = ["person", "knife", "scissors", "bat", "car", "dog", "bottle", "chair"]
+
+# Etiquetas para calentar CLIP (el modo compilado admite cualquier número, dynamic=True)
+ETIQUETAS_CALENTAMIENTO = ["weapon", "violence", "landscape", "person smiling"]
+
+
+def nombre_imagen(imagen) -> str:
+    """Nombre estable de la imagen: basename de la ruta o info["nombre"] de una PIL.Image"""
+    if isinstance(imagen, str):
+        return os.path.basename(imagen)
+    return imagen.info.get("nombre", "")
+
+
+def _calentar(modulo, opciones: OpcionesTorch, pasada, nombre: str):
+    """Calentamiento eager, compilación y calentamiento del grafo compilado"""
+    for _ in range(opciones.pasadas_calentamiento):
+        pasada()
+    if not compilar_modulo(modulo):
+        return
+    try:
+        for _ in range(opciones.pasadas_calentamiento):
+            pasada()
+        logger.info(f"{nombre}: forward compilado con torch.compile")
+    except Exception as e:
+        revertir_compilacion(modulo)
+        logger.warning(f"{nombre}: torch.compile falló en el calentamiento, se usa eager: {e}")
+
+
+class BackendClasificacion:
+    """Clasificación zero-shot de imágenes"""
+    tarea = "clasificacion"
+    nombre = "base"
+
+    def cargar(self):
+        pass
+
+    def clasificar(self, image_path: str, etiquetas: list) -> list:
+        raise NotImplementedError
+
+    def clasificar_lote(self, rutas: list, etiquetas: list) -> list:
+        return [self.clasificar(ruta, etiquetas) for ruta in rutas]
+
+    def embedding(self, image_path: str) -> np.ndarray:
+        raise NotImplementedError
+
+
+class BackendDeteccion:
+    """Detección de objetos"""
+    tarea = "deteccion"
+    nombre = "base"
+
+    def cargar(self):
+        pass
+
+    def detectar(self, image_path: str, conf: float = 0.25, imgsz: int = None) -> list:
+        """imgsz: lado de entrada del modelo; None = el del modelo"""
+        raise NotImplementedError
+
+    def detectar_lote(self, rutas: list, conf: float = 0.25, imgsz: int = None) -> list:
+        return [self.detectar(ruta, conf, imgsz) for ruta in rutas]
+
+
+class BackendClipTransformers(BackendClasificacion):
+    nombre = "CLIP"
+
+    def __init__(self, modelo: str = MODELO_CLIP, opciones_torch: OpcionesTorch = None):
+        self.modelo = modelo
+        self.opciones = opciones_torch or OpcionesTorch.desde_entorno()
+        self.classifier = None
+
+    def cargar(self):
+        from transformers import pipeline
+        self.classifier = pipeline("zero-shot-image-classification", model=self.modelo)
+        if self.opciones.optimizado:
+            from PIL import Image
+
+            optimizar_modulo(self.classifier.model, self.opciones)
+            imagen = Image.new("RGB", (224, 224))
+            _calentar(
+                self.classifier.model, self.opciones,
+                lambda: self.classifier(imagen, candidate_labels=ETIQUETAS_CALENTAMIENTO),
+                self.nombre
+            )
+            logger.info(f"{self.nombre}: ejecución optimizada {self.opciones.como_dict()}")
+
+    def clasificar(self, image_path, etiquetas):
+        return self.classifier(image_path, candidate_labels=etiquetas)
+
+    def clasificar_lote(self, rutas, etiquetas):
+        return self.classifier(rutas, candidate_labels=etiquetas)
+
+    def embedding(self, image_path):
+        from PIL import Image
+
+        imagen = Image.open(image_path).convert("RGB") if isinstance(image_path, str) else image_path
+        entradas = self.classifier.image_processor(images=imagen, return_tensors="pt")
+        # get_image_features no pasa por forward: aplicar aquí el mismo contexto
+        with contexto_inferencia(self.opciones):
+            caracteristicas = self.classifier.model.get_image_features(**entradas)
+        vector = caracteristicas[0].float().cpu().numpy().astype(np.float32)
+        return vector / (np.linalg.norm(vector) + 1e-12)
+
+
+class BackendYoloUltralytics(BackendDeteccion):
+    nombre = "YOLOv8"
+
+    def __init__(self, pesos: str = MODELO_YOLO, opciones_torch: OpcionesTorch = None):
+        self.pesos = pesos
+        self.opciones = opciones_torch or OpcionesTorch.desde_entorno()
+        self.model = None
+
+    def cargar(self):
+        from ultralytics import YOLO  # ImportError si no está instalado
+        self.model = YOLO(self.pesos)
+        if self.opciones.optimizado:
+            imagen = np.zeros((640, 640, 3), dtype=np.uint8)
+            # La primera predicción crea el predictor y fusiona conv+bn; optimizar la red ya fusionada
+            self.model(imagen, verbose=False)
+            red = self.model.predictor.model.model
+            optimizar_modulo(red, self.opciones)
+            _calentar(red, self.opciones, lambda: self.model(imagen, verbose=False), self.nombre)
+            logger.info(f"{self.nombre}: ejecución optimizada {self.opciones.como_dict()}")
+
+    @staticmethod
+    def _cajas(result) -> list:
+        return [
+            {"clase": result.names[int(box.cls[0])], "confianza": float(box.conf[0])}
+            for box in result.boxes
+        ]
+
+    def _opciones(self, conf, imgsz):
+        opciones = {"verbose": False, "conf": conf}
+        if imgsz:
+            opciones["imgsz"] = imgsz
+        return opciones
+
+    def detectar(self, image_path, conf=0.25, imgsz=None):
+        return [c for r in self.model(image_path, **self._opciones(conf, imgsz)) for c in self._cajas(r)]
+
+    def detectar_lote(self, rutas, conf=0.25, imgsz=None):
+        return [self._cajas(r) for r in self.model(rutas, **self._opciones(conf, imgsz))]
+
+
+class ModeloLatencia:
+    """Latencia sintética: por_lote_ms + por_item_ms * n, con jitter gaussiano opcional"""
+
+    def __init__(self, por_item_ms: float = 100.0, por_lote_ms: float = 0.0,
+                 jitter_ms: float = 0.0, semilla: int = 0):
+        self.por_item_ms = float(por_item_ms)
+        self.por_lote_ms = float(por_lote_ms)
+        self.jitter_ms = float(jitter_ms)
+        self._rng = np.random.default_rng(semilla)
+        self._lock = threading.Lock()
+
+    def esperar(self, n: int = 1, escala: float = 1.0):
+        """escala multiplica el costo por imagen (p.ej. resolución reducida)"""
+        ms = self.por_lote_ms + self.por_item_ms * n * escala
+        if self.jitter_ms:
+            with self._lock:
+                ms += self._rng.normal(0.0, self.jitter_ms)
+        if ms > 0:
+            time.sleep(ms / 1000.0)
+
+
+def _rng_determinista(semilla: int, *partes) -> np.random.Generator:
+    clave = hashlib.sha256("|".join([str(semilla), *map(str, partes)]).encode("utf-8")).digest()
+    return np.random.default_rng(int.from_bytes(clave[:8], "little"))
+
+
+class BackendSinteticoClasificacion(BackendClasificacion):
+    """
+    Scores zero-shot deterministas por (semilla, imagen, etiquetas).
+
+    Los scores siguen una Dirichlet(alpha): alpha chico concentra la masa en
+    pocas etiquetas (veredictos "seguros"), alpha grande la reparte.
+    """
+    nombre = "sintetico"
+
+    def __init__(self, latencia: ModeloLatencia = None, alpha: float = 0.3,
+                 semilla: int = 0, dimension: int = 512):
+        self.latencia = latencia or ModeloLatencia()
+        self.alpha = float(alpha)
+        self.semilla = semilla
+        self.dimension = dimension
+
+    def _scores(self, image_path, etiquetas):
+        rng = _rng_determinista(self.semilla, nombre_imagen(image_path), *etiquetas)
+        scores = rng.dirichlet(np.full(len(etiquetas), self.alpha))
+        return sorted(
+            ({"label": e, "score": float(s)} for e, s in zip(etiquetas, scores)),
+            key=lambda p: p["score"], reverse=True
+        )
+
+    @staticmethod
+    def _escala(etiquetas):
+        # Proporcional al número de etiquetas respecto a las 28 del modo completo
+        return len(etiquetas) / 28.0
+
+    def clasificar(self, image_path, etiquetas):
+        self.latencia.esperar(1, self._escala(etiquetas))
+        return self._scores(image_path, etiquetas)
+
+    def clasificar_lote(self, rutas, etiquetas):
+        self.latencia.esperar(len(rutas), self._escala(etiquetas))
+        return [self._scores(ruta, etiquetas) for ruta in rutas]
+
+    def embedding(self, image_path):
+        rng = _rng_determinista(self.semilla, "embedding", nombre_imagen(image_path))
+        vector = rng.standard_normal(self.dimension).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+
+class BackendSinteticoDeteccion(BackendDeteccion):
+    """
+    Detecciones deterministas: cada clase aparece con probabilidad
+    `prob_deteccion` y confianza ~ Beta(beta_a, beta_b).
+    """
+    nombre = "sintetico"
+
+    def __init__(self, latencia: ModeloLatencia = None, prob_deteccion: float = 0.05,
+                 beta_a: float = 2.0, beta_b: float = 5.0, semilla: int = 0):
+        self.latencia = latencia or ModeloLatencia()
+        self.prob_deteccion = float(prob_deteccion)
+        self.beta_a = float(beta_a)
+        self.beta_b = float(beta_b)
+        self.semilla = semilla
+
+    def _cajas(self, image_path, conf):
+        rng = _rng_determinista(self.semilla, "deteccion", nombre_imagen(image_path))
+        presentes = rng.random(len(CLASES_SINTETICAS)) < self.prob_deteccion
+        confianzas = rng.beta(self.beta_a, self.beta_b, len(CLASES_SINTETICAS))
+        return [
+            {"clase": clase, "confianza": float(c)}
+            for clase, presente, c in zip(CLASES_SINTETICAS, presentes, confianzas)
+            if presente and c >= conf
+        ]
+
+    @staticmethod
+    def _escala(imgsz):
+        # El costo de YOLO crece con el área de entrada (640 x 640 por defecto)
+        return (imgsz / 640.0) ** 2 if imgsz else 1.0
+
+    def detectar(self, image_path, conf=0.25, imgsz=None):
+        self.latencia.esperar(1, self._escala(imgsz))
+        return self._cajas(image_path, conf)
+
+    def detectar_lote(self, rutas, conf=0.25, imgsz=None):
+        self.latencia.esperar(len(rutas), self._escala(imgsz))
+        return [self._cajas(ruta, conf) for ruta in rutas]
+
+
+def config_sintetica() -> dict:
+    """Configuración del backend sintético desde MODERACION_SINTETICO (JSON)"""
+    try:
+        return json.loads(os.environ.get("MODERACION_SINTETICO", "") or "{}")
+    except json.JSONDecodeError as e:
+        logger.warning(f"MODERACION_SINTETICO inválido, usando valores por defecto: {e}")
+        return {}
+
+
+def _latencia(config: dict, prefijo: str) -> ModeloLatencia:
+    return ModeloLatencia(
+        por_item_ms=config.get(f"{prefijo}por_item_ms", config.get("por_item_ms", 100.0)),
+        por_lote_ms=config.get(f"{prefijo}por_lote_ms", config.get("por_lote_ms", 0.0)),
+        jitter_ms=config.get("jitter_ms", 0.0),
+        semilla=config.get("semilla", 0),
+    )
+
+
+def backend_desde_entorno(tarea: str):
+    """
+    Backend configurado por MODERACION_BACKEND, o None para usar los modelos reales.
+    `tarea` es 'violencia' o 'armas'. Las claves de MODERACION_SINTETICO pueden
+    llevar prefijo por tarea (p.ej. "armas_por_item_ms").
+    """
+    if os.environ.get("MODERACION_BACKEND", "").lower() != "sintetico":
+        return None
+
+    config = config_sintetica()
+    prefijo = f"{tarea}_"
+    if tarea == "armas":
+        return BackendSinteticoDeteccion(
+            latencia=_latencia(config, prefijo),
+            prob_deteccion=config.get("prob_deteccion", 0.05),
+            beta_a=config.get("beta_a", 2.0),
+            beta_b=config.get("beta_b", 5.0),
+            semilla=config.get("semilla", 0),
+        )
+    return BackendSinteticoClasificacion(
+        latencia=_latencia(config, prefijo),
+        alpha=config.get("alpha", 0.3),
+        semilla=config.get("semilla", 0),
+    )
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Banco de embeddings CLIP de imágenes moderadas, en matrices memory-mapped.
+
+Archivos dentro del directorio del banco:
+  banco.json          dimensión y versión
+  embeddings.f32      matriz (n, d) float32, sólo se agrega al final
+  embeddings.i8       misma matriz cuantizada a int8 (escala fija 127)
+  rechazadas.u8       1 byte por fila: 1 = rechazada a mano por un moderador
+  metadatos.jsonl     una línea JSON por fila (hash, ruta, veredicto, fecha)
+
+La búsqueda es coseno top-k con productos matriciales por bloques; con
+cuantizado=True se hace una primera pasada int8 y se reordenan los
+candidatos con la matriz float32.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger("BANCO_EMBEDDINGS")
+
+DIMENSION_CLIP = 512
+
+# Filas por bloque en la búsqueda: bloques chicos mantienen el producto en caché
+# (16k filas * 512 dims * 4 bytes = 32 MB float32). La pasada int8 usa bloques
+# más chicos porque cada bloque se convierte a float32 antes del producto.
+FILAS_POR_BLOQUE = 16384
+FILAS_POR_BLOQUE_INT8 = 4096
+
+ESCALA_INT8 = 127.0
+
+# Candidatos extra por resultado en la pasada cuantizada antes de reordenar
+FACTOR_CANDIDATOS = 8
+
+
+def normalizar(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norma = np.linalg.norm(vector)
+    return vector / norma if norma > 0 else vector
+
+
+def _cuantizar(matriz: np.ndarray) -> np.ndarray:
+    return np.clip(np.rint(matriz * ESCALA_INT8), -127, 127).astype(np.int8)
+
+
+def _top_k(scores: np.ndarray, k: int):
+    """Índices de los k mayores scores, ordenados de mayor a menor"""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+class BancoEmbeddings:
+    """Matriz append-only de embeddings con búsqueda vectorizada"""
+
+    def __init__(self, directorio: str, dimension: int = DIMENSION_CLIP):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+
+        ruta_config = os.path.join(directorio, "banco.json")
+        if os.path.exists(ruta_config):
+            with open(ruta_config, encoding="utf-8") as f:
+                dimension = json.load(f)["dimension"]
+        else:
+            with open(ruta_config, "w", encoding="utf-8") as f:
+                json.dump({"dimension": dimension, "version": 1}, f)
+        self.dimension = int(dimension)
+
+        self._ruta_f32 = os.path.join(directorio, "embeddings.f32")
+        self._ruta_i8 = os.path.join(directorio, "embeddings.i8")
+        self._ruta_flags = os.path.join(directorio, "rechazadas.u8")
+        self._ruta_meta = os.path.join(directorio, "metadatos.jsonl")
+        for ruta in (self._ruta_f32, self._ruta_i8, self._ruta_flags, self._ruta_meta):
+            open(ruta, "ab").close()
+
+        self._lock = threading.Lock()
+        self._mapas = {}  # (ruta, filas) -> np.memmap
+
+        self._filas_por_hash = {}
+        self._offsets_meta = []
+        self.total = self._filas_consistentes()
+        flags = np.fromfile(self._ruta_flags, dtype=np.uint8, count=self.total)
+        self._idx_rechazadas = np.flatnonzero(flags).astype(np.int64)
+
+        logger.info(
+            f"Banco de embeddings: {self.total} vectores, "
+            f"{len(self._idx_rechazadas)} rechazados ({directorio})"
+        )
+
+    def _filas_consistentes(self) -> int:
+        """Filas completas en todos los archivos; recorta escrituras a medias tras un crash"""
+        fin_meta = self._cargar_metadatos()
+        filas = min(
+            len(self._offsets_meta),
+            os.path.getsize(self._ruta_f32) // (self.dimension * 4),
+            os.path.getsize(self._ruta_i8) // self.dimension,
+            os.path.getsize(self._ruta_flags),
+        )
+        if filas < len(self._offsets_meta):
+            fin_meta = self._offsets_meta[filas]
+            del self._offsets_meta[filas:]
+            for hash_contenido in list(self._filas_por_hash):
+                restantes = [f for f in self._filas_por_hash[hash_contenido] if f < filas]
+                if restantes:
+                    self._filas_por_hash[hash_contenido] = restantes
+                else:
+                    del self._filas_por_hash[hash_contenido]
+
+        for ruta, tamano in ((self._ruta_f32, filas * self.dimension * 4),
+                             (self._ruta_i8, filas * self.dimension),
+                             (self._ruta_flags, filas),
+                             (self._ruta_meta, fin_meta)):
+            if os.path.getsize(ruta) != tamano:
+                logger.warning(f"Recortando escritura incompleta en {ruta}")
+                os.truncate(ruta, tamano)
+        return filas
+
+    def _cargar_metadatos(self) -> int:
+        """Indexa offsets y hashes de metadatos.jsonl; retorna el fin de la última línea completa"""
+        offset = 0
+        with open(self._ruta_meta, "rb") as f:
+            for linea in f:
+                if not linea.endswith(b"\n"):
+                    break
+                fila = len(self._offsets_meta)
+                self._offsets_meta.append(offset)
+                offset += len(linea)
+                try:
+                    hash_contenido = json.loads(linea).get("hash")
+                except json.JSONDecodeError:
+                    continue
+                if hash_contenido:
+                    self._filas_por_hash.setdefault(hash_contenido, []).append(fila)
+        return offset
+
+    def _mapa(self, ruta: str, dtype, filas: int, columnas: int = None):
+        clave = (ruta, filas)
+        mapa = self._mapas.get(clave)
+        if mapa is None:
+            forma = (filas, columnas) if columnas else (filas,)
+            mapa = np.memmap(ruta, dtype=dtype, mode="r", shape=forma)
+            # Sólo se conserva el mapa del tamaño actual
+            self._mapas = {k: v for k, v in self._mapas.items() if k[0] != ruta}
+            self._mapas[clave] = mapa
+        return mapa
+
+    def agregar(self, vector, metadatos: dict = None, rechazada: bool = False, unico: bool = False) -> int:
+        """
+        Agrega un embedding y retorna su número de fila. Con unico=True, si ya
+        hay una fila con el mismo metadatos["hash"] retorna ésa sin agregar nada.
+        """
+        return self.agregar_lote(np.asarray(vector)[None, :], [metadatos or {}], rechazada, unico)[0]
+
+    def agregar_lote(self, matriz, metadatos: list = None, rechazada: bool = False, unico: bool = False) -> list:
+        matriz = np.asarray(matriz, dtype=np.float32)
+        if matriz.ndim != 2 or matriz.shape[1] != self.dimension:
+            raise ValueError(f"Se esperaba una matriz (n, {self.dimension}), llegó {matriz.shape}")
+        normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+        matriz = matriz / np.where(normas > 0, normas, 1.0)
+        metadatos = metadatos or [{} for _ in range(len(matriz))]
+
+        with self._lock:
+            if unico:
+                existentes = [self._filas_por_hash.get(meta.get("hash"), [None])[0] for meta in metadatos]
+                nuevas = [i for i, fila in enumerate(existentes) if fila is None]
+                if not nuevas:
+                    return existentes
+                matriz = matriz[nuevas]
+                metadatos = [metadatos[i] for i in nuevas]
+            inicio = self.total
+            # Metadatos primero: una fila sin vector se descarta al reabrir
+            with open(self._ruta_meta, "ab") as f:
+                offset = f.tell()
+                for meta in metadatos:
+                    linea = (json.dumps(dict(meta, ts=meta.get("ts", time.time())), ensure_ascii=False) + "\n").encode("utf-8")
+                    self._offsets_meta.append(offset)
+                    offset += len(linea)
+                    f.write(linea)
+            with open(self._ruta_f32, "ab") as f:
+                f.write(matriz.tobytes())
+            with open(self._ruta_i8, "ab") as f:
+                f.write(_cuantizar(matriz).tobytes())
+            with open(self._ruta_flags, "ab") as f:
+                f.write((b"\x01" if rechazada else b"\x00") * len(matriz))
+
+            filas = list(range(inicio, inicio + len(matriz)))
+            for fila, meta in zip(filas, metadatos):
+                if meta.get("hash"):
+                    self._filas_por_hash.setdefault(meta["hash"], []).append(fila)
+            if rechazada:
+                self._idx_rechazadas = np.concatenate(
+                    [self._idx_rechazadas, np.asarray(filas, dtype=np.int64)]
+                )
+            self.total = inicio + len(matriz)
+        if unico:
+            agregadas = iter(filas)
+            return [fila if fila is not None else next(agregadas) for fila in existentes]
+        return filas
+
+    def filas_de_hash(self, hash_contenido: str) -> list:
+        with self._lock:
+            return list(self._filas_por_hash.get(hash_contenido, []))
+
+    def marcar_rechazada(self, filas, rechazada: bool = True):
+        """Cambia la marca de rechazo manual de las filas indicadas"""
+        with self._lock:
+            with open(self._ruta_flags, "r+b") as f:
+                for fila in filas:
+                    f.seek(fila)
+                    f.write(b"\x01" if rechazada else b"\x00")
+            flags = np.fromfile(self._ruta_flags, dtype=np.uint8, count=self.total)
+            self._idx_rechazadas = np.flatnonzero(flags).astype(np.int64)
+
+    def buscar(self, vector, k: int = 5, solo_rechazadas: bool = True, cuantizado: bool = False) -> list:
+        """Top-k por similitud coseno. Retorna [(fila, similitud), ...]"""
+        consulta = normalizar(vector)
+        with self._lock:
+            total = self.total
+            candidatas = self._idx_rechazadas if solo_rechazadas else None
+        if total == 0 or (candidatas is not None and len(candidatas) == 0):
+            return []
+
+        if cuantizado:
+            matriz = self._mapa(self._ruta_i8, np.int8, total, self.dimension)
+            k_pasada = k * FACTOR_CANDIDATOS
+            filas_por_bloque = FILAS_POR_BLOQUE_INT8
+        else:
+            matriz = self._mapa(self._ruta_f32, np.float32, total, self.dimension)
+            k_pasada = k
+            filas_por_bloque = FILAS_POR_BLOQUE
+
+        mejores_idx = np.empty(0, dtype=np.int64)
+        mejores_scores = np.empty(0, dtype=np.float32)
+        limite = total if candidatas is None else len(candidatas)
+
+        for inicio in range(0, limite, filas_por_bloque):
+            fin = min(inicio + filas_por_bloque, limite)
+            if candidatas is None:
+                filas = np.arange(inicio, fin, dtype=np.int64)
+                bloque = matriz[inicio:fin]
+            else:
+                filas = candidatas[inicio:fin]
+                bloque = matriz[filas]
+
+            scores = bloque.astype(np.float32, copy=False) @ consulta
+            top = _top_k(scores, k_pasada)
+
+            mejores_idx = np.concatenate([mejores_idx, filas[top]])
+            mejores_scores = np.concatenate([mejores_scores, scores[top]])
+            top = _top_k(mejores_scores, k_pasada)
+            mejores_idx, mejores_scores = mejores_idx[top], mejores_scores[top]
+
+        if cuantizado:
+            # Reordenar candidatos con los vectores exactos
+            exactos = self._mapa(self._ruta_f32, np.float32, total, self.dimension)
+            orden = np.argsort(mejores_idx)
+            mejores_idx = mejores_idx[orden]
+            mejores_scores = exactos[mejores_idx] @ consulta
+            top = _top_k(mejores_scores, k)
+            mejores_idx, mejores_scores = mejores_idx[top], mejores_scores[top]
+
+        return [(int(i), float(s)) for i, s in zip(mejores_idx[:k], mejores_scores[:k])]
+
+    def rechazada(self, fila: int) -> bool:
+        with self._lock:
+            idx = self._idx_rechazadas
+        # flatnonzero y los agregados al final lo mantienen ordenado
+        posicion = np.searchsorted(idx, fila)
+        return bool(posicion < len(idx) and idx[posicion] == fila)
+
+    def metadatos(self, fila: int) -> dict:
+        """
+        Metadatos de la fila con la marca de rechazo actual. metadatos.jsonl es
+        append-only y guarda el veredicto del análisis: si un moderador la
+        rechazó después, es_apto se reporta False y el original queda en
+        es_apto_analisis.
+        """
+        with self._lock:
+            if not 0 <= fila < len(self._offsets_meta):
+                return {}
+            offset = self._offsets_meta[fila]
+        with open(self._ruta_meta, "rb") as f:
+            f.seek(offset)
+            meta = json.loads(f.readline())
+        meta["rechazada"] = self.rechazada(fila)
+        if meta["rechazada"] and meta.get("es_apto"):
+            meta["es_apto_analisis"] = meta["es_apto"]
+            meta["es_apto"] = False
+        return meta
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "directorio": self.directorio,
+                "dimension": self.dimension,
+                "vectores": self.total,
+                "rechazadas": int(len(self._idx_rechazadas)),
+                "bytes_f32": self.total * self.dimension * 4,
+            }
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark de búsqueda top-k en el banco de embeddings.
+
+Llena un banco temporal con vectores aleatorios (por defecto 1 millón) y mide
+la latencia de buscar() sobre todo el banco y sólo sobre las rechazadas, con
+la matriz float32 y con la pasada cuantizada int8 + reordenamiento. También
+reporta cuántos top-k de la versión cuantizada coinciden con la exacta.
+
+Uso: python benchmark_banco.py [--vectores 1000000] [--rechazadas 0.01] [--consultas 20]
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from banco_embeddings import BancoEmbeddings, DIMENSION_CLIP
+
+LOTE_CARGA = 50000
+
+
+def medir(banco, consultas, k, **opciones):
+    tiempos, resultados = [], []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        resultados.append(banco.buscar(consulta, k=k, **opciones))
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos), max(tiempos), resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectores", type=int, default=1_000_000)
+    parser.add_argument("--rechazadas", type=float, default=0.01, help="Fracción marcada como rechazada")
+    parser.add_argument("--consultas", type=int, default=20)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        banco = BancoEmbeddings(tmp, DIMENSION_CLIP)
+
+        inicio = time.perf_counter()
+        for desde in range(0, args.vectores, LOTE_CARGA):
+            n = min(LOTE_CARGA, args.vectores - desde)
+            lote = rng.standard_normal((n, DIMENSION_CLIP), dtype=np.float32)
+            banco.agregar_lote(lote, [{"hash": f"h{desde + i}"} for i in range(n)])
+        carga = time.perf_counter() - inicio
+
+        n_rechazadas = int(args.vectores * args.rechazadas)
+        banco.marcar_rechazada(rng.choice(args.vectores, n_rechazadas, replace=False).tolist())
+
+        # Consultas cercanas a vectores existentes, como una re-subida ligeramente editada
+        base = np.memmap(f"{tmp}/embeddings.f32", dtype=np.float32, mode="r",
+                         shape=(args.vectores, DIMENSION_CLIP))
+        elegidos = rng.choice(args.vectores, args.consultas, replace=False)
+        consultas = [base[i] + 0.05 * rng.standard_normal(DIMENSION_CLIP, dtype=np.float32) for i in elegidos]
+
+        print(f"Banco: {args.vectores} vectores x {DIMENSION_CLIP} dims, "
+              f"{n_rechazadas} rechazadas (carga {carga:.1f}s)")
+        print(f"{'modo':<36}{'p50 (ms)':>10}{'max (ms)':>10}{'recall@k':>10}")
+
+        for solo in (False, True):
+            p50, maximo, exactos = medir(banco, consultas, args.k, solo_rechazadas=solo)
+            etiqueta = "rechazadas" if solo else "todo el banco"
+            print(f"{'float32 - ' + etiqueta:<36}{p50:>10.1f}{maximo:>10.1f}{1.0:>10.3f}")
+
+            p50, maximo, aprox = medir(banco, consultas, args.k, solo_rechazadas=solo, cuantizado=True)
+            recall = statistics.fmean(
+                len({f for f, _ in a} & {f for f, _ in e}) / max(1, len(e))
+                for a, e in zip(aprox, exactos)
+            )
+            print(f"{'int8 + reordenar - ' + etiqueta:<36}{p50:>10.1f}{maximo:>10.1f}{recall:>10.3f}")
+
+        del base
+
+
+if __name__ == "__main__":
+    main()
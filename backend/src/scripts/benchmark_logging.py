@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark del costo de logging por petición en el hilo que atiende /analyze.
+
+Ejecuta el analyze_image real con el backend sintético sobre imágenes ya
+decodificadas, sin E/S de imagen. --latencia-ms simula la inferencia (un
+sleep que suelta el GIL, como torch); con 0 sólo queda el trabajo de Python
+alrededor de los modelos y el hilo del listener compite por el GIL con la
+petición, el peor caso para la cola. Compara:
+  - sin logging (referencia),
+  - FileHandler síncrono en el hilo de la petición,
+  - el esquema actual: QueueHandler + JSONL de predicciones muestreado.
+El costo del logging es la diferencia con la referencia.
+
+Uso: python benchmark_logging.py [--iteraciones 2000] [--tasa 0.01] [--imagenes 64] [--latencia-ms 2]
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+DIRECTORIO_SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+
+
+def imagenes_sinteticas(n: int) -> list:
+    """Imágenes decodificadas con nombre distinto (los scores sintéticos dependen de él)"""
+    imagenes = []
+    for i in range(n):
+        imagen = Image.new("RGB", (64, 64), (i * 37 % 256, i * 91 % 256, i * 13 % 256))
+        imagen.info["nombre"] = f"benchmark_{i:04d}"
+        imagenes.append(imagen)
+    return imagenes
+
+
+def medir(analizador, imagenes, iteraciones):
+    muestras = []
+    for i in range(iteraciones):
+        imagen = imagenes[i % len(imagenes)]
+        inicio = time.perf_counter()
+        analizador.analyze_image(imagen, preflight=False, hash_contenido=imagen.info["nombre"])
+        muestras.append((time.perf_counter() - inicio) * 1e6)
+    muestras.sort()
+    return {
+        "media_us": statistics.fmean(muestras),
+        "p50_us": muestras[len(muestras) // 2],
+        "p99_us": muestras[int(len(muestras) * 0.99)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iteraciones", type=int, default=2000)
+    parser.add_argument("--tasa", type=float, default=0.01, help="Tasa de muestreo de predicciones")
+    parser.add_argument("--imagenes", type=int, default=64)
+    parser.add_argument("--latencia-ms", type=float, default=2.0,
+                        help="Latencia simulada de cada modelo (0 = sólo el código Python)")
+    args = parser.parse_args()
+
+    # Backend sintético: lo medido es el código de analyze_image, no la inferencia
+    os.environ["MODERACION_BACKEND"] = "sintetico"
+    os.environ["MODERACION_SINTETICO"] = json.dumps({"por_item_ms": args.latencia_ms, "por_lote_ms": 0})
+
+    formato = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    with tempfile.TemporaryDirectory() as tmp:
+        # analisis_imagen configura al importarse el logging asíncrono y el JSONL en el cwd
+        os.chdir(tmp)
+        sys.path.insert(0, DIRECTORIO_SCRIPTS)
+        import registro
+        from analisis_imagen import ImageAnalyzer
+
+        registro.establecer_tasa_muestreo(args.tasa)
+        analizador = ImageAnalyzer()
+        analizador.load_models()
+        imagenes = imagenes_sinteticas(args.imagenes)
+        medir(analizador, imagenes, min(200, args.iteraciones))  # calentamiento
+
+        raiz = logging.getLogger()
+        handlers_cola = list(raiz.handlers)
+
+        logging.disable(logging.CRITICAL)
+        referencia = medir(analizador, imagenes, args.iteraciones)
+        logging.disable(logging.NOTSET)
+
+        # Esquema anterior: FileHandler síncrono en el hilo de la petición
+        sincrono = logging.FileHandler(os.path.join(tmp, "sincrono.log"), encoding="utf-8")
+        sincrono.setFormatter(logging.Formatter(formato))
+        raiz.handlers = [sincrono]
+        anterior = medir(analizador, imagenes, args.iteraciones)
+        sincrono.close()
+
+        # Esquema actual: cola + listener en segundo plano (registro.py)
+        raiz.handlers = handlers_cola
+        actual = medir(analizador, imagenes, args.iteraciones)
+        registro.detener_logging()
+        os.chdir(DIRECTORIO_SCRIPTS)
+
+    print(f"Iteraciones: {args.iteraciones} | latencia por modelo: {args.latencia_ms} ms | "
+          f"nivel: {logging.getLevelName(raiz.level)} | tasa de muestreo: {registro.obtener_tasa_muestreo()}")
+    print(f"{'esquema':<28}{'media (us)':>12}{'p50 (us)':>12}{'p99 (us)':>12}{'logging (us)':>14}")
+    for nombre, r in (("Sin logging (referencia)", referencia), ("FileHandler síncrono", anterior),
+                      ("Cola + JSONL muestreado", actual)):
+        costo = r["media_us"] - referencia["media_us"]
+        print(f"{nombre:<28}{r['media_us']:>12.1f}{r['p50_us']:>12.1f}{r['p99_us']:>12.1f}{costo:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
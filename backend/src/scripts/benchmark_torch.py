@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Benchmark del modo torch optimizado (ejecucion_torch.py) contra el eager actual.
+
+Carga CLIP y YOLO dos veces: eager (como en producción) y optimizado
+(inference_mode, bf16 si la CPU lo soporta, channels-last, torch.compile tras
+el calentamiento). Sobre el mismo conjunto de imágenes mide:
+  - latencia p50/p95 de CLIP (28 etiquetas), YOLO y analyze_image completo
+  - tiempo de carga + calentamiento (incluye la compilación)
+  - deriva de scores: |Δscore| de CLIP por etiqueta, coincidencia del top-1,
+    clases YOLO detectadas, |Δconfianza|, y coincidencia del veredicto es_apto
+
+Uso: python benchmark_torch.py --imagenes ../../uploads [--repeticiones 3] [--bf16 auto|1|0] [--sin-compilar]
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from analisis_imagen import ETIQUETAS_VIOLENCIA, ImageAnalyzer
+from backends_deteccion import BackendClipTransformers, BackendYoloUltralytics
+from ejecucion_torch import OpcionesTorch
+from prueba_carga import cargar_imagenes, percentil
+
+
+def imagenes_sinteticas(directorio: str, n: int) -> list:
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    rutas = []
+    for i in range(n):
+        ruta = f"{directorio}/sintetica_{i}.jpg"
+        Image.fromarray(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)).save(ruta)
+        rutas.append(ruta)
+    return rutas
+
+
+def medir(funcion, repeticiones: int):
+    """(resultado de la primera llamada, tiempos en ms de todas)"""
+    tiempos, resultado = [], None
+    for i in range(repeticiones):
+        inicio = time.perf_counter()
+        salida = funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        if i == 0:
+            resultado = salida
+    return resultado, tiempos
+
+
+def ejecutar(opciones: OpcionesTorch, imagenes: list, repeticiones: int) -> dict:
+    clip = BackendClipTransformers(opciones_torch=opciones)
+    yolo = BackendYoloUltralytics(opciones_torch=opciones)
+    analizador = ImageAnalyzer(backend_violencia=clip, backend_armas=yolo)
+
+    inicio = time.perf_counter()
+    analizador.load_models()
+    carga = time.perf_counter() - inicio
+    if not analizador.cargado:
+        raise RuntimeError("No se pudieron cargar los modelos")
+
+    salida = {"carga_s": carga, "clip": [], "yolo": [], "veredictos": [],
+              "t_clip": [], "t_yolo": [], "t_analisis": []}
+    for ruta in imagenes:
+        scores, t = medir(lambda: clip.clasificar(ruta, ETIQUETAS_VIOLENCIA), repeticiones)
+        salida["clip"].append({p["label"]: p["score"] for p in scores})
+        salida["t_clip"] += t
+
+        cajas, t = medir(lambda: yolo.detectar(ruta, conf=0.25), repeticiones)
+        por_clase = {}
+        for caja in cajas:
+            por_clase[caja["clase"]] = max(por_clase.get(caja["clase"], 0.0), caja["confianza"])
+        salida["yolo"].append(por_clase)
+        salida["t_yolo"] += t
+
+        veredicto, t = medir(lambda: analizador.analyze_image(ruta), repeticiones)
+        salida["veredictos"].append((veredicto.get("es_apto"), veredicto.get("puntuacion_riesgo", 1.0)))
+        salida["t_analisis"] += t
+    return salida
+
+
+def deriva(eager: dict, optimizado: dict) -> dict:
+    delta_clip, top1 = [], []
+    for a, b in zip(eager["clip"], optimizado["clip"]):
+        delta_clip.append(max(abs(a[e] - b.get(e, 0.0)) for e in a))
+        top1.append(max(a, key=a.get) == max(b, key=b.get))
+
+    delta_yolo, clases = [], []
+    for a, b in zip(eager["yolo"], optimizado["yolo"]):
+        clases.append(set(a) == set(b))
+        comunes = set(a) & set(b)
+        if comunes:
+            delta_yolo.append(max(abs(a[c] - b[c]) for c in comunes))
+
+    veredicto = [a[0] == b[0] for a, b in zip(eager["veredictos"], optimizado["veredictos"])]
+    riesgo = [abs(a[1] - b[1]) for a, b in zip(eager["veredictos"], optimizado["veredictos"])]
+    return {
+        "clip_max_delta_p50": statistics.median(delta_clip),
+        "clip_max_delta_max": max(delta_clip),
+        "clip_top1_coincide": statistics.fmean(top1),
+        "yolo_clases_coinciden": statistics.fmean(clases),
+        "yolo_max_delta": max(delta_yolo) if delta_yolo else 0.0,
+        "veredicto_coincide": statistics.fmean(veredicto),
+        "riesgo_max_delta": max(riesgo),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--imagenes", help="Directorio o glob de imágenes (por defecto, 20 imágenes sintéticas)")
+    parser.add_argument("--limite", type=int, default=50, help="Máximo de imágenes a usar")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Llamadas por imagen y modelo")
+    parser.add_argument("--bf16", default="auto", choices=("auto", "1", "0"))
+    parser.add_argument("--sin-compilar", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        imagenes = cargar_imagenes(args.imagenes) if args.imagenes else imagenes_sinteticas(tmp, 20)
+        imagenes = imagenes[:args.limite]
+        if not imagenes:
+            parser.error(f"no se encontraron imágenes en {args.imagenes}")
+
+        opciones = OpcionesTorch(optimizado=True, bf16=args.bf16, compilar=not args.sin_compilar)
+        print(f"{len(imagenes)} imágenes x {args.repeticiones} repeticiones | optimizado: {opciones.como_dict()}")
+
+        eager = ejecutar(OpcionesTorch(), imagenes, args.repeticiones)
+        optimizado = ejecutar(opciones, imagenes, args.repeticiones)
+
+    print(f"\n{'':<24}{'eager p50':>11}{'eager p95':>11}{'opt p50':>11}{'opt p95':>11}{'speedup':>9}")
+    for etiqueta, clave in (("CLIP (28 etiquetas)", "t_clip"), ("YOLO", "t_yolo"), ("analyze_image", "t_analisis")):
+        e50, o50 = percentil(eager[clave], 0.5), percentil(optimizado[clave], 0.5)
+        print(f"{etiqueta:<24}{e50:>11.1f}{percentil(eager[clave], 0.95):>11.1f}"
+              f"{o50:>11.1f}{percentil(optimizado[clave], 0.95):>11.1f}{e50 / o50:>8.2f}x")
+    print(f"{'carga + calentamiento':<24}{eager['carga_s'] * 1000:>11.0f}{'':>11}{optimizado['carga_s'] * 1000:>11.0f}")
+
+    print("\nDeriva de scores (optimizado vs eager):")
+    for clave, valor in deriva(eager, optimizado).items():
+        print(f"  {clave:<24}{valor:.4f}")
+
+
+if __name__ == "__main__":
+    main()
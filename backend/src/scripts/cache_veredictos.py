@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Caché LRU de veredictos de moderación indexada por hash de contenido.
+
+Cada ruta recuerda su firma (tamaño, mtime) y su hash para no volver a leer
+el archivo mientras no cambie; dos rutas con el mismo contenido comparten
+veredicto. Tras una recarga de modelos sólo se aceptan veredictos de la
+generación nueva (ver nueva_generacion).
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from cola_trabajos import calcular_hash_archivo
+
+
+def firma_archivo(ruta: str):
+    estado = os.stat(ruta)
+    return (estado.st_size, estado.st_mtime_ns)
+
+
+class HashesPorRuta:
+    """Hash de contenido por ruta, reutilizado mientras la firma (tamaño, mtime) no cambie"""
+
+    def __init__(self, max_entradas: int = 2048):
+        self.max_entradas = max(1, int(max_entradas))
+        self._por_ruta = OrderedDict()  # ruta -> (firma, hash)
+        self._lock = threading.Lock()
+
+    def hash_de(self, ruta: str) -> str:
+        firma = firma_archivo(ruta)
+        with self._lock:
+            conocido = self._por_ruta.get(ruta)
+            if conocido and conocido[0] == firma:
+                self._por_ruta.move_to_end(ruta)
+                return conocido[1]
+
+        hash_contenido = calcular_hash_archivo(ruta)
+        with self._lock:
+            self._por_ruta[ruta] = (firma, hash_contenido)
+            self._por_ruta.move_to_end(ruta)
+            while len(self._por_ruta) > self.max_entradas:
+                self._por_ruta.popitem(last=False)
+        return hash_contenido
+
+    def recientes(self) -> list:
+        """Pares (ruta, hash), del más reciente al más antiguo"""
+        with self._lock:
+            return [(ruta, hash_contenido) for ruta, (_, hash_contenido) in reversed(self._por_ruta.items())]
+
+    def limpiar(self):
+        with self._lock:
+            self._por_ruta.clear()
+
+
+class CacheVeredictos:
+    """Veredictos por hash de contenido con expulsión LRU"""
+
+    def __init__(self, max_entradas: int = 2048):
+        self.max_entradas = max(1, int(max_entradas))
+        self._veredictos = OrderedDict()  # hash -> resultado
+        self._hashes = HashesPorRuta(max_entradas)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.generacion = None
+
+    def hash_de(self, ruta: str) -> str:
+        """Hash de contenido de la ruta, reutilizado mientras la firma no cambie"""
+        return self._hashes.hash_de(ruta)
+
+    def obtener(self, hash_contenido: str):
+        with self._lock:
+            resultado = self._veredictos.get(hash_contenido)
+            if resultado is None:
+                self.fallos += 1
+                return None
+            self._veredictos.move_to_end(hash_contenido)
+            self.aciertos += 1
+            return dict(resultado)
+
+    def contiene(self, hash_contenido: str) -> bool:
+        with self._lock:
+            return hash_contenido in self._veredictos
+
+    def guardar(self, hash_contenido: str, resultado: dict):
+        # No cachear errores ni veredictos degradados: el siguiente intento debe volver a analizar
+        if resultado.get("error") or resultado.get("modo_analisis", "completo") != "completo":
+            return
+        with self._lock:
+            # Una petición de la generación anterior que termina tras el intercambio no cuenta
+            generacion = resultado.get("generacion_modelo")
+            if generacion is not None and self.generacion is not None and generacion != self.generacion:
+                return
+            self._veredictos[hash_contenido] = dict(resultado)
+            self._veredictos.move_to_end(hash_contenido)
+            while len(self._veredictos) > self.max_entradas:
+                self._veredictos.popitem(last=False)
+
+    def nueva_generacion(self, generacion: int, veredictos: dict = None):
+        """Descarta los veredictos de modelos anteriores y precarga los ya recalculados"""
+        with self._lock:
+            self.generacion = generacion
+            self._veredictos.clear()
+            for hash_contenido, resultado in (veredictos or {}).items():
+                self._veredictos[hash_contenido] = dict(resultado)
+
+    def recientes(self, n: int) -> list:
+        """Hasta n pares (ruta, hash) usados más recientemente y con veredicto en caché"""
+        recientes = self._hashes.recientes()
+        with self._lock:
+            return [(ruta, h) for ruta, h in recientes if h in self._veredictos][:n]
+
+    def invalidar(self, hash_contenido: str):
+        with self._lock:
+            self._veredictos.pop(hash_contenido, None)
+
+    def descartar_veredictos(self):
+        """Descarta todos los veredictos; conserva los hashes por ruta"""
+        with self._lock:
+            self._veredictos.clear()
+
+    def limpiar(self):
+        with self._lock:
+            self._veredictos.clear()
+        self._hashes.limpiar()
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._veredictos),
+                "max_entradas": self.max_entradas,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+                "generacion": self.generacion,
+            }
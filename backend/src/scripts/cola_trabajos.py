@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Cola de trabajos de moderación persistente en SQLite para modelo_server.py.
+
+POST /jobs guarda el trabajo y responde de inmediato; workers en segundo plano
+lo procesan. Los trabajos pendientes sobreviven a un reinicio y los envíos
+duplicados (mismo contenido de imagen) reutilizan el trabajo existente; su
+callback se añade al del trabajo original. Un trabajo que interrumpe al
+proceso max_intentos veces pasa a 'error' en lugar de volver a la cola.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import urllib.request
+import uuid
+from urllib.parse import urlparse
+
+logger = logging.getLogger("COLA_TRABAJOS")
+
+ESTADO_PENDIENTE = "pendiente"
+ESTADO_PROCESANDO = "procesando"
+ESTADO_COMPLETADO = "completado"
+ESTADO_ERROR = "error"
+
+# Sólo se permiten callbacks hacia la máquina local
+HOSTS_CALLBACK_PERMITIDOS = ("localhost", "127.0.0.1", "::1")
+
+# Reclamaciones de un mismo trabajo antes de darlo por fallido (p.ej. una imagen que tumba al proceso)
+MAX_INTENTOS = int(os.environ.get("MODELO_JOBS_MAX_INTENTOS", "3"))
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id TEXT PRIMARY KEY,
+    clave_dedup TEXT NOT NULL,
+    image_path TEXT NOT NULL,
+    prioridad TEXT NOT NULL DEFAULT 'lote',
+    parametros TEXT,
+    callback_url TEXT,
+    estado TEXT NOT NULL,
+    resultado TEXT,
+    error TEXT,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    creado_en REAL NOT NULL,
+    actualizado_en REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_trabajos_estado ON trabajos (estado, creado_en);
+CREATE INDEX IF NOT EXISTS idx_trabajos_dedup ON trabajos (clave_dedup);
+CREATE TABLE IF NOT EXISTS callbacks_trabajo (
+    trabajo_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    UNIQUE (trabajo_id, url)
+);
+"""
+
+
+def calcular_hash_archivo(ruta: str) -> str:
+    """SHA-256 del contenido de un archivo, leído por bloques"""
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def callback_permitido(url: str) -> bool:
+    """Valida que la URL de callback apunte a un servicio local"""
+    try:
+        partes = urlparse(url)
+    except ValueError:
+        return False
+    return partes.scheme in ("http", "https") and partes.hostname in HOSTS_CALLBACK_PERMITIDOS
+
+
+class ColaTrabajos:
+    """Cola persistente con deduplicación y workers en segundo plano"""
+
+    def __init__(self, ruta_db: str, serializar=json.dumps, callback_por_defecto: str = None,
+                 max_intentos: int = MAX_INTENTOS):
+        self.ruta_db = ruta_db
+        self.serializar = serializar
+        self.callback_por_defecto = callback_por_defecto
+        self.max_intentos = max(1, int(max_intentos))
+        self._lock = threading.Lock()
+        self._hay_trabajo = threading.Event()
+        self._workers = []
+        self._activo = False
+
+        self._conn = sqlite3.connect(ruta_db, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(ESQUEMA)
+
+        # Recuperación tras reinicio: lo que quedó a medias vuelve a la cola, salvo
+        # lo que ya agotó sus intentos (probablemente es lo que tumbó al proceso)
+        ahora = time.time()
+        with self._lock:
+            self._agotados = [fila["id"] for fila in self._conn.execute(
+                "SELECT id FROM trabajos WHERE estado = ? AND intentos >= ?",
+                (ESTADO_PROCESANDO, self.max_intentos)
+            ).fetchall()]
+            self._conn.execute(
+                "UPDATE trabajos SET estado = ?, error = ?, actualizado_en = ? WHERE estado = ? AND intentos >= ?",
+                (ESTADO_ERROR, f"Proceso interrumpido en {self.max_intentos} intentos", ahora,
+                 ESTADO_PROCESANDO, self.max_intentos)
+            )
+            recuperados = self._conn.execute(
+                "UPDATE trabajos SET estado = ?, actualizado_en = ? WHERE estado = ?",
+                (ESTADO_PENDIENTE, ahora, ESTADO_PROCESANDO)
+            ).rowcount
+        if recuperados:
+            logger.info(f"{recuperados} trabajo(s) interrumpido(s) devuelto(s) a la cola")
+        if self._agotados:
+            logger.error(f"{len(self._agotados)} trabajo(s) interrumpido(s) {self.max_intentos} veces marcados como error")
+        if self.contar(ESTADO_PENDIENTE):
+            self._hay_trabajo.set()
+
+    def encolar(self, image_path: str, clave_dedup: str, prioridad: str = "lote",
+                parametros: dict = None, callback_url: str = None):
+        """
+        Encola un trabajo. Retorna (trabajo, es_duplicado). En un duplicado el
+        callback_url se añade al trabajo existente; si éste ya terminó, se
+        notifica de inmediato.
+        """
+        ahora = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                existente = self._conn.execute(
+                    "SELECT * FROM trabajos WHERE clave_dedup = ? AND estado != ? "
+                    "ORDER BY creado_en DESC LIMIT 1",
+                    (clave_dedup, ESTADO_ERROR)
+                ).fetchone()
+                if existente:
+                    nuevo_callback = bool(callback_url) and callback_url != existente["callback_url"] and \
+                        self._conn.execute(
+                            "INSERT OR IGNORE INTO callbacks_trabajo (trabajo_id, url) VALUES (?, ?)",
+                            (existente["id"], callback_url)
+                        ).rowcount > 0
+                    self._conn.execute("COMMIT")
+                    trabajo = self._a_dict(existente)
+                    if nuevo_callback and trabajo["estado"] == ESTADO_COMPLETADO:
+                        threading.Thread(
+                            target=self._enviar_callback, args=(trabajo, callback_url), daemon=True
+                        ).start()
+                    return trabajo, True
+
+                trabajo_id = uuid.uuid4().hex
+                self._conn.execute(
+                    "INSERT INTO trabajos (id, clave_dedup, image_path, prioridad, parametros, "
+                    "callback_url, estado, creado_en, actualizado_en) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (trabajo_id, clave_dedup, image_path, prioridad,
+                     json.dumps(parametros or {}), callback_url, ESTADO_PENDIENTE, ahora, ahora)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        self._hay_trabajo.set()
+        return self.obtener(trabajo_id), False
+
+    def obtener(self, trabajo_id: str):
+        with self._lock:
+            fila = self._conn.execute("SELECT * FROM trabajos WHERE id = ?", (trabajo_id,)).fetchone()
+        return self._a_dict(fila) if fila else None
+
+    def contar(self, estado: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM trabajos WHERE estado = ?", (estado,)
+            ).fetchone()[0]
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT estado, COUNT(*) AS total FROM trabajos GROUP BY estado"
+            ).fetchall()
+        return {fila["estado"]: fila["total"] for fila in filas}
+
+    def _reclamar(self):
+        """Marca como 'procesando' el siguiente trabajo pendiente y lo retorna"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                fila = self._conn.execute(
+                    "SELECT * FROM trabajos WHERE estado = ? ORDER BY creado_en LIMIT 1",
+                    (ESTADO_PENDIENTE,)
+                ).fetchone()
+                if fila:
+                    # intentos cuenta reclamaciones: lo consulta la recuperación tras reinicio
+                    self._conn.execute(
+                        "UPDATE trabajos SET estado = ?, intentos = intentos + 1, actualizado_en = ? "
+                        "WHERE id = ?",
+                        (ESTADO_PROCESANDO, time.time(), fila["id"])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._a_dict(fila) if fila else None
+
+    def _finalizar(self, trabajo_id: str, estado: str, resultado=None, error: str = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE trabajos SET estado = ?, resultado = ?, error = ?, actualizado_en = ? WHERE id = ?",
+                (estado, self.serializar(resultado) if resultado is not None else None,
+                 error, time.time(), trabajo_id)
+            )
+
+    def iniciar(self, ejecutar, listo=lambda: True, num_workers: int = 1):
+        """Arranca los workers. `ejecutar(trabajo)` retorna el resultado del análisis"""
+        if self._activo:
+            return
+        self._activo = True
+        for i in range(max(1, int(num_workers))):
+            worker = threading.Thread(
+                target=self._bucle_worker, args=(ejecutar, listo),
+                name=f"cola-trabajos-{i}", daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+        # Los que agotaron sus intentos en la ejecución anterior no pasarán por un worker
+        agotados, self._agotados = self._agotados, []
+        if agotados:
+            threading.Thread(
+                target=lambda: [self._notificar(trabajo_id) for trabajo_id in agotados], daemon=True
+            ).start()
+        logger.info(f"Cola de trabajos iniciada ({self.ruta_db})")
+
+    def detener(self):
+        self._activo = False
+        self._hay_trabajo.set()
+
+    def _bucle_worker(self, ejecutar, listo):
+        while self._activo:
+            # No reclamar trabajos hasta que los modelos estén cargados
+            if not listo():
+                time.sleep(1)
+                continue
+
+            trabajo = self._reclamar()
+            if trabajo is None:
+                self._hay_trabajo.clear()
+                self._hay_trabajo.wait(timeout=5)
+                continue
+
+            try:
+                resultado = ejecutar(trabajo)
+                self._finalizar(trabajo["id"], ESTADO_COMPLETADO, resultado=resultado)
+            except Exception as e:
+                logger.error(f"Error procesando trabajo {trabajo['id']}: {e}")
+                self._finalizar(trabajo["id"], ESTADO_ERROR, error=str(e))
+
+            self._notificar(trabajo["id"])
+
+    def _notificar(self, trabajo_id: str):
+        """Envía el trabajo terminado a sus callbacks (el original y los de envíos duplicados)"""
+        trabajo = self.obtener(trabajo_id)
+        if trabajo is None:
+            return
+        with self._lock:
+            adicionales = [fila["url"] for fila in self._conn.execute(
+                "SELECT url FROM callbacks_trabajo WHERE trabajo_id = ?", (trabajo_id,)
+            ).fetchall()]
+        urls = [trabajo.get("callback_url") or self.callback_por_defecto] + adicionales
+        for url in dict.fromkeys(u for u in urls if u):
+            self._enviar_callback(trabajo, url)
+
+    def _enviar_callback(self, trabajo: dict, url: str):
+        trabajo_id = trabajo["id"]
+        if not callback_permitido(url):
+            logger.warning(f"Callback no permitido (sólo local): {url}")
+            return
+        try:
+            cuerpo = self.serializar(trabajo).encode("utf-8")
+            peticion = urllib.request.Request(
+                url, data=cuerpo, headers={"Content-Type": "application/json"}, method="POST"
+            )
+            urllib.request.urlopen(peticion, timeout=5).close()
+        except Exception as e:
+            logger.warning(f"Error enviando callback de {trabajo_id} a {url}: {e}")
+
+    @staticmethod
+    def _a_dict(fila) -> dict:
+        trabajo = dict(fila)
+        trabajo["parametros"] = json.loads(trabajo["parametros"]) if trabajo.get("parametros") else {}
+        trabajo["resultado"] = json.loads(trabajo["resultado"]) if trabajo.get("resultado") else None
+        return trabajo
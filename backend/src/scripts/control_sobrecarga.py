@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Control de degradación bajo sobrecarga para modelo_server.py.
+
+Observa la espera en cola de las peticiones en vivo (media exponencial que
+decae con el tiempo) y la compara con un objetivo. Si la espera supera el
+objetivo pasa al siguiente modo más barato; si baja de objetivo * histéresis
+vuelve un nivel. Como mucho un cambio por periodo de enfriamiento.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger("CONTROL_SOBRECARGA")
+
+
+class ControladorSobrecarga:
+    def __init__(self, modos, objetivo_ms: float = 2000.0, histeresis: float = 0.5,
+                 enfriamiento_s: float = 5.0, vida_media_s: float = 10.0,
+                 suavizado: float = 0.3, activo: bool = True):
+        self.modos = tuple(modos)
+        self.objetivo = objetivo_ms / 1000.0
+        self.histeresis = histeresis
+        self.enfriamiento = enfriamiento_s
+        self.vida_media = vida_media_s
+        self.suavizado = suavizado
+        self.activo = activo
+
+        self._lock = threading.Lock()
+        self._nivel = 0
+        self._espera = 0.0
+        self._ultima_observacion = time.monotonic()
+        self._ultimo_cambio = 0.0
+        self._desde = time.monotonic()
+        self._tiempo_en_modo = {modo: 0.0 for modo in self.modos}
+        self._cambios = {}
+        self._historial = deque(maxlen=20)
+
+    def _espera_efectiva(self, ahora: float) -> float:
+        # Sin observaciones recientes la espera estimada decae hacia cero
+        transcurrido = ahora - self._ultima_observacion
+        return self._espera * 0.5 ** (transcurrido / self.vida_media)
+
+    def observar(self, espera_cola: float):
+        """Registra la espera en cola (segundos) de una petición en vivo"""
+        with self._lock:
+            ahora = time.monotonic()
+            previa = self._espera_efectiva(ahora)
+            self._espera = previa + self.suavizado * (espera_cola - previa)
+            self._ultima_observacion = ahora
+            self._evaluar(ahora)
+
+    def modo_actual(self) -> str:
+        with self._lock:
+            if self.activo:
+                self._evaluar(time.monotonic())
+            return self.modos[self._nivel]
+
+    def _evaluar(self, ahora: float):
+        if not self.activo or ahora - self._ultimo_cambio < self.enfriamiento:
+            return
+        espera = self._espera_efectiva(ahora)
+        if espera > self.objetivo and self._nivel < len(self.modos) - 1:
+            self._cambiar(self._nivel + 1, ahora, espera)
+        elif espera < self.objetivo * self.histeresis and self._nivel > 0:
+            self._cambiar(self._nivel - 1, ahora, espera)
+
+    def _cambiar(self, nivel: int, ahora: float, espera: float):
+        anterior, nuevo = self.modos[self._nivel], self.modos[nivel]
+        self._tiempo_en_modo[anterior] += ahora - self._desde
+        self._desde = ahora
+        self._nivel = nivel
+        self._ultimo_cambio = ahora
+
+        transicion = f"{anterior}->{nuevo}"
+        self._cambios[transicion] = self._cambios.get(transicion, 0) + 1
+        self._historial.append({
+            "ts": time.time(),
+            "de": anterior,
+            "a": nuevo,
+            "espera_ms": round(espera * 1000, 1),
+        })
+        nivel_log = logging.WARNING if nivel > 0 else logging.INFO
+        logger.log(nivel_log, f"Modo de análisis: {anterior} -> {nuevo} (espera {espera * 1000:.0f} ms)")
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            ahora = time.monotonic()
+            tiempo = dict(self._tiempo_en_modo)
+            tiempo[self.modos[self._nivel]] += ahora - self._desde
+            return {
+                "activo": self.activo,
+                "modo": self.modos[self._nivel],
+                "espera_estimada_ms": round(self._espera_efectiva(ahora) * 1000, 1),
+                "objetivo_ms": self.objetivo * 1000,
+                "cambios": dict(self._cambios),
+                "tiempo_en_modo_s": {modo: round(t, 1) for modo, t in tiempo.items()},
+                "historial": list(self._historial),
+            }
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Modo de ejecución optimizado de PyTorch para los backends CLIP y YOLO (opcional).
+
+Con MODERACION_TORCH_OPTIMIZADO=1 el forward de cada modelo:
+  - corre bajo torch.inference_mode (sin registro de autograd)
+  - usa autocast bf16 si la CPU lo soporta (AVX512-BF16 / AMX); las salidas
+    vuelven a float32 para que el post-proceso de los pipelines no cambie
+  - recibe y guarda tensores 4D en formato channels-last
+  - se compila con torch.compile tras el calentamiento, y se vuelve a calentar
+    para que la primera petición real no pague la compilación
+
+Variables: MODERACION_TORCH_BF16 (auto|1|0), MODERACION_TORCH_CHANNELS_LAST (1|0),
+MODERACION_TORCH_COMPILAR (1|0), MODERACION_TORCH_CALENTAMIENTO (pasadas).
+Sin el modo optimizado los backends se comportan como siempre (eager + no_grad).
+"""
+import contextlib
+import logging
+import os
+
+try:
+    import torch
+except ImportError:  # Sólo el backend sintético funciona sin torch
+    torch = None
+
+logger = logging.getLogger("EJECUCION_TORCH")
+
+
+def _bandera(nombre: str, por_defecto: str) -> str:
+    return os.environ.get(nombre, por_defecto).strip().lower()
+
+
+class OpcionesTorch:
+    def __init__(self, optimizado: bool = False, bf16: str = "auto", channels_last: bool = True,
+                 compilar: bool = True, pasadas_calentamiento: int = 2):
+        self.optimizado = optimizado
+        self.bf16 = bf16  # "auto", "1" o "0"
+        self.channels_last = channels_last
+        self.compilar = compilar
+        self.pasadas_calentamiento = max(1, int(pasadas_calentamiento))
+
+    @classmethod
+    def desde_entorno(cls):
+        return cls(
+            optimizado=_bandera('MODERACION_TORCH_OPTIMIZADO', '0') in ('1', 'true'),
+            bf16=_bandera('MODERACION_TORCH_BF16', 'auto'),
+            channels_last=_bandera('MODERACION_TORCH_CHANNELS_LAST', '1') in ('1', 'true'),
+            compilar=_bandera('MODERACION_TORCH_COMPILAR', '1') in ('1', 'true'),
+            pasadas_calentamiento=int(os.environ.get('MODERACION_TORCH_CALENTAMIENTO', '2')),
+        )
+
+    @property
+    def usar_bf16(self) -> bool:
+        if not self.optimizado or self.bf16 == "0":
+            return False
+        return self.bf16 == "1" or bf16_disponible()
+
+    def como_dict(self) -> dict:
+        return {
+            "optimizado": self.optimizado,
+            "bf16": self.usar_bf16,
+            "channels_last": self.optimizado and self.channels_last,
+            "compilar": self.optimizado and self.compilar,
+        }
+
+
+def bf16_disponible() -> bool:
+    """bf16 nativo en CPU; sin él autocast bf16 emula y suele ser más lento que float32"""
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            banderas = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in banderas or "amx_bf16" in banderas
+
+
+def contexto_inferencia(opciones: OpcionesTorch):
+    """inference_mode (+ autocast bf16) en modo optimizado; no_grad en modo eager"""
+    if not opciones.optimizado:
+        return torch.no_grad()
+    pila = contextlib.ExitStack()
+    pila.enter_context(torch.inference_mode())
+    if opciones.usar_bf16:
+        pila.enter_context(torch.autocast(device_type="cpu", dtype=torch.bfloat16))
+    return pila
+
+
+def _a_float32(salida):
+    """Devuelve en float32 los tensores de punto flotante de la salida (tensor, tupla, lista o dict)"""
+    if torch.is_tensor(salida):
+        return salida.float() if salida.is_floating_point() and salida.dtype != torch.float32 else salida
+    if isinstance(salida, dict):  # incluye ModelOutput de transformers
+        for clave, valor in list(salida.items()):
+            salida[clave] = _a_float32(valor)
+        return salida
+    if type(salida) in (tuple, list):
+        return type(salida)(_a_float32(v) for v in salida)
+    return salida
+
+
+def _channels_last(valor):
+    if torch.is_tensor(valor) and valor.dim() == 4 and valor.is_floating_point():
+        return valor.contiguous(memory_format=torch.channels_last)
+    return valor
+
+
+class ForwardOptimizado:
+    """Reemplaza module.forward: contexto de inferencia, entradas channels-last y salidas float32"""
+
+    def __init__(self, forward, opciones: OpcionesTorch):
+        self.eager = forward
+        self.forward = forward
+        self.opciones = opciones
+        self.compilado = False
+
+    def __call__(self, *args, **kwargs):
+        if self.opciones.channels_last:
+            args = tuple(_channels_last(a) for a in args)
+            kwargs = {k: _channels_last(v) for k, v in kwargs.items()}
+        with contexto_inferencia(self.opciones):
+            return _a_float32(self.forward(*args, **kwargs))
+
+
+def optimizar_modulo(modulo, opciones: OpcionesTorch):
+    """Aplica el modo optimizado a un nn.Module (en sitio). Sin efecto si no está activo."""
+    if not opciones.optimizado:
+        return modulo
+    if torch is None:
+        raise ImportError("MODERACION_TORCH_OPTIMIZADO requiere torch")
+    modulo.eval()
+    if opciones.channels_last:
+        modulo.to(memory_format=torch.channels_last)
+    modulo.forward = ForwardOptimizado(modulo.forward, opciones)
+    return modulo
+
+
+def compilar_modulo(modulo) -> bool:
+    """
+    Compila el forward de un módulo ya optimizado. Llamar después del
+    calentamiento eager; retorna False si no se pudo compilar.
+    """
+    forward = getattr(modulo, "forward", None)
+    if not isinstance(forward, ForwardOptimizado) or not forward.opciones.compilar or forward.compilado:
+        return False
+    if not hasattr(torch, "compile"):
+        logger.warning("torch.compile no disponible (torch < 2.0); se mantiene eager")
+        return False
+    try:
+        # dynamic=True: el número de etiquetas de CLIP y el imgsz de YOLO varían entre modos
+        forward.forward = torch.compile(forward.forward, dynamic=True)
+        forward.compilado = True
+        return True
+    except Exception as e:
+        logger.warning(f"No se pudo compilar {type(modulo).__name__}: {e}")
+        return False
+
+
+def revertir_compilacion(modulo):
+    """Vuelve al forward eager (torch.compile falla en la primera llamada, no al compilar)"""
+    forward = getattr(modulo, "forward", None)
+    if isinstance(forward, ForwardOptimizado) and forward.compilado:
+        forward.forward = forward.eager
+        forward.compilado = False
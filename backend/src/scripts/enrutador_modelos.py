@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Enrutador local para varias instancias de modelo_server.py.
+
+Reparte POST /analyze con hashing consistente sobre el hash de contenido de
+la imagen: una imagen repetida vuelve a la instancia que ya tiene su
+veredicto en caché, y al agregar o quitar una instancia sólo se mueve la
+fracción de claves que le corresponde. El /health de cada instancia se
+sondea periódicamente; si la instancia dueña de la clave está inicializando,
+caída o sobrecargada (cola llena o en modo degradado) se prueba la siguiente
+del anillo.
+
+Uso:
+  MODELO_PUERTO=5001 MODELO_JOBS_DB=trabajos_5001.sqlite3 python modelo_server.py
+  MODELO_PUERTO=5002 MODELO_JOBS_DB=trabajos_5002.sqlite3 python modelo_server.py
+  ENRUTADOR_INSTANCIAS=http://localhost:5001,http://localhost:5002 python enrutador_modelos.py
+
+y apuntar MODEL_SERVER_URL del backend Node al enrutador (puerto ENRUTADOR_PUERTO,
+5100 por defecto). /jobs y /admin se consultan directamente en cada instancia.
+"""
+import bisect
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlparse
+
+from flask import Flask, Response, jsonify, request
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from cache_veredictos import HashesPorRuta
+from cola_trabajos import HOSTS_CALLBACK_PERMITIDOS
+from memoria_compartida import SegmentoImagen, SegmentoNoDisponibleError
+from registro import configurar_logging_asincrono
+
+configurar_logging_asincrono([logging.StreamHandler()])
+logger = logging.getLogger("ENRUTADOR_MODELOS")
+
+app = Flask(__name__)
+
+
+class AnilloConsistente:
+    """Anillo de hashing consistente con nodos virtuales"""
+
+    def __init__(self, nodos: list, replicas: int = 128):
+        self.nodos = list(nodos)
+        self._puntos = sorted(
+            (self._hash(f"{nodo}#{i}"), nodo) for nodo in self.nodos for i in range(replicas)
+        )
+        self._claves = [punto for punto, _ in self._puntos]
+
+    @staticmethod
+    def _hash(texto: str) -> int:
+        return int.from_bytes(hashlib.md5(texto.encode("utf-8")).digest()[:8], "big")
+
+    def candidatos(self, clave: str) -> list:
+        """Nodos distintos en orden del anillo a partir de la clave (el primero es el dueño)"""
+        inicio = bisect.bisect(self._claves, self._hash(clave))
+        salida = []
+        for i in range(len(self._puntos)):
+            nodo = self._puntos[(inicio + i) % len(self._puntos)][1]
+            if nodo not in salida:
+                salida.append(nodo)
+                if len(salida) == len(self.nodos):
+                    break
+        return salida
+
+
+class Instancia:
+    """Estado de una instancia de modelo_server según su último /health"""
+
+    def __init__(self, url: str, max_carga: int = None):
+        self.url = url.rstrip("/")
+        self.max_carga_fija = max_carga
+        self.estado = "desconocida"  # lista | inicializando | caida | desconocida
+        self.workers = 1
+        self.carga_reportada = 0
+        self.modo = "completo"
+        self.espera_ms = 0.0
+        self.objetivo_ms = None
+        self.ultimo_sondeo = None
+        self.en_vuelo = 0
+        self.enviadas = 0
+        self.errores = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_carga(self) -> int:
+        return self.max_carga_fija or 4 * self.workers
+
+    @property
+    def carga(self) -> int:
+        # Las peticiones en vuelo del enrutador son una cota inferior siempre al día
+        return max(self.carga_reportada, self.en_vuelo)
+
+    def disponible(self) -> bool:
+        return self.estado == "lista"
+
+    def sobrecargada(self) -> bool:
+        if self.modo != "completo":
+            return True
+        if self.objetivo_ms and self.espera_ms > self.objetivo_ms:
+            return True
+        return self.carga >= self.max_carga
+
+    def actualizar(self, salud: dict):
+        planificador = salud.get("planificador") or {}
+        degradacion = salud.get("degradacion") or {}
+        with self._lock:
+            self.estado = "lista" if salud.get("modelos_listos") else "inicializando"
+            self.workers = planificador.get("workers", self.workers)
+            self.carga_reportada = planificador.get("en_cola_total", 0) + planificador.get("ejecutando", 0)
+            self.modo = degradacion.get("modo", "completo")
+            self.espera_ms = degradacion.get("espera_estimada_ms", 0.0)
+            self.objetivo_ms = degradacion.get("objetivo_ms")
+            self.ultimo_sondeo = time.time()
+
+    def inicio_envio(self):
+        with self._lock:
+            self.en_vuelo += 1
+            self.enviadas += 1
+
+    def fin_envio(self, error: bool = False):
+        with self._lock:
+            self.en_vuelo -= 1
+            if error:
+                self.errores += 1
+
+    def marcar_caida(self):
+        with self._lock:
+            self.estado = "caida"
+            self.ultimo_sondeo = time.time()
+
+    def como_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "estado": self.estado,
+            "carga": self.carga,
+            "max_carga": self.max_carga,
+            "sobrecargada": self.sobrecargada(),
+            "modo": self.modo,
+            "espera_estimada_ms": self.espera_ms,
+            "en_vuelo": self.en_vuelo,
+            "enviadas": self.enviadas,
+            "errores": self.errores,
+            "ultimo_sondeo": self.ultimo_sondeo,
+        }
+
+
+class Enrutador:
+    def __init__(self, urls: list, intervalo_salud: float = 1.0, timeout: float = 60.0,
+                 max_carga: int = None, replicas: int = 128):
+        for url in urls:
+            if urlparse(url).hostname not in HOSTS_CALLBACK_PERMITIDOS:
+                raise ValueError(f"Sólo se enrutan instancias locales: {url}")
+        self.instancias = {url.rstrip("/"): Instancia(url, max_carga) for url in urls}
+        self.anillo = AnilloConsistente(list(self.instancias), replicas)
+        self.hashes = HashesPorRuta()
+        self.intervalo_salud = intervalo_salud
+        self.timeout = timeout
+        self.decisiones = {"duena": 0, "desviada": 0, "forzada": 0, "sin_instancia": 0}
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    # ---- salud ----
+
+    def sondear(self, instancia: Instancia):
+        try:
+            with urllib.request.urlopen(instancia.url + "/health", timeout=min(2.0, self.intervalo_salud * 2)) as r:
+                instancia.actualizar(json.load(r))
+        except (urllib.error.URLError, OSError, ValueError):
+            if instancia.estado != "caida":
+                logger.warning(f"⚠️ Instancia sin respuesta: {instancia.url}")
+            instancia.marcar_caida()
+
+    def sondear_todas(self):
+        for instancia in self.instancias.values():
+            self.sondear(instancia)
+
+    def _bucle_salud(self):
+        while not self._detener.wait(self.intervalo_salud):
+            self.sondear_todas()
+
+    def iniciar(self):
+        self.sondear_todas()
+        self._hilo = threading.Thread(target=self._bucle_salud, name="salud-instancias", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+
+    # ---- enrutamiento ----
+
+    def elegir(self, hash_contenido: str, excluir=()):
+        """(instancia, decisión): la dueña si está lista y con margen, si no la siguiente del anillo"""
+        orden = self.anillo.candidatos(hash_contenido)
+        disponibles = [self.instancias[url] for url in orden if url not in excluir and self.instancias[url].disponible()]
+        if not disponibles:
+            return None, "sin_instancia"
+        for instancia in disponibles:
+            if not instancia.sobrecargada():
+                return instancia, "duena" if instancia.url == orden[0] else "desviada"
+        # Todas sobrecargadas: la de menor carga relativa
+        return min(disponibles, key=lambda i: i.carga / i.max_carga), "forzada"
+
+    def reenviar(self, instancia: Instancia, cuerpo: bytes, cabeceras: dict):
+        """
+        (código, cuerpo, content-type). Lanza URLError si la instancia no aceptó
+        la conexión y TimeoutError si la aceptó pero no respondió a tiempo.
+        """
+        peticion = urllib.request.Request(instancia.url + "/analyze", data=cuerpo, headers=cabeceras, method="POST")
+        instancia.inicio_envio()
+        error = False
+        try:
+            with urllib.request.urlopen(peticion, timeout=self.timeout) as r:
+                return r.status, r.read(), r.headers.get("Content-Type", "application/json")
+        except urllib.error.HTTPError as e:
+            return e.code, e.read(), e.headers.get("Content-Type", "application/json")
+        except (urllib.error.URLError, OSError):
+            error = True
+            raise
+        finally:
+            instancia.fin_envio(error)
+
+    def registrar(self, decision: str):
+        with self._lock:
+            self.decisiones[decision] += 1
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            decisiones = dict(self.decisiones)
+        return {
+            "instancias": [i.como_dict() for i in self.instancias.values()],
+            "decisiones": decisiones,
+        }
+
+
+enrutador = None
+
+
+def sin_instancia(mensaje: str):
+    return jsonify({"error": mensaje, "es_apto": False, "puntuacion_riesgo": 1.0}), 503
+
+
+@app.route('/analyze', methods=['POST'])
+def analizar():
+    cuerpo = request.get_data()
+    try:
+        data = json.loads(cuerpo or b"{}")
+    except ValueError:
+        return jsonify({"error": "JSON inválido"}), 400
+    image_path = data.get("image_path", "")
+    if data.get("segmento"):
+        # Memoria compartida: se hashea sin eliminar el segmento, que consume la instancia
+        try:
+            with SegmentoImagen(data["segmento"], data.get("longitud"), eliminar=False) as segmento:
+                hash_contenido = segmento.hash()
+        except SegmentoNoDisponibleError:
+            hash_contenido = str(data["segmento"])
+    elif not image_path:
+        return jsonify({"error": "No image_path provided"}), 400
+    elif not os.path.isabs(image_path) or not os.path.exists(image_path):
+        # Sin contenido que hashear: la instancia resuelve la ruta y responde el error
+        hash_contenido = image_path
+    else:
+        hash_contenido = enrutador.hashes.hash_de(image_path)
+
+    cabeceras = {"Content-Type": "application/json"}
+    if request.headers.get("Accept"):
+        cabeceras["Accept"] = request.headers["Accept"]
+
+    excluidas = []
+    while True:
+        instancia, decision = enrutador.elegir(hash_contenido, excluir=excluidas)
+        enrutador.registrar(decision)
+        if instancia is None:
+            return sin_instancia("Ninguna instancia de modelos disponible")
+        try:
+            codigo, respuesta, mime = enrutador.reenviar(instancia, cuerpo, cabeceras)
+        except TimeoutError:
+            # La instancia puede seguir analizando: reintentar en otra duplicaría el trabajo
+            return jsonify({
+                "error": f"Timeout esperando a {instancia.url}",
+                "es_apto": False,
+                "puntuacion_riesgo": 1.0
+            }), 504
+        except (urllib.error.URLError, OSError) as e:
+            # Sólo se reintenta si la instancia no aceptó la petición (caída, reinicio)
+            logger.warning(f"⚠️ {instancia.url} no respondió ({e}); probando la siguiente")
+            instancia.marcar_caida()
+            excluidas.append(instancia.url)
+            continue
+        if codigo == 503 and len(excluidas) + 1 < len(enrutador.instancias):
+            # Modelos no listos en esa instancia (p.ej. reinicio entre sondeos)
+            instancia.estado = "inicializando"
+            excluidas.append(instancia.url)
+            continue
+        salida = Response(respuesta, status=codigo, mimetype=mime)
+        salida.headers["X-Instancia-Modelo"] = instancia.url
+        salida.headers["X-Decision-Enrutador"] = decision
+        return salida
+
+
+@app.route('/health', methods=['GET'])
+def salud():
+    estadisticas = enrutador.estadisticas()
+    listas = sum(1 for i in estadisticas["instancias"] if i["estado"] == "lista")
+    return jsonify({
+        "status": "ready" if listas else "initializing",
+        # Compatible con ModeloClient.waitForServerReady
+        "modelos_listos": listas > 0,
+        "instancias_listas": listas,
+        **estadisticas,
+        "timestamp": time.time()
+    })
+
+
+@app.route('/', methods=['GET'])
+def inicio():
+    return jsonify({
+        "message": "🔀 Enrutador de instancias de modelos de moderación",
+        "instancias": list(enrutador.instancias),
+        "endpoints": {
+            "GET /health": "Estado agregado y carga de cada instancia",
+            "POST /analyze": "Igual que modelo_server.py; enrutado por hash de contenido"
+        }
+    })
+
+
+def main():
+    global enrutador
+    urls = [u.strip() for u in os.environ.get('ENRUTADOR_INSTANCIAS', '').split(',') if u.strip()]
+    if not urls:
+        print("❌ Define ENRUTADOR_INSTANCIAS (p.ej. http://localhost:5001,http://localhost:5002)")
+        sys.exit(1)
+
+    max_carga = os.environ.get('ENRUTADOR_MAX_CARGA')
+    enrutador = Enrutador(
+        urls,
+        intervalo_salud=float(os.environ.get('ENRUTADOR_INTERVALO_SALUD', '1.0')),
+        timeout=float(os.environ.get('ENRUTADOR_TIMEOUT', '60')),
+        max_carga=int(max_carga) if max_carga else None
+    )
+    enrutador.iniciar()
+
+    puerto = int(os.environ.get('ENRUTADOR_PUERTO', '5100'))
+    print(f"🔀 Enrutador en http://localhost:{puerto} -> {', '.join(enrutador.instancias)}")
+    app.run(host='127.0.0.1', port=puerto, threaded=True, debug=False)
+
+
+if __name__ == '__main__':
+    main()
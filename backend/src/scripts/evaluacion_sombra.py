@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Evaluación en sombra de una configuración alternativa de ImageAnalyzer.
+
+Una fracción de las peticiones en vivo ya respondidas se vuelve a analizar
+con la configuración alternativa (otro modo, otras etiquetas, otros pesos o
+ejecución torch optimizada). El análisis en sombra corre con prioridad
+'fondo' sólo cuando el planificador está inactivo y cede si llega trabajo en
+vivo; nunca toca la respuesta primaria, la caché de veredictos ni el banco de
+embeddings. La muestra guarda una copia de los bytes de la imagen (Node mueve o
+elimina el temporal, y el segmento de memoria compartida se elimina, en cuanto
+responde el primario); la cola de pendientes está acotada en número y en bytes.
+Cada par (primario, sombra) se guarda en SQLite con la coincidencia del veredicto,
+las diferencias de scores y la latencia de ambos.
+"""
+import contextlib
+import io
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from PIL import Image
+
+logger = logging.getLogger("EVALUACION_SOMBRA")
+
+# Claves de configuración que requieren modelos propios; sólo 'modo' reutiliza los primarios
+CLAVES_MODELO = ("modelo_clip", "pesos_yolo", "etiquetas_violencia", "torch")
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS evaluaciones (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    creado_en REAL NOT NULL,
+    config TEXT NOT NULL,
+    hash TEXT,
+    ruta TEXT NOT NULL,
+    generacion_modelo INTEGER,
+    apto_primario INTEGER NOT NULL,
+    apto_sombra INTEGER NOT NULL,
+    riesgo_primario REAL NOT NULL,
+    riesgo_sombra REAL NOT NULL,
+    delta_violencia REAL NOT NULL,
+    delta_armas REAL NOT NULL,
+    latencia_primaria_ms REAL,
+    latencia_sombra_ms REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_evaluaciones_config ON evaluaciones (config, creado_en);
+"""
+
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return round(ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))], 1)
+
+
+def _score_armas(resultado: dict) -> float:
+    armas = resultado.get("analisis_armas") or {}
+    return float(armas.get("confianza", 0.0)) if armas.get("armas_detectadas") else 0.0
+
+
+def _score_violencia(resultado: dict) -> float:
+    return float((resultado.get("analisis_violencia") or {}).get("probabilidad_violencia", 0.0))
+
+
+class ResultadosSombra:
+    """Almacén local (SQLite) de comparaciones primario vs sombra"""
+
+    def __init__(self, ruta_db: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(ruta_db, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(ESQUEMA)
+
+    def guardar(self, config: str, ruta: str, hash_contenido: str, primario: dict, sombra: dict,
+                latencia_primaria_ms: float, latencia_sombra_ms: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO evaluaciones (creado_en, config, hash, ruta, generacion_modelo, apto_primario, "
+                "apto_sombra, riesgo_primario, riesgo_sombra, delta_violencia, delta_armas, "
+                "latencia_primaria_ms, latencia_sombra_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    time.time(), config, hash_contenido, ruta, primario.get("generacion_modelo"),
+                    int(bool(primario.get("es_apto"))), int(bool(sombra.get("es_apto"))),
+                    float(primario.get("puntuacion_riesgo", 1.0)), float(sombra.get("puntuacion_riesgo", 1.0)),
+                    _score_violencia(sombra) - _score_violencia(primario),
+                    _score_armas(sombra) - _score_armas(primario),
+                    latencia_primaria_ms, latencia_sombra_ms
+                )
+            )
+
+    def resumen(self, config: str, ultimas: int = 1000) -> dict:
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT apto_primario, apto_sombra, riesgo_primario, riesgo_sombra, delta_violencia, "
+                "delta_armas, latencia_primaria_ms, latencia_sombra_ms FROM evaluaciones "
+                "WHERE config = ? ORDER BY id DESC LIMIT ?",
+                (config, ultimas)
+            ).fetchall()
+        if not filas:
+            return {"evaluaciones": 0}
+
+        deltas_riesgo = [abs(f[3] - f[2]) for f in filas]
+        latencia_primaria = [f[6] for f in filas if f[6] is not None]
+        latencia_sombra = [f[7] for f in filas]
+        return {
+            "evaluaciones": len(filas),
+            "coincidencia_veredicto": round(sum(f[0] == f[1] for f in filas) / len(filas), 4),
+            # Discrepancias en cada sentido: la segunda es la peligrosa (la sombra dejaría pasar)
+            "solo_sombra_rechaza": sum(f[0] and not f[1] for f in filas),
+            "solo_primario_rechaza": sum(f[1] and not f[0] for f in filas),
+            "delta_riesgo_medio": round(sum(deltas_riesgo) / len(filas), 4),
+            "delta_riesgo_max": round(max(deltas_riesgo), 4),
+            "delta_violencia_max": round(max(abs(f[4]) for f in filas), 4),
+            "delta_armas_max": round(max(abs(f[5]) for f in filas), 4),
+            "latencia_primaria_p50_ms": _percentil(latencia_primaria, 0.5),
+            "latencia_primaria_p95_ms": _percentil(latencia_primaria, 0.95),
+            "latencia_sombra_p50_ms": _percentil(latencia_sombra, 0.5),
+            "latencia_sombra_p95_ms": _percentil(latencia_sombra, 0.95),
+        }
+
+
+class EvaluadorSombra:
+    def __init__(self, planificador, resultados: ResultadosSombra, prestar_primario,
+                 tasa: float = 0.05, max_pendientes: int = 32, max_bytes_pendientes: int = 64 * 1024 * 1024):
+        """
+        prestar_primario(): context manager que entrega el ImageAnalyzer primario;
+        se usa cuando la configuración sólo cambia el modo de análisis.
+        max_pendientes / max_bytes_pendientes acotan las copias en espera; al
+        superarlos se descartan las más antiguas.
+        """
+        self.planificador = planificador
+        self.resultados = resultados
+        self.prestar_primario = prestar_primario
+        self.tasa = float(tasa)
+        self.config = None
+        self.clave_config = None
+        self._analizador = None
+        self._preparando = False
+        self._pendientes = deque()
+        self.max_pendientes = max(1, int(max_pendientes))
+        self.max_bytes_pendientes = int(max_bytes_pendientes)
+        self._bytes_pendientes = 0
+        self._hay_pendientes = threading.Event()
+        self._activo = False
+        self._hilo = None
+        self._lock = threading.Lock()
+        self.muestreadas = 0
+        self.descartadas = 0
+        self.evaluadas = 0
+        self.errores = 0
+
+    @property
+    def activo(self) -> bool:
+        return self.config is not None and not self._preparando and self.tasa > 0
+
+    def configurar(self, config: dict, construir=None, clave: str = None):
+        """
+        Cambia la configuración en sombra. Si requiere modelos propios, construir(config)
+        los carga en segundo plano; mientras tanto no se muestrea.
+        """
+        necesita_modelos = any(k in config for k in CLAVES_MODELO)
+        with self._lock:
+            self._preparando = necesita_modelos
+            self.config = dict(config)
+            self.clave_config = clave or repr(sorted(config.items()))
+            self._analizador = None
+            self._vaciar_pendientes()
+        if not necesita_modelos:
+            logger.info(f"Sombra con los modelos primarios: {config}")
+            return
+
+        def preparar():
+            try:
+                analizador = construir(config)
+            except Exception as e:
+                logger.error(f"No se pudo preparar la configuración en sombra {config}: {e}")
+                with self._lock:
+                    self.config = None
+                    self._preparando = False
+                return
+            with self._lock:
+                self._analizador = analizador
+                self._preparando = False
+            logger.info(f"Sombra lista con modelos propios: {config}")
+
+        threading.Thread(target=preparar, name="preparar-sombra", daemon=True).start()
+
+    def desactivar(self):
+        with self._lock:
+            anterior, self._analizador = self._analizador, None
+            self.config = None
+            self.clave_config = None
+            self._vaciar_pendientes()
+        if anterior is not None and hasattr(anterior, "liberar"):
+            anterior.liberar()
+
+    def muestrear(self) -> bool:
+        """
+        Decide si la petición entra en la muestra. Va antes del análisis primario
+        para copiar los bytes sólo de las muestreadas, mientras aún existen.
+        """
+        return self.activo and random.random() < self.tasa
+
+    def ofrecer(self, contenido: bytes, origen: str, hash_contenido: str, primario: dict,
+                latencia_primaria_ms: float = None):
+        """
+        Encola una muestra ya decidida con muestrear(); barato y sin bloqueo.
+        `contenido` son los bytes de la imagen, `origen` su ruta (o "memoria:<segmento>").
+        """
+        if not contenido:
+            return
+        with self._lock:
+            if self.config is None:
+                return  # desactivada después de muestrear
+            # Con la configuración del momento: puede cambiar o desactivarse antes de evaluarla
+            self._pendientes.append(
+                (contenido, origen, hash_contenido, dict(primario), latencia_primaria_ms,
+                 dict(self.config), self.clave_config)
+            )
+            self._bytes_pendientes += len(contenido)
+            self.muestreadas += 1
+            # Las más antiguas salen primero; la recién llegada siempre se queda
+            while len(self._pendientes) > 1 and (len(self._pendientes) > self.max_pendientes
+                                                 or self._bytes_pendientes > self.max_bytes_pendientes):
+                self._bytes_pendientes -= len(self._pendientes.popleft()[0])
+                self.descartadas += 1
+        self._hay_pendientes.set()
+
+    def _vaciar_pendientes(self):
+        """Con self._lock tomado"""
+        self._pendientes.clear()
+        self._bytes_pendientes = 0
+
+    def iniciar(self):
+        if self._activo:
+            return
+        self._activo = True
+        self._hilo = threading.Thread(target=self._bucle, name="evaluacion-sombra", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._activo = False
+        self._hay_pendientes.set()
+
+    @contextlib.contextmanager
+    def _prestar(self, clave_config):
+        """None si la configuración cambió o se desactivó mientras la muestra esperaba"""
+        with self._lock:
+            vigente = clave_config == self.clave_config
+            analizador = self._analizador
+        if not vigente:
+            yield None
+        elif analizador is not None:
+            yield analizador
+        else:
+            with self.prestar_primario() as primario:
+                yield primario
+
+    def _siguiente(self):
+        with self._lock:
+            if not self._pendientes:
+                self._hay_pendientes.clear()
+                return None
+            muestra = self._pendientes.popleft()
+            self._bytes_pendientes -= len(muestra[0])
+            return muestra
+
+    def _bucle(self):
+        while self._activo:
+            self._hay_pendientes.wait()
+            muestra = self._siguiente()
+            if muestra is None or not self._activo:
+                continue
+            while self._activo and not self.planificador.inactivo():
+                time.sleep(0.1)
+            self._evaluar(*muestra)
+
+    @staticmethod
+    def _decodificar(contenido: bytes, origen: str, hash_contenido: str) -> Image.Image:
+        """
+        Imagen RGB desde la copia. info["nombre"] es el que vio el primario: el
+        basename de la ruta o, desde memoria compartida, el hash de contenido.
+        """
+        imagen = Image.open(io.BytesIO(contenido))
+        imagen.load()
+        if imagen.mode != "RGB":
+            imagen = imagen.convert("RGB")
+        imagen.info["nombre"] = hash_contenido if origen.startswith("memoria:") else os.path.basename(origen)
+        return imagen
+
+    def _evaluar(self, contenido, origen, hash_contenido, primario, latencia_primaria_ms, config, clave_config):
+        def tarea():
+            # Ceder si llegó trabajo en vivo mientras esperábamos un worker
+            if self.planificador.hay_trabajo_prioritario("fondo"):
+                return None
+            with self._prestar(clave_config) as analizador:
+                if analizador is None:
+                    return None
+                # La decodificación cuenta en la latencia, como en el primario
+                inicio = time.perf_counter()
+                imagen = self._decodificar(contenido, origen, hash_contenido)
+                resultado = analizador.analyze_image(
+                    imagen, modo=config.get("modo", "completo"), preflight=False,
+                    hash_contenido=hash_contenido, usar_banco=False
+                )
+                return resultado, (time.perf_counter() - inicio) * 1000
+
+        try:
+            if clave_config != self.clave_config:
+                return  # muestra de una configuración anterior
+            salida = self.planificador.enviar(tarea, prioridad="fondo").esperar()
+            sombra, latencia_sombra_ms = salida or (None, None)
+            if sombra is None:
+                with self._lock:
+                    self.descartadas += 1
+                return
+            if sombra.get("error"):
+                raise RuntimeError(sombra["error"])
+            self.resultados.guardar(
+                clave_config, origen, hash_contenido, primario, sombra, latencia_primaria_ms, latencia_sombra_ms
+            )
+            with self._lock:
+                self.evaluadas += 1
+        except Exception as e:
+            with self._lock:
+                self.errores += 1
+            logger.warning(f"Evaluación en sombra fallida para {origen}: {e}")
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            base = {
+                "activo": self.activo,
+                "preparando": self._preparando,
+                "config": self.config,
+                "tasa": self.tasa,
+                "pendientes": len(self._pendientes),
+                "bytes_pendientes": self._bytes_pendientes,
+                "muestreadas": self.muestreadas,
+                "descartadas": self.descartadas,
+                "evaluadas": self.evaluadas,
+                "errores": self.errores,
+            }
+        if self.clave_config is not None:
+            base["resumen"] = self.resultados.resumen(self.clave_config)
+        return base
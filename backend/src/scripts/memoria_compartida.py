@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Transporte de imágenes por memoria compartida POSIX entre el backend Node y Python.
+
+El llamador deja los bytes de la imagen en un segmento (/dev/shm/<nombre>) y
+envía sólo el nombre y la longitud. Aquí el segmento se mapea y se lee con
+una memoryview: el hash se calcula sobre ella y PIL decodifica desde ella
+por bloques, sin archivo temporal en disco ni copia intermedia del buffer.
+
+Nombres: "moderacion_<pid>_<sufijo>", donde <pid> es el proceso que lo creó.
+Limpieza ante caídas:
+  - Python elimina el segmento en cuanto lo ha decodificado (toma su propiedad);
+    Node lo elimina también al recibir la respuesta (lo que llegue primero).
+  - Si Python muere con el segmento abierto, su resource_tracker lo elimina.
+  - Si Node muere antes de enviarlo, barrer_huerfanos() elimina los segmentos
+    cuyo proceso creador ya no existe o que superan la edad máxima.
+Sólo Linux (Node escribe el segmento en /dev/shm).
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+from PIL import Image
+
+logger = logging.getLogger("MEMORIA_COMPARTIDA")
+
+PREFIJO_SEGMENTO = "moderacion_"
+DIRECTORIO_SEGMENTOS = "/dev/shm"
+_NOMBRE_VALIDO = re.compile(rf"^{PREFIJO_SEGMENTO}(\d+)_[A-Za-z0-9]+$")
+
+
+class SegmentoNoDisponibleError(Exception):
+    """El segmento no existe (ya eliminado), su nombre no es válido o la longitud no cuadra"""
+
+
+def _adjuntar(nombre: str, rastrear: bool):
+    """SharedMemory existente; rastrear=False evita que el resource_tracker lo elimine al salir"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=nombre, track=rastrear)
+    segmento = shared_memory.SharedMemory(name=nombre)
+    if not rastrear:
+        resource_tracker.unregister(segmento._name, "shared_memory")
+    return segmento
+
+
+class LectorMemoria(io.RawIOBase):
+    """Archivo de sólo lectura sobre una memoryview, para Image.open sin copiar el buffer"""
+
+    def __init__(self, vista: memoryview):
+        self._vista = vista
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, desplazamiento, desde=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._vista)}[desde]
+        self._pos = max(0, base + desplazamiento)
+        return self._pos
+
+    def read(self, n=-1):
+        # bytes del bloque pedido: la misma copia que haría read() sobre un archivo
+        fin = len(self._vista) if n is None or n < 0 else min(len(self._vista), self._pos + n)
+        bloque = bytes(self._vista[self._pos:fin])
+        self._pos = max(self._pos, fin)
+        return bloque
+
+    def readinto(self, destino):
+        bloque = self._vista[self._pos:self._pos + len(destino)]
+        n = len(bloque)
+        destino[:n] = bloque
+        self._pos += n
+        return n
+
+    def close(self):
+        self._vista = memoryview(b"")
+        super().close()
+
+
+class SegmentoImagen:
+    """
+    Imagen recibida por memoria compartida. Uso:
+
+        with SegmentoImagen(nombre, longitud) as segmento:
+            verificar_imagen(segmento.lector(), limites, tamano=segmento.longitud)
+            imagen = segmento.decodificar()
+
+    Al salir (o con cerrar()) se suelta el mapeo y se elimina el segmento,
+    salvo con eliminar=False (p.ej. el enrutador, que sólo lo hashea).
+    """
+
+    def __init__(self, nombre: str, longitud: int, eliminar: bool = True):
+        if not isinstance(nombre, str) or not _NOMBRE_VALIDO.match(nombre):
+            raise SegmentoNoDisponibleError(f"Nombre de segmento no válido: {nombre!r}")
+        try:
+            longitud = int(longitud)
+        except (TypeError, ValueError):
+            raise SegmentoNoDisponibleError(f"Longitud no válida: {longitud!r}")
+        try:
+            self._segmento = _adjuntar(nombre, rastrear=eliminar)
+        except FileNotFoundError:
+            raise SegmentoNoDisponibleError(f"Segmento no encontrado: {nombre}")
+        except ValueError:  # segmento de 0 bytes: no se puede mapear
+            raise SegmentoNoDisponibleError(f"Segmento vacío: {nombre}")
+        if not 0 < longitud <= self._segmento.size:
+            self._segmento.close()
+            if eliminar:  # no es nuestro: que el resource_tracker no lo elimine al salir
+                resource_tracker.unregister(self._segmento._name, "shared_memory")
+            raise SegmentoNoDisponibleError(
+                f"Longitud {longitud} fuera del segmento {nombre} ({self._segmento.size} bytes)"
+            )
+        self.nombre = nombre
+        self.longitud = longitud
+        self.eliminar = eliminar
+        self.vista = self._segmento.buf[:longitud]
+        self._lectores = []
+        self._hash = None
+        self._lock = threading.Lock()
+
+    def lector(self) -> LectorMemoria:
+        lector = LectorMemoria(self.vista)
+        self._lectores.append(lector)
+        return lector
+
+    def hash(self) -> str:
+        """SHA-256 del contenido (mismo valor que cola_trabajos.calcular_hash_archivo)"""
+        if self._hash is None:
+            self._hash = hashlib.sha256(self.vista).hexdigest()
+        return self._hash
+
+    def decodificar(self) -> Image.Image:
+        """
+        Imagen RGB decodificada desde el segmento: la única decodificación del
+        análisis, compartida por CLIP y YOLO. info["nombre"] es el hash de contenido.
+        """
+        imagen = Image.open(self.lector())
+        imagen.load()
+        # convert() copia aun con el mismo modo: sólo si hace falta
+        if imagen.mode != "RGB":
+            imagen = imagen.convert("RGB")
+        imagen.info["nombre"] = self.hash()
+        return imagen
+
+    def cerrar(self):
+        """Idempotente: lo llama el worker tras decodificar y el handler al terminar"""
+        with self._lock:
+            self._cerrar()
+
+    def _cerrar(self):
+        if self._segmento is None:
+            return
+        for lector in self._lectores:
+            lector.close()
+        self._lectores.clear()
+        self.vista.release()
+        self._segmento.close()
+        if self.eliminar:
+            try:
+                self._segmento.unlink()
+            except FileNotFoundError:
+                # Node ya lo eliminó; unlink() no llegó a quitarlo del resource_tracker
+                resource_tracker.unregister(self._segmento._name, "shared_memory")
+        self._segmento = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+def _proceso_vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # existe, pero es de otro usuario
+    return True
+
+
+def barrer_huerfanos(max_edad_s: float = 300.0) -> int:
+    """Elimina segmentos cuyo creador murió o más viejos que max_edad_s; retorna cuántos"""
+    try:
+        nombres = os.listdir(DIRECTORIO_SEGMENTOS)
+    except OSError:
+        return 0
+    ahora = time.time()
+    eliminados = 0
+    for nombre in nombres:
+        coincidencia = _NOMBRE_VALIDO.match(nombre)
+        if not coincidencia:
+            continue
+        ruta = os.path.join(DIRECTORIO_SEGMENTOS, nombre)
+        try:
+            edad = ahora - os.stat(ruta).st_mtime
+            if _proceso_vivo(int(coincidencia.group(1))) and edad <= max_edad_s:
+                continue
+            os.unlink(ruta)
+            eliminados += 1
+        except FileNotFoundError:
+            continue
+    if eliminados:
+        logger.info(f"🧹 {eliminados} segmentos de memoria compartida huérfanos eliminados")
+    return eliminados
@@ -1,18 +1,40 @@
 #!/usr/bin/env python3
 import sys
 import json
+import contextlib
+import functools
+import hmac
 import logging
 import os
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 import threading
 import time
-import numpy as np
 
-# Configurar logging optimizado
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from planificador import (
+    CLASES_PRIORIDAD, PlanificadorAnalisis, PlazoVencidoError, parsear_plazo_ms, resolver_prioridad
 )
+from cola_trabajos import HOSTS_CALLBACK_PERMITIDOS, ColaTrabajos, calcular_hash_archivo, callback_permitido
+from cache_veredictos import CacheVeredictos
+from vigilante_uploads import VigilanteUploads
+from banco_embeddings import BancoEmbeddings
+from control_sobrecarga import ControladorSobrecarga
+from preflight_imagen import ImagenRechazadaError, LimitesImagen, verificar_imagen
+from recarga_modelos import GestorModelos
+from evaluacion_sombra import EvaluadorSombra, ResultadosSombra
+from memoria_compartida import SegmentoImagen, SegmentoNoDisponibleError, barrer_huerfanos
+from serializacion import (
+    FormatoNoDisponibleError, codificar, convertir_nativos, negociar_formato, parsear_campos, seleccionar_campos
+)
+from registro import (
+    configurar_logging_asincrono, configurar_predicciones,
+    establecer_tasa_muestreo, obtener_tasa_muestreo
+)
+
+# Configurar logging optimizado: los handlers escriben desde un hilo en segundo plano
+configurar_logging_asincrono([logging.StreamHandler()])
+configurar_predicciones(os.environ.get('MODERACION_PREDICCIONES_JSONL', 'predicciones_moderacion.jsonl'))
 logger = logging.getLogger("MODELO_SERVER")
 
 # SILENCIAR LOGS
@@ -22,24 +44,122 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 app = Flask(__name__)
 
 # Variables globales
-analizador = None
 modelos_listos = False
 inicializacion_en_curso = False
 
-class CustomJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, (np.bool_,)):
-            return bool(obj)
-        if isinstance(obj, (np.integer,)):
-            return int(obj)
-        if isinstance(obj, (np.floating,)):
-            return float(obj)
-        return super().default(obj)
+# ✅ RECARGA EN CALIENTE: generaciones de ImageAnalyzer (la actual atiende, las retiradas terminan lo suyo)
+gestor_modelos = GestorModelos()
+
+# ✅ PLANIFICADOR: peticiones interactivas antes que lotes, con plazos opcionales
+planificador = PlanificadorAnalisis(num_workers=int(os.environ.get('MODELO_WORKERS', '1')))
+
+# ✅ DEGRADACIÓN BAJO SOBRECARGA: modos más baratos cuando la espera en cola supera el objetivo
+# (los nombres de modo coinciden con analisis_imagen.MODOS_ANALISIS)
+controlador_sobrecarga = ControladorSobrecarga(
+    modos=("completo", "etiquetas_reducidas", "resolucion_reducida", "solo_yolo"),
+    objetivo_ms=float(os.environ.get('MODELO_OBJETIVO_ESPERA_MS', '2000')),
+    activo=os.environ.get('MODELO_DEGRADACION', '1') != '0'
+)
+
+def observar_espera(tarea):
+    # Sólo las clases en vivo; 'lote' y 'fondo' esperan por diseño
+    if tarea.prioridad in ('interactiva', 'normal'):
+        controlador_sobrecarga.observar(tarea.espera_cola)
+
+planificador.agregar_observador(observar_espera)
+
+class NumpyJSONProvider(DefaultJSONProvider):
+    """Flask >= 2.3 ignora app.json_encoder; jsonify usa este provider"""
+    @staticmethod
+    def default(obj):
+        convertido = convertir_nativos(obj)
+        if convertido is not obj:
+            return convertido
+        return DefaultJSONProvider.default(obj)
+
+app.json = NumpyJSONProvider(app)
+
+# ✅ COLA DE TRABAJOS ASÍNCRONOS (se crea al arrancar el servidor)
+cola_trabajos = None
+
+# ✅ CACHÉ DE VEREDICTOS por hash de contenido (la llena /analyze y el vigilante de uploads)
+cache_veredictos = CacheVeredictos(max_entradas=int(os.environ.get('MODELO_CACHE_MAX', '2048')))
+vigilante = None
+
+# ✅ BANCO DE EMBEDDINGS de imágenes moderadas (opcional: MODELO_BANCO_DIR)
+banco = None
+
+# ✅ PREFLIGHT: límites de formato, dimensiones, fotogramas y tamaño (MODELO_PREFLIGHT_*)
+limites_preflight = LimitesImagen.desde_entorno()
+
+# ✅ EVALUACIÓN EN SOMBRA de una configuración alternativa (opcional: MODELO_SOMBRA_CONFIG)
+evaluador_sombra = None
+
+def construir_analizador(config: dict, usar_banco: bool = True):
+    """
+    ImageAnalyzer cargado según la configuración de recarga (claves opcionales, ver
+    /admin/recargar). 'torch' ({optimizado, bf16, ...}) fuerza los backends reales
+    con esas OpcionesTorch. Sin usar_banco (evaluación en sombra) no consulta ni
+    alimenta el banco de embeddings.
+    """
+    from analisis_imagen import ImageAnalyzer
+    from backends_deteccion import BackendClipTransformers, BackendYoloUltralytics
+    from ejecucion_torch import OpcionesTorch
+
+    opciones_torch = OpcionesTorch(**config['torch']) if config.get('torch') else None
+    backend_violencia = backend_armas = None
+    if config.get('modelo_clip') or opciones_torch:
+        backend_violencia = BackendClipTransformers(
+            *([config['modelo_clip']] if config.get('modelo_clip') else []), opciones_torch=opciones_torch
+        )
+    if config.get('pesos_yolo') or opciones_torch:
+        backend_armas = BackendYoloUltralytics(
+            *([config['pesos_yolo']] if config.get('pesos_yolo') else []), opciones_torch=opciones_torch
+        )
+
+    nuevo = ImageAnalyzer(
+        banco=banco if usar_banco else None,
+        umbral_banco=float(os.environ.get('MODELO_BANCO_UMBRAL', '0.95')),
+        limites_preflight=limites_preflight,
+        backend_violencia=backend_violencia,
+        backend_armas=backend_armas,
+        etiquetas_violencia=config.get('etiquetas_violencia')
+    )
+    nuevo.load_models()
+    if not nuevo.cargado:
+        raise RuntimeError("No se pudieron cargar los modelos")
+    return nuevo
 
-app.json_encoder = CustomJSONEncoder
+def calentar_analizador(nuevo) -> dict:
+    """
+    Ejercita la generación nueva antes del intercambio: una imagen sintética y las
+    imágenes más recientes de la caché, cuyos veredictos recalculados la precargan.
+    Consulta el banco (los veredictos deben ser los reales) pero no lo alimenta.
+    """
+    import tempfile
+    from PIL import Image
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = os.path.join(tmp, 'calentamiento.jpg')
+        Image.new('RGB', (640, 480), (128, 128, 128)).save(ruta)
+        nuevo.analyze_image(ruta, alimentar_banco=False)
+
+    veredictos = {}
+    for ruta, hash_contenido in cache_veredictos.recientes(int(os.environ.get('MODELO_RECARGA_CALENTAR', '8'))):
+        if os.path.exists(ruta):
+            resultado = nuevo.analyze_image(ruta, alimentar_banco=False)
+            if not resultado.get('error'):
+                veredictos[hash_contenido] = resultado
+    return veredictos
+
+def al_instalar_generacion(numero: int, veredictos: dict):
+    cache_veredictos.nueva_generacion(numero, {
+        h: {**resultado, "generacion_modelo": numero} for h, resultado in (veredictos or {}).items()
+    })
+    logger.info(f"🔁 Generación {numero} activa ({len(veredictos or {})} veredictos precalculados)")
 
 def inicializar_modelos():
-    global analizador, modelos_listos, inicializacion_en_curso
+    global modelos_listos, inicializacion_en_curso
     
     if inicializacion_en_curso:
         return
@@ -63,21 +183,16 @@ def inicializar_modelos():
             return
         
         logger.info("🎯 Creando instancia de ImageAnalyzer...")
-        analizador = ImageAnalyzer()
-        
         logger.info("📦 Cargando modelos (esto puede tomar 20-30 segundos)...")
-        analizador.load_models()
+        analizador = construir_analizador({})
+        al_instalar_generacion(gestor_modelos.instalar(analizador, {}), {})
+        modelos_listos = True
         
-        modelos_listos = analizador.cargado
+        logger.info("🎉 TODOS LOS MODELOS CARGADOS CORRECTAMENTE!")
+        logger.info("🚀 Servidor listo para recibir peticiones")
         
-        if modelos_listos:
-            logger.info("🎉 TODOS LOS MODELOS CARGADOS CORRECTAMENTE!")
-            logger.info("🚀 Servidor listo para recibir peticiones")
-            
-            # ✅ DEBUG: Verificar métodos disponibles
-            logger.info(f"🔍 Métodos disponibles en ImageAnalyzer: {[method for method in dir(analizador) if not method.startswith('_')]}")
-        else:
-            logger.error("💥 ERROR: No se pudieron cargar los modelos")
+        # ✅ DEBUG: Verificar métodos disponibles
+        logger.info(f"🔍 Métodos disponibles en ImageAnalyzer: {[method for method in dir(analizador) if not method.startswith('_')]}")
             
         inicializacion_en_curso = False
         
@@ -109,7 +224,7 @@ def resolver_ruta_absoluta(image_path: str) -> str:
     
     for ruta in posibles_rutas:
         if os.path.exists(ruta):
-            logger.info(f"✅ Ruta resuelta: {ruta}")
+            logger.debug(f"✅ Ruta resuelta: {ruta}")
             return ruta
     
     # Si no se encuentra, retornar la ruta desde la raíz del proyecto
@@ -117,15 +232,343 @@ def resolver_ruta_absoluta(image_path: str) -> str:
     logger.warning(f"⚠️ Ruta no encontrada, usando: {ruta_final}")
     return ruta_final
 
+def ejecutar_analisis(image_path_absoluta, preflight: bool = True, hash_contenido: str = None) -> dict:
+    """
+    Ejecuta el análisis completo; corre dentro de un worker del planificador.
+    image_path_absoluta también puede ser una PIL.Image (memoria compartida).
+    """
+    with gestor_modelos.prestar() as generacion:
+        if not hasattr(generacion.analizador, 'analyze_image'):
+            raise AttributeError("ImageAnalyzer no tiene método analyze_image")
+        inicio = time.perf_counter()
+        resultado = generacion.analizador.analyze_image(
+            image_path_absoluta, modo=controlador_sobrecarga.modo_actual(), preflight=preflight,
+            hash_contenido=hash_contenido
+        )
+    resultado["generacion_modelo"] = generacion.numero
+    resultado["tiempo_analisis"] = time.perf_counter() - inicio
+    return resultado
+
+@contextlib.contextmanager
+def prestar_analizador():
+    """Analizador de la generación actual, para la evaluación en sombra con los modelos primarios"""
+    with gestor_modelos.prestar() as generacion:
+        yield generacion.analizador
+
+def calcular_embedding(image_path_absoluta: str):
+    with gestor_modelos.prestar() as generacion:
+        return generacion.analizador.violence_detector.embedding_imagen(image_path_absoluta)
+
+def respuesta_preflight(error: ImagenRechazadaError, image_path_absoluta: str):
+    logger.warning(f"🚫 Preflight rechazó {image_path_absoluta} ({error.codigo}): {error}")
+    return jsonify(error.como_resultado()), 422
+
+def procesar_trabajo(trabajo: dict) -> dict:
+    """Ejecuta un trabajo de la cola persistente a través del planificador"""
+    tipo_contenido = (trabajo.get("parametros") or {}).get("tipo_contenido")
+    tarea = planificador.enviar(
+        lambda: ejecutar_analisis(trabajo["image_path"]),
+        prioridad=trabajo.get("prioridad") or prioridad_trabajo(None, tipo_contenido)
+    )
+    resultado = tarea.esperar()
+    resultado["tiempo_espera_cola"] = tarea.espera_cola
+    resultado["tipo_contenido"] = tipo_contenido
+    return resultado
+
+def prioridad_trabajo(prioridad=None, tipo_contenido=None) -> str:
+    """
+    Prioridad de un trabajo asíncrono: la explícita o la de su tipo_contenido,
+    pero nunca por encima de 'normal' (nadie espera en línea un trabajo de la
+    cola); sin ninguna de las dos, 'lote'.
+    """
+    if prioridad in CLASES_PRIORIDAD:
+        return prioridad
+    if not tipo_contenido:
+        return "lote"
+    return max(resolver_prioridad(None, tipo_contenido), "normal", key=CLASES_PRIORIDAD.index)
+
+def inicializar_cola_trabajos():
+    global cola_trabajos
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    ruta_db = os.environ.get('MODELO_JOBS_DB', os.path.join(script_dir, 'trabajos_moderacion.sqlite3'))
+    cola_trabajos = ColaTrabajos(
+        ruta_db,
+        serializar=lambda obj: codificar(obj).decode('utf-8'),
+        callback_por_defecto=os.environ.get('MODELO_JOBS_CALLBACK_URL')
+    )
+    cola_trabajos.iniciar(
+        procesar_trabajo,
+        listo=lambda: modelos_listos,
+        num_workers=int(os.environ.get('MODELO_JOB_WORKERS', '1'))
+    )
+
+def inicializar_banco():
+    global banco
+    directorio = os.environ.get('MODELO_BANCO_DIR')
+    if directorio:
+        banco = BancoEmbeddings(directorio)
+
+def inicializar_vigilante():
+    """Activa la pre-moderación de uploads si MODELO_WATCH_DIR está configurado"""
+    global vigilante
+    directorio = os.environ.get('MODELO_WATCH_DIR')
+    if not directorio:
+        return
+    vigilante = VigilanteUploads(
+        directorio,
+        planificador=planificador,
+        cache=cache_veredictos,
+        analizar=ejecutar_analisis
+    )
+    # No pre-moderar hasta que haya modelos cargados
+    def arrancar_cuando_listo():
+        while not modelos_listos:
+            time.sleep(1)
+        vigilante.iniciar()
+    threading.Thread(target=arrancar_cuando_listo, daemon=True).start()
+
+def configurar_sombra(config: dict):
+    """Modos y etiquetas/pesos/torch alternativos; nunca usa el banco ni la caché de veredictos"""
+    evaluador_sombra.desactivar()
+    evaluador_sombra.configurar(
+        config,
+        construir=lambda c: construir_analizador(c, usar_banco=False),
+        clave=json.dumps(config, sort_keys=True)
+    )
+
+def inicializar_sombra():
+    """Activa la evaluación en sombra si MODELO_SOMBRA_CONFIG está configurado (JSON)"""
+    global evaluador_sombra
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    evaluador_sombra = EvaluadorSombra(
+        planificador,
+        ResultadosSombra(os.environ.get('MODELO_SOMBRA_DB', os.path.join(script_dir, 'evaluacion_sombra.sqlite3'))),
+        prestar_primario=prestar_analizador,
+        tasa=float(os.environ.get('MODELO_SOMBRA_TASA', '0.05')),
+        max_pendientes=int(os.environ.get('MODELO_SOMBRA_MAX_PENDIENTES', '32')),
+        max_bytes_pendientes=int(os.environ.get('MODELO_SOMBRA_MAX_BYTES', str(64 * 1024 * 1024)))
+    )
+    evaluador_sombra.iniciar()
+    config = os.environ.get('MODELO_SOMBRA_CONFIG')
+    if not config:
+        return
+    # Los modelos propios de la sombra se cargan después de los primarios
+    def arrancar_cuando_listo():
+        while not modelos_listos:
+            time.sleep(1)
+        configurar_sombra(json.loads(config))
+    threading.Thread(target=arrancar_cuando_listo, daemon=True).start()
+
+def muestrear_sombra() -> bool:
+    """Decisión de muestreo antes del análisis primario, para copiar la imagen mientras existe"""
+    return evaluador_sombra is not None and evaluador_sombra.muestrear()
+
+def leer_bytes(ruta: str) -> bytes:
+    with open(ruta, 'rb') as f:
+        return f.read()
+
+def ofrecer_a_sombra(origen: str, hash_contenido: str, resultado: dict, contenido_sombra):
+    """
+    Entrega a la sombra una petición ya muestreada; nunca afecta a la respuesta.
+    contenido_sombra() devuelve la copia de los bytes de la imagen (o None).
+    """
+    # En modo degradado el primario no es comparable y no hay capacidad de sobra;
+    # un rechazo por banco tampoco (la sombra no consulta el banco)
+    if resultado.get('error') or resultado.get('coincidencia_banco') \
+            or resultado.get('modo_analisis', 'completo') != 'completo':
+        return
+    try:
+        tiempo = resultado.get('tiempo_analisis')
+        evaluador_sombra.ofrecer(contenido_sombra(), origen, hash_contenido, resultado,
+                                 tiempo * 1000 if tiempo is not None else None)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo muestrear para la sombra: {e}")
+
+def inicializar_barrido_segmentos():
+    """Elimina periódicamente segmentos de memoria compartida de clientes caídos"""
+    intervalo = float(os.environ.get('MODELO_SHM_BARRIDO_S', '60'))
+    max_edad = float(os.environ.get('MODELO_SHM_MAX_EDAD_S', '300'))
+    def barrer():
+        while True:
+            try:
+                barrer_huerfanos(max_edad)
+            except Exception as e:
+                logger.warning(f"⚠️ Error barriendo segmentos de memoria compartida: {e}")
+            time.sleep(intervalo)
+    threading.Thread(target=barrer, name="barrido-segmentos", daemon=True).start()
+
+def solo_local(vista):
+    """
+    Rutas de administración: el servidor escucha en 0.0.0.0, así que sólo se
+    aceptan peticiones desde la máquina local (como los callbacks) o con el
+    token de MODELO_ADMIN_TOKEN en la cabecera X-Admin-Token.
+    """
+    @functools.wraps(vista)
+    def envoltura(*args, **kwargs):
+        token = os.environ.get('MODELO_ADMIN_TOKEN')
+        token_valido = bool(token) and hmac.compare_digest(
+            request.headers.get('X-Admin-Token', '').encode('utf-8'), token.encode('utf-8')
+        )
+        if request.remote_addr not in HOSTS_CALLBACK_PERMITIDOS and not token_valido:
+            logger.warning(f"🚫 {request.path} rechazado desde {request.remote_addr}")
+            return jsonify({"error": "Ruta de administración sólo accesible desde localhost"}), 403
+        return vista(*args, **kwargs)
+    return envoltura
+
+def responder_analisis(resultado: dict, data: dict, mime: str):
+    """Respuesta de /analyze con selección de campos y formato (JSON o MessagePack, ya negociado)"""
+    fields = data.get('fields', request.args.get('fields'))
+    verbose = data.get('verbose', request.args.get('verbose'))
+    return Response(codificar(seleccionar_campos(resultado, fields, verbose), mime), mimetype=mime)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({
         "status": "ready" if modelos_listos else "initializing",
         "modelos_listos": modelos_listos,
         "inicializacion_en_curso": inicializacion_en_curso,
+        "planificador": planificador.estadisticas(),
+        "degradacion": controlador_sobrecarga.estadisticas(),
+        "modelos": gestor_modelos.estadisticas(),
+        "trabajos": cola_trabajos.estadisticas() if cola_trabajos else None,
+        "cache": cache_veredictos.estadisticas(),
+        "vigilante": vigilante.estadisticas() if vigilante else None,
+        "banco": banco.estadisticas() if banco else None,
+        "limites_preflight": limites_preflight.como_dict(),
+        "sombra": evaluador_sombra.estadisticas() if evaluador_sombra else None,
         "timestamp": time.time()
     })
 
+def analizar_y_responder(data: dict, origen: str, hash_contenido: str, preflight: dict, trabajo, inicio: float,
+                         contenido_sombra=None):
+    """
+    Parte común de /analyze tras el preflight: caché, planificador, veredicto y respuesta.
+    `origen` es la ruta de la imagen (o "memoria:<segmento>"); trabajo() corre en un worker.
+    contenido_sombra: None, o si la petición se muestreó para la sombra, la función
+    que devuelve la copia de sus bytes.
+    """
+    # ✅ FORMATO Y CAMPOS: validados antes del análisis (406 / 400) para no gastar el modelo
+    try:
+        mime = negociar_formato(data.get('formato'), request.headers.get('Accept', ''))
+    except FormatoNoDisponibleError as e:
+        return jsonify({"error": str(e), "es_apto": False, "puntuacion_riesgo": 1.0}), 406
+    try:
+        parsear_campos(data.get('fields', request.args.get('fields')))
+    except ValueError as e:
+        return jsonify({"error": str(e), "es_apto": False, "puntuacion_riesgo": 1.0}), 400
+
+    # ✅ PRIORIDAD Y PLAZO: 'prioridad' explícita o derivada de 'tipo_contenido'
+    prioridad = resolver_prioridad(data.get('prioridad'), data.get('tipo_contenido'))
+    # Sin plazo (None, "" o 0) = esperar lo necesario
+    try:
+        plazo_ms = parsear_plazo_ms(data.get('plazo_ms'))
+    except ValueError as e:
+        return jsonify({
+            "error": str(e),
+            "codigo": "PLAZO_INVALIDO",
+            "es_apto": False,
+            "puntuacion_riesgo": 1.0
+        }), 400
+
+    # ✅ CACHÉ: imagen ya moderada (p.ej. pre-moderada por el vigilante de uploads)
+    usar_cache = data.get('usar_cache', True) is not False
+    resultado = cache_veredictos.obtener(hash_contenido) if usar_cache else None
+    if resultado is not None:
+        resultado["desde_cache"] = True
+        resultado["tiempo_procesamiento"] = time.time() - inicio
+        resultado["tiempo_preflight"] = preflight["tiempo_preflight"]
+        resultado["prioridad"] = prioridad
+        resultado["ruta_imagen"] = origen
+        logger.debug(f"⚡ Veredicto desde caché: {origen}")
+        return responder_analisis(resultado, data, mime)
+
+    logger.debug(f"✅ Imagen encontrada, encolando ({prioridad}): {origen}")
+    
+    tarea = planificador.enviar(
+        trabajo,
+        prioridad=prioridad,
+        plazo_ms=plazo_ms
+    )
+    try:
+        resultado = tarea.esperar()
+    except PlazoVencidoError:
+        logger.warning(f"⏰ Plazo vencido antes del análisis ({prioridad}): {origen}")
+        return jsonify({
+            "error": "Plazo vencido antes del análisis",
+            "codigo": "PLAZO_VENCIDO",
+            "prioridad": prioridad,
+            "es_apto": False,
+            "puntuacion_riesgo": 1.0
+        }), 504
+    
+    cache_veredictos.guardar(hash_contenido, resultado)
+    duracion = time.time() - inicio
+    
+    resultado["tiempo_procesamiento"] = duracion
+    resultado["tiempo_espera_cola"] = tarea.espera_cola
+    resultado["tiempo_preflight"] = preflight["tiempo_preflight"]
+    resultado["prioridad"] = prioridad
+    resultado["ruta_imagen"] = origen  # Para debugging
+    if contenido_sombra is not None:
+        ofrecer_a_sombra(origen, hash_contenido, resultado, contenido_sombra)
+    
+    # analyze_image ya emite la línea INFO del análisis; aquí sólo en DEBUG y con argumentos perezosos
+    logger.debug("✅ Análisis completado en %.2fs - Resultado: %s", duracion,
+                 '✅ APTO' if resultado.get('es_apto') else '❌ NO APTO')
+    
+    # DEBUG: Mostrar detalles del análisis
+    if resultado.get('es_apto'):
+        logger.debug("📊 Imagen APROBADA - Riesgo: %.3f", resultado.get('puntuacion_riesgo', 0))
+    else:
+        logger.warning(f"📊 Imagen RECHAZADA - Razones:")
+        if resultado.get('analisis_violencia', {}).get('es_violento'):
+            logger.warning(f"   - Violencia: {resultado['analisis_violencia']['probabilidad_violencia']:.3f}")
+        if resultado.get('analisis_armas', {}).get('armas_detectadas'):
+            logger.warning(f"   - Armas: {resultado['analisis_armas']['confianza']:.3f}")
+    
+    return responder_analisis(resultado, data, mime)
+
+def analizar_segmento(data: dict):
+    """
+    /analyze por memoria compartida ({segmento, longitud}): preflight y hash sobre la
+    memoryview del segmento, una sola decodificación en el worker, y el segmento se
+    elimina en cuanto está decodificado (ver memoria_compartida.py).
+    """
+    inicio = time.time()
+    try:
+        segmento = SegmentoImagen(data['segmento'], data.get('longitud'))
+    except SegmentoNoDisponibleError as e:
+        logger.error(f"❌ {e}")
+        return jsonify({
+            "error": str(e),
+            "codigo": "SEGMENTO_NO_DISPONIBLE",
+            "es_apto": False,
+            "puntuacion_riesgo": 1.0
+        }), 404
+
+    with segmento:
+        origen = f"memoria:{segmento.nombre}"
+        try:
+            preflight = verificar_imagen(segmento.lector(), limites_preflight, tamano=segmento.longitud)
+        except ImagenRechazadaError as e:
+            return respuesta_preflight(e, origen)
+        hash_contenido = segmento.hash()
+        # Muestreada para la sombra: copia antes de que el worker elimine el segmento
+        copia_sombra = [] if muestrear_sombra() else None
+
+        def trabajo():
+            if copia_sombra is not None:
+                copia_sombra.append(bytes(segmento.vista))
+            imagen = segmento.decodificar()
+            segmento.cerrar()
+            return ejecutar_analisis(imagen, preflight=False, hash_contenido=hash_contenido)
+
+        return analizar_y_responder(
+            data, origen, hash_contenido, preflight, trabajo, inicio,
+            contenido_sombra=(lambda: copia_sombra[0] if copia_sombra else None)
+            if copia_sombra is not None else None
+        )
+
 @app.route('/analyze', methods=['POST'])
 def analyze_image():
     if not modelos_listos:
@@ -139,6 +582,10 @@ def analyze_image():
         data = request.get_json()
         if not data:
             return jsonify({"error": "No JSON data"}), 400
+
+        # ✅ MEMORIA COMPARTIDA: {segmento, longitud} en lugar de image_path
+        if data.get('segmento'):
+            return analizar_segmento(data)
             
         image_path = data.get('image_path', '')
         
@@ -148,8 +595,8 @@ def analyze_image():
         # ✅ RESOLVER RUTA ABSOLUTA
         image_path_absoluta = resolver_ruta_absoluta(image_path)
         
-        logger.info(f"🔍 Buscando imagen: {image_path}")
-        logger.info(f"📁 Ruta absoluta: {image_path_absoluta}")
+        logger.debug(f"🔍 Buscando imagen: {image_path}")
+        logger.debug(f"📁 Ruta absoluta: {image_path_absoluta}")
         
         if not os.path.exists(image_path_absoluta):
             logger.error(f"❌ Archivo no encontrado: {image_path_absoluta}")
@@ -162,36 +609,20 @@ def analyze_image():
                 "puntuacion_riesgo": 1.0
             }), 404
 
-        logger.info(f"✅ Imagen encontrada, analizando: {image_path_absoluta}")
         inicio = time.time()
-        
-        # ✅ CORREGIDO: Usar analyze_image (con 'z') en lugar de analyze_image (con 's')
-        if hasattr(analizador, 'analyze_image'):
-            resultado = analizador.analyze_image(image_path_absoluta)
-        elif hasattr(analizador, 'analyze_image'):
-            # Fallback por si acaso
-            resultado = analizador.analyze_image(image_path_absoluta)
-        else:
-            raise AttributeError("ImageAnalyzer no tiene método analyze_image ni analyze_image")
-        
-        duracion = time.time() - inicio
-        
-        resultado["tiempo_procesamiento"] = duracion
-        resultado["ruta_imagen"] = image_path_absoluta  # Para debugging
-        
-        logger.info(f"✅ Análisis completado en {duracion:.2f}s - Resultado: {'✅ APTO' if resultado.get('es_apto') else '❌ NO APTO'}")
-        
-        # DEBUG: Mostrar detalles del análisis
-        if resultado.get('es_apto'):
-            logger.info(f"📊 Imagen APROBADA - Riesgo: {resultado.get('puntuacion_riesgo', 0):.3f}")
-        else:
-            logger.warning(f"📊 Imagen RECHAZADA - Razones:")
-            if resultado.get('analisis_violencia', {}).get('es_violento'):
-                logger.warning(f"   - Violencia: {resultado['analisis_violencia']['probabilidad_violencia']:.3f}")
-            if resultado.get('analisis_armas', {}).get('armas_detectadas'):
-                logger.warning(f"   - Armas: {resultado['analisis_armas']['confianza']:.3f}")
-        
-        return jsonify(resultado)
+
+        # ✅ PREFLIGHT: sólo cabecera, antes de hashear, encolar o decodificar
+        try:
+            preflight = verificar_imagen(image_path_absoluta, limites_preflight)
+        except ImagenRechazadaError as e:
+            return respuesta_preflight(e, image_path_absoluta)
+
+        return analizar_y_responder(
+            data, image_path_absoluta, cache_veredictos.hash_de(image_path_absoluta), preflight,
+            lambda: ejecutar_analisis(image_path_absoluta, preflight=False), inicio,
+            # Node mueve o elimina el temporal en cuanto responde: se copia antes de responder
+            contenido_sombra=(lambda: leer_bytes(image_path_absoluta)) if muestrear_sombra() else None
+        )
         
     except Exception as e:
         logger.error(f"❌ Error en análisis: {e}")
@@ -203,9 +634,209 @@ def analyze_image():
             "puntuacion_riesgo": 1.0
         }), 500
 
+@app.route('/jobs', methods=['POST'])
+def crear_trabajo():
+    """Encola un análisis y retorna el id del trabajo sin esperar al modelo"""
+    if cola_trabajos is None:
+        return jsonify({"error": "Cola de trabajos no disponible"}), 503
+
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "No JSON data"}), 400
+
+    image_path = data.get('image_path', '')
+    if not image_path:
+        return jsonify({"error": "No image_path provided"}), 400
+
+    image_path_absoluta = resolver_ruta_absoluta(image_path)
+    if not os.path.exists(image_path_absoluta):
+        return jsonify({
+            "error": f"Archivo no encontrado: {image_path_absoluta}",
+            "ruta_solicitada": image_path
+        }), 404
+
+    # Rechazar ahora lo que el preflight del worker rechazaría de todos modos
+    try:
+        verificar_imagen(image_path_absoluta, limites_preflight)
+    except ImagenRechazadaError as e:
+        return respuesta_preflight(e, image_path_absoluta)
+
+    callback_url = data.get('callback_url')
+    if callback_url and not callback_permitido(callback_url):
+        return jsonify({"error": "callback_url debe apuntar a localhost"}), 400
+
+    prioridad = prioridad_trabajo(data.get('prioridad'), data.get('tipo_contenido'))
+    trabajo, duplicado = cola_trabajos.encolar(
+        image_path_absoluta,
+        clave_dedup=calcular_hash_archivo(image_path_absoluta),
+        prioridad=prioridad,
+        parametros={"tipo_contenido": data.get('tipo_contenido')},
+        callback_url=callback_url
+    )
+
+    logger.info(f"📥 Trabajo {'duplicado' if duplicado else 'encolado'}: {trabajo['id']} ({prioridad})")
+    return jsonify({
+        "job_id": trabajo["id"],
+        "estado": trabajo["estado"],
+        "duplicado": duplicado
+    }), 200 if duplicado else 202
+
+@app.route('/jobs/<trabajo_id>', methods=['GET'])
+def consultar_trabajo(trabajo_id):
+    if cola_trabajos is None:
+        return jsonify({"error": "Cola de trabajos no disponible"}), 503
+
+    trabajo = cola_trabajos.obtener(trabajo_id)
+    if trabajo is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+
+    return jsonify({
+        "job_id": trabajo["id"],
+        "estado": trabajo["estado"],
+        "prioridad": trabajo["prioridad"],
+        "resultado": trabajo["resultado"],
+        "error": trabajo["error"],
+        "intentos": trabajo["intentos"],
+        "creado_en": trabajo["creado_en"],
+        "actualizado_en": trabajo["actualizado_en"]
+    })
+
+@app.route('/banco/rechazar', methods=['POST'])
+@solo_local
+def rechazar_en_banco():
+    """Marca una imagen como rechazada a mano; las subidas similares se rechazan sin scoring completo"""
+    if banco is None:
+        return jsonify({"error": "Banco de embeddings no configurado (MODELO_BANCO_DIR)"}), 503
+    if not modelos_listos:
+        return jsonify({"error": "Modelos no listos"}), 503
+
+    data = request.get_json(silent=True) or {}
+    image_path = data.get('image_path', '')
+    if not image_path:
+        return jsonify({"error": "No image_path provided"}), 400
+
+    image_path_absoluta = resolver_ruta_absoluta(image_path)
+    if not os.path.exists(image_path_absoluta):
+        return jsonify({"error": f"Archivo no encontrado: {image_path_absoluta}"}), 404
+
+    hash_contenido = cache_veredictos.hash_de(image_path_absoluta)
+    filas = banco.filas_de_hash(hash_contenido)
+    if filas:
+        banco.marcar_rechazada(filas)
+    else:
+        tarea = planificador.enviar(
+            lambda: calcular_embedding(image_path_absoluta),
+            prioridad='normal'
+        )
+        filas = [banco.agregar(
+            tarea.esperar(),
+            {"hash": hash_contenido, "ruta": image_path_absoluta, "es_apto": False, "manual": True},
+            rechazada=True
+        )]
+
+    # Ningún veredicto cacheado se comparó con este rechazo (tampoco los de imágenes
+    # casi idénticas): se descartan todos. Los rechazos manuales son raros.
+    cache_veredictos.descartar_veredictos()
+    logger.info(f"🚫 Imagen marcada como rechazada en el banco: {image_path_absoluta}")
+    return jsonify({"filas": filas, "hash": hash_contenido, "banco": banco.estadisticas()})
+
+@app.route('/admin/logging', methods=['GET', 'POST'])
+@solo_local
+def control_logging():
+    """Consulta o ajusta en caliente el nivel de log y el muestreo de predicciones"""
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            if 'tasa_muestreo' in data:
+                establecer_tasa_muestreo(data['tasa_muestreo'])
+            if 'nivel' in data:
+                nivel = logging.getLevelName(str(data['nivel']).upper())
+                if not isinstance(nivel, int):
+                    return jsonify({"error": f"Nivel de log inválido: {data['nivel']}"}), 400
+                logging.getLogger().setLevel(nivel)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        logger.info(f"🔧 Logging actualizado: {data}")
+
+    return jsonify({
+        "tasa_muestreo": obtener_tasa_muestreo(),
+        "nivel": logging.getLevelName(logging.getLogger().level)
+    })
+
+@app.route('/admin/recargar', methods=['GET', 'POST'])
+@solo_local
+def recargar_modelos():
+    """
+    Recarga en caliente: construye y calienta un ImageAnalyzer nuevo mientras el
+    actual sigue atendiendo, y los intercambia al terminar. Las claves omitidas
+    conservan la configuración actual; con null vuelven a la de por defecto.
+    JSON: {modelo_clip?, pesos_yolo?, etiquetas_violencia?: [..], torch?: {optimizado, bf16, ...}}
+    """
+    if request.method == 'GET':
+        return jsonify(gestor_modelos.estadisticas())
+
+    if not modelos_listos:
+        return jsonify({"error": "Modelos no listos: la carga inicial sigue en curso"}), 503
+
+    data = request.get_json(silent=True) or {}
+    config = {**gestor_modelos.config, **{
+        clave: data[clave] for clave in ('modelo_clip', 'pesos_yolo', 'etiquetas_violencia', 'torch') if clave in data
+    }}
+    config = {clave: valor for clave, valor in config.items() if valor is not None}
+    etiquetas = config.get('etiquetas_violencia')
+    if etiquetas is not None and (not isinstance(etiquetas, list) or not all(isinstance(e, str) for e in etiquetas)):
+        return jsonify({"error": "etiquetas_violencia debe ser una lista de strings"}), 400
+    # Los embeddings del banco sólo son comparables con el mismo CLIP
+    if banco is not None and config.get('modelo_clip') != gestor_modelos.config.get('modelo_clip'):
+        return jsonify({"error": "Con banco de embeddings no se puede cambiar modelo_clip en caliente"}), 400
+
+    if not gestor_modelos.recargar(config, construir_analizador, calentar_analizador, al_instalar_generacion):
+        return jsonify({"error": "Ya hay una recarga en curso", **gestor_modelos.estadisticas()}), 409
+
+    logger.info(f"🔄 Recarga en caliente solicitada: {config}")
+    return jsonify(gestor_modelos.estadisticas()), 202
+
+@app.route('/admin/sombra', methods=['GET', 'POST'])
+@solo_local
+def control_sombra():
+    """
+    Evaluación en sombra: resumen de coincidencia, deltas y latencias, y cambio de
+    configuración o tasa de muestreo. 'config' null desactiva la sombra.
+    JSON: {config?: {modo?, modelo_clip?, pesos_yolo?, etiquetas_violencia?, torch?} | null, tasa?}
+    """
+    from analisis_imagen import MODOS_ANALISIS
+
+    if evaluador_sombra is None:
+        return jsonify({"error": "Evaluación en sombra no inicializada"}), 503
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        if 'tasa' in data:
+            try:
+                tasa = float(data['tasa'])
+            except (TypeError, ValueError):
+                return jsonify({"error": "tasa debe ser un número entre 0 y 1"}), 400
+            if not 0.0 <= tasa <= 1.0:
+                return jsonify({"error": "tasa debe ser un número entre 0 y 1"}), 400
+            evaluador_sombra.tasa = tasa
+        if 'config' in data:
+            config = data['config']
+            if config is None:
+                evaluador_sombra.desactivar()
+            elif not isinstance(config, dict):
+                return jsonify({"error": "config debe ser un objeto o null"}), 400
+            elif config.get('modo', 'completo') not in MODOS_ANALISIS:
+                return jsonify({"error": f"modo debe ser uno de {list(MODOS_ANALISIS)}"}), 400
+            elif not modelos_listos:
+                return jsonify({"error": "Modelos no listos: la carga inicial sigue en curso"}), 503
+            else:
+                configurar_sombra(config)
+                logger.info(f"🌗 Evaluación en sombra configurada: {config} (tasa {evaluador_sombra.tasa})")
+    return jsonify(evaluador_sombra.estadisticas())
+
 @app.route('/debug-methods', methods=['GET'])
 def debug_methods():
     """Endpoint para debugging de métodos disponibles"""
+    analizador = gestor_modelos.analizador_actual()
     if analizador:
         methods = [method for method in dir(analizador) if not method.startswith('_')]
         return jsonify({
@@ -241,7 +872,13 @@ def home():
         "modelos_cargados": modelos_listos,
         "endpoints": {
             "GET /health": "Estado del servidor y modelos",
-            "POST /analyze": "Analizar imagen (JSON: {image_path: 'ruta'})",
+            "POST /jobs": "Encolar análisis asíncrono (JSON: {image_path, tipo_contenido?, prioridad?, callback_url?})",
+            "GET /jobs/<id>": "Consultar estado y resultado de un trabajo",
+            "POST /banco/rechazar": "Marcar imagen como rechazada a mano (JSON: {image_path})",
+            "GET|POST /admin/logging": "Nivel de log y muestreo de predicciones (JSON: {nivel?, tasa_muestreo?})",
+            "GET|POST /admin/recargar": "Recarga de modelos sin cortar el servicio (JSON: {modelo_clip?, pesos_yolo?, etiquetas_violencia?})",
+            "GET|POST /admin/sombra": "Evaluación en sombra de otra configuración (JSON: {config?: {modo?, modelo_clip?, pesos_yolo?, etiquetas_violencia?, torch?} | null, tasa?})",
+            "POST /analyze": "Analizar imagen (JSON: {image_path: 'ruta' | segmento + longitud (memoria compartida), tipo_contenido?, prioridad?, plazo_ms?, fields?, verbose?, formato?: 'json'|'msgpack', usar_cache?})",
             "GET /debug-paths": "Debugging de rutas",
             "GET /debug-methods": "Debugging de métodos"
         }
@@ -258,22 +895,33 @@ print("⏰ Hora de inicio:", time.strftime("%Y-%m-%d %H:%M:%S"))
 print("=" * 60)
 
 if __name__ == '__main__':
+    planificador.iniciar()
+    inicializar_banco()
+    inicializar_cola_trabajos()
+    inicializar_vigilante()
+    inicializar_sombra()
+    inicializar_barrido_segmentos()
+
     # Inicializar modelos inmediatamente en segundo plano
     logger.info("🎯 Inicializando modelos en segundo plano...")
     thread = threading.Thread(target=inicializar_modelos, daemon=True)
     thread.start()
     
-    print("🌐 Servidor API iniciando en http://localhost:5000")
+    # MODELO_PUERTO permite varias instancias detrás de enrutador_modelos.py
+    puerto = int(os.environ.get('MODELO_PUERTO', '5000'))
+    print(f"🌐 Servidor API iniciando en http://localhost:{puerto}")
     print("💡 Los modelos se cargarán en segundo plano (20-30 segundos)")
-    print("📊 Verifica el estado en: http://localhost:5000/health")
-    print("🐛 Debug de rutas en: http://localhost:5000/debug-paths")
-    print("🐛 Debug de métodos en: http://localhost:5000/debug-methods")
+    print(f"📊 Verifica el estado en: http://localhost:{puerto}/health")
+    print(f"🐛 Debug de rutas en: http://localhost:{puerto}/debug-paths")
+    print(f"🐛 Debug de métodos en: http://localhost:{puerto}/debug-methods")
+    if vigilante:
+        print(f"👀 Pre-moderando imágenes nuevas en: {vigilante.directorio}")
     print("⏹️  Usa Ctrl+C para detener el servidor")
     
     try:
         app.run(
             host='0.0.0.0',
-            port=5000,
+            port=puerto,
             threaded=True,
             debug=False
         )
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Planificador de análisis por prioridad y plazo para modelo_server.py.
+
+Las peticiones se encolan por clase de prioridad y los workers siempre toman
+primero la clase más urgente. Las tareas cuyo plazo ya venció se descartan
+antes de llegar al modelo.
+"""
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger("PLANIFICADOR")
+
+# Clases de prioridad, de la más urgente a la menos urgente
+CLASES_PRIORIDAD = ("interactiva", "normal", "lote", "fondo")
+
+# tipoContenido (enviado por moderacionImagenService.ts) -> clase de prioridad
+PRIORIDAD_POR_TIPO = {
+    "avatar": "interactiva",
+    "publicacion": "interactiva",
+    "experiencia": "interactiva",
+    "lugar": "interactiva",
+    "pdf": "normal",
+    "general": "normal",
+    "reescaneo": "lote",
+}
+
+# Tamaño de la ventana usada para percentiles de espera
+VENTANA_METRICAS = 500
+
+
+class PlazoVencidoError(Exception):
+    """La tarea no llegó al modelo antes de su plazo"""
+
+
+def parsear_plazo_ms(valor):
+    """
+    Plazo en milisegundos de una petición. None, "" o 0 = sin plazo (None);
+    cualquier otro valor debe ser un número positivo y finito (ValueError si no).
+    """
+    # bool es subclase de int: true no es "1 ms"
+    if isinstance(valor, bool):
+        raise ValueError(f"plazo_ms debe ser un número, no un booleano: {valor!r}")
+    if not valor:
+        return None
+    try:
+        plazo_ms = float(valor)
+    except (TypeError, ValueError):
+        plazo_ms = math.nan
+    if not 0 < plazo_ms < math.inf:
+        raise ValueError(f"plazo_ms debe ser un número positivo de milisegundos: {valor!r}")
+    return plazo_ms
+
+
+def resolver_prioridad(prioridad=None, tipo_contenido=None) -> str:
+    """Obtiene la clase de prioridad a partir del campo explícito o del tipo de contenido"""
+    if prioridad in CLASES_PRIORIDAD:
+        return prioridad
+    if tipo_contenido:
+        return PRIORIDAD_POR_TIPO.get(str(tipo_contenido).lower(), "normal")
+    return "normal"
+
+
+class TareaAnalisis:
+    """Unidad de trabajo encolada; el hilo de la petición espera su resultado"""
+
+    PENDIENTE = "pendiente"
+    EJECUTANDO = "ejecutando"
+    COMPLETADA = "completada"
+    EXPIRADA = "expirada"
+    CANCELADA = "cancelada"
+
+    def __init__(self, funcion, prioridad: str, plazo: float = None):
+        self.funcion = funcion
+        self.prioridad = prioridad
+        self.plazo = plazo  # time.monotonic() absoluto o None
+        self.encolada_en = time.monotonic()
+        self.espera_cola = None
+        self.estado = self.PENDIENTE
+        self.resultado = None
+        self.error = None
+        self._evento = threading.Event()
+        self._lock = threading.Lock()
+
+    def vencida(self, ahora: float = None) -> bool:
+        if self.plazo is None:
+            return False
+        return (ahora or time.monotonic()) > self.plazo
+
+    def cancelar(self) -> bool:
+        """Cancela la tarea si todavía no empezó. Retorna True si se canceló"""
+        with self._lock:
+            if self.estado != self.PENDIENTE:
+                return False
+            self.estado = self.CANCELADA
+        self._evento.set()
+        return True
+
+    def _marcar_ejecutando(self) -> bool:
+        with self._lock:
+            if self.estado != self.PENDIENTE:
+                return False
+            self.estado = self.EJECUTANDO
+            return True
+
+    def _finalizar(self, estado: str, resultado=None, error=None):
+        with self._lock:
+            self.estado = estado
+            self.resultado = resultado
+            self.error = error
+        self._evento.set()
+
+    def esperar(self, timeout: float = None):
+        """Bloquea hasta que la tarea termine y retorna su resultado"""
+        if timeout is None and self.plazo is not None:
+            # Esperar sólo hasta el plazo; si sigue en cola se cancela
+            restante = self.plazo - time.monotonic()
+            if not self._evento.wait(max(restante, 0)) and self.cancelar():
+                raise PlazoVencidoError("Plazo vencido en cola")
+        self._evento.wait(timeout)
+
+        if self.estado in (self.EXPIRADA, self.CANCELADA):
+            raise PlazoVencidoError(f"Tarea {self.estado} antes del análisis")
+        if self.error is not None:
+            raise self.error
+        return self.resultado
+
+
+class _MetricasClase:
+    def __init__(self):
+        self.encoladas = 0
+        self.completadas = 0
+        self.expiradas = 0
+        self.errores = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+        self.esperas = deque(maxlen=VENTANA_METRICAS)
+
+    def registrar_espera(self, espera: float):
+        self.espera_total += espera
+        self.espera_max = max(self.espera_max, espera)
+        self.esperas.append(espera)
+
+    def resumen(self, en_cola: int) -> dict:
+        muestras = sorted(self.esperas)
+
+        def percentil(p):
+            if not muestras:
+                return 0.0
+            return muestras[min(len(muestras) - 1, int(p * len(muestras)))]
+
+        atendidas = self.completadas + self.errores
+        return {
+            "en_cola": en_cola,
+            "encoladas": self.encoladas,
+            "completadas": self.completadas,
+            "expiradas": self.expiradas,
+            "errores": self.errores,
+            "espera_media_ms": round(self.espera_total / atendidas * 1000, 2) if atendidas else 0.0,
+            "espera_p50_ms": round(percentil(0.50) * 1000, 2),
+            "espera_p95_ms": round(percentil(0.95) * 1000, 2),
+            "espera_max_ms": round(self.espera_max * 1000, 2),
+        }
+
+
+class PlanificadorAnalisis:
+    """Cola de prioridad con workers en segundo plano"""
+
+    def __init__(self, num_workers: int = 1):
+        self.num_workers = max(1, int(num_workers))
+        self._heap = []
+        self._secuencia = itertools.count()
+        self._cond = threading.Condition()
+        self._metricas = {clase: _MetricasClase() for clase in CLASES_PRIORIDAD}
+        self._en_cola = {clase: 0 for clase in CLASES_PRIORIDAD}
+        self._ejecutando = 0
+        self._workers = []
+        self._activo = False
+        self._observadores = []
+
+    def agregar_observador(self, funcion):
+        """funcion(tarea) se llama cuando una tarea sale de la cola para ejecutarse"""
+        self._observadores.append(funcion)
+
+    def iniciar(self):
+        if self._activo:
+            return
+        self._activo = True
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._bucle_worker, name=f"planificador-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"Planificador iniciado con {self.num_workers} worker(s)")
+
+    def detener(self):
+        with self._cond:
+            self._activo = False
+            self._cond.notify_all()
+
+    def enviar(self, funcion, prioridad: str = "normal", plazo_ms: float = None) -> TareaAnalisis:
+        """Encola una función para ejecutarse según su prioridad"""
+        if prioridad not in CLASES_PRIORIDAD:
+            prioridad = "normal"
+        plazo = time.monotonic() + plazo_ms / 1000.0 if plazo_ms else None
+        tarea = TareaAnalisis(funcion, prioridad, plazo)
+
+        with self._cond:
+            heapq.heappush(
+                self._heap,
+                (CLASES_PRIORIDAD.index(prioridad), next(self._secuencia), tarea)
+            )
+            self._en_cola[prioridad] += 1
+            self._metricas[prioridad].encoladas += 1
+            self._cond.notify()
+        return tarea
+
+    def hay_trabajo_prioritario(self, clase: str = "fondo") -> bool:
+        """Indica si hay tareas más urgentes que `clase` esperando en cola"""
+        limite = CLASES_PRIORIDAD.index(clase)
+        with self._cond:
+            return any(self._en_cola[c] for c in CLASES_PRIORIDAD[:limite])
+
+    def inactivo(self) -> bool:
+        """True si no hay nada en cola ni en ejecución"""
+        with self._cond:
+            return not self._heap and self._ejecutando == 0
+
+    def _siguiente(self):
+        with self._cond:
+            while self._activo and not self._heap:
+                self._cond.wait()
+            if not self._activo:
+                return None
+            _, _, tarea = heapq.heappop(self._heap)
+            self._en_cola[tarea.prioridad] -= 1
+            return tarea
+
+    def _bucle_worker(self):
+        while True:
+            tarea = self._siguiente()
+            if tarea is None:
+                return
+
+            metricas = self._metricas[tarea.prioridad]
+            ahora = time.monotonic()
+
+            if tarea.estado == TareaAnalisis.CANCELADA or tarea.vencida(ahora):
+                # Descartar sin tocar el modelo
+                with self._cond:
+                    metricas.expiradas += 1
+                if tarea.estado != TareaAnalisis.CANCELADA:
+                    tarea._finalizar(TareaAnalisis.EXPIRADA)
+                continue
+
+            if not tarea._marcar_ejecutando():
+                continue
+
+            tarea.espera_cola = ahora - tarea.encolada_en
+            with self._cond:
+                metricas.registrar_espera(tarea.espera_cola)
+                self._ejecutando += 1
+            for observador in self._observadores:
+                try:
+                    observador(tarea)
+                except Exception as e:
+                    logger.warning(f"Error en observador del planificador: {e}")
+
+            try:
+                resultado = tarea.funcion()
+                with self._cond:
+                    metricas.completadas += 1
+                tarea._finalizar(TareaAnalisis.COMPLETADA, resultado=resultado)
+            except Exception as e:
+                logger.error(f"Error ejecutando tarea ({tarea.prioridad}): {e}")
+                with self._cond:
+                    metricas.errores += 1
+                tarea._finalizar(TareaAnalisis.COMPLETADA, error=e)
+            finally:
+                with self._cond:
+                    self._ejecutando -= 1
+
+    def estadisticas(self) -> dict:
+        with self._cond:
+            return {
+                "workers": self.num_workers,
+                "ejecutando": self._ejecutando,
+                "en_cola_total": len(self._heap),
+                "clases": {
+                    clase: self._metricas[clase].resumen(self._en_cola[clase])
+                    for clase in CLASES_PRIORIDAD
+                },
+            }
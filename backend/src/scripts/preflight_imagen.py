@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Verificación previa (preflight) de imágenes antes de cualquier trabajo de modelos.
+
+Sólo lee la cabecera: Image.open es perezoso y no decodifica píxeles hasta
+load(), así que formato, dimensiones y número de fotogramas se obtienen en
+microsegundos incluso para archivos enormes o bombas de descompresión. Una
+imagen fuera de límites se rechaza con un código específico:
+
+    ARCHIVO_VACIO, ARCHIVO_DEMASIADO_GRANDE, FORMATO_NO_RECONOCIDO,
+    CABECERA_CORRUPTA, FORMATO_NO_PERMITIDO, DIMENSIONES_INVALIDAS,
+    DIMENSIONES_EXCEDIDAS, PIXELES_EXCEDIDOS, DEMASIADOS_FOTOGRAMAS
+
+Límites configurables por entorno (ver LimitesImagen.desde_entorno).
+"""
+import os
+import time
+import warnings
+
+from PIL import Image, UnidentifiedImageError
+
+
+class ImagenRechazadaError(Exception):
+    """Imagen rechazada por el preflight; `codigo` identifica el límite violado"""
+
+    def __init__(self, codigo: str, mensaje: str, tiempo_preflight: float = 0.0):
+        super().__init__(mensaje)
+        self.codigo = codigo
+        self.tiempo_preflight = tiempo_preflight
+
+    def como_resultado(self) -> dict:
+        """Resultado de análisis equivalente (mismas claves que ImageAnalyzer.analyze_image)"""
+        return {
+            "es_apto": False,
+            "error": str(self),
+            "codigo": self.codigo,
+            "puntuacion_riesgo": 1.0,
+            "tiempo_preflight": self.tiempo_preflight
+        }
+
+
+class LimitesImagen:
+    def __init__(self, formatos=("JPEG", "PNG", "WEBP", "GIF", "BMP"), max_bytes: int = 20 * 1024 * 1024,
+                 max_lado: int = 8192, max_pixeles: int = 40_000_000, max_fotogramas: int = 100):
+        self.formatos = tuple(f.upper() for f in formatos)
+        self.max_bytes = int(max_bytes)
+        self.max_lado = int(max_lado)
+        self.max_pixeles = int(max_pixeles)
+        self.max_fotogramas = int(max_fotogramas)
+
+    @classmethod
+    def desde_entorno(cls):
+        """
+        MODELO_PREFLIGHT_FORMATOS (lista separada por comas), MODELO_PREFLIGHT_MAX_BYTES,
+        MODELO_PREFLIGHT_MAX_LADO, MODELO_PREFLIGHT_MAX_PIXELES, MODELO_PREFLIGHT_MAX_FOTOGRAMAS
+        """
+        base = cls()
+        formatos = os.environ.get('MODELO_PREFLIGHT_FORMATOS')
+        return cls(
+            formatos=[f.strip() for f in formatos.split(",") if f.strip()] if formatos else base.formatos,
+            max_bytes=int(os.environ.get('MODELO_PREFLIGHT_MAX_BYTES', base.max_bytes)),
+            max_lado=int(os.environ.get('MODELO_PREFLIGHT_MAX_LADO', base.max_lado)),
+            max_pixeles=int(os.environ.get('MODELO_PREFLIGHT_MAX_PIXELES', base.max_pixeles)),
+            max_fotogramas=int(os.environ.get('MODELO_PREFLIGHT_MAX_FOTOGRAMAS', base.max_fotogramas)),
+        )
+
+    def como_dict(self) -> dict:
+        return {
+            "formatos": list(self.formatos),
+            "max_bytes": self.max_bytes,
+            "max_lado": self.max_lado,
+            "max_pixeles": self.max_pixeles,
+            "max_fotogramas": self.max_fotogramas,
+        }
+
+
+def _leer_cabecera(ruta, limites: LimitesImagen):
+    """(formato, ancho, alto, fotogramas) sin decodificar píxeles"""
+    try:
+        with warnings.catch_warnings():
+            # El límite de píxeles lo aplicamos nosotros con un código propio
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            with Image.open(ruta) as imagen:
+                formato = (imagen.format or "").upper()
+                if formato not in limites.formatos:
+                    raise ImagenRechazadaError(
+                        "FORMATO_NO_PERMITIDO", f"Formato no permitido: {formato or 'desconocido'}"
+                    )
+                ancho, alto = imagen.size
+                # n_frames recorre sólo las cabeceras de cada fotograma (GIF/TIFF) o la lee del contenedor
+                fotogramas = getattr(imagen, "n_frames", 1) if getattr(imagen, "is_animated", False) else 1
+                return formato, ancho, alto, fotogramas
+    except Image.DecompressionBombError as e:
+        raise ImagenRechazadaError("PIXELES_EXCEDIDOS", str(e))
+    except UnidentifiedImageError:
+        raise ImagenRechazadaError("FORMATO_NO_RECONOCIDO", "No se reconoce el archivo como imagen")
+    except (OSError, SyntaxError, ValueError, EOFError) as e:
+        raise ImagenRechazadaError("CABECERA_CORRUPTA", f"Cabecera de imagen corrupta: {e}")
+
+
+def verificar_imagen(ruta, limites: LimitesImagen = None, tamano: int = None) -> dict:
+    """
+    Valida la imagen contra `limites` leyendo sólo su cabecera.
+    `ruta` también puede ser un archivo abierto (p.ej. memoria_compartida.LectorMemoria)
+    junto con su `tamano` en bytes.
+    Retorna formato, dimensiones, fotogramas, bytes y tiempo_preflight (segundos);
+    lanza ImagenRechazadaError si algún límite no se cumple.
+    """
+    limites = limites or LimitesImagen()
+    inicio = time.perf_counter()
+    try:
+        if tamano is None:
+            tamano = os.path.getsize(ruta)
+        if tamano == 0:
+            raise ImagenRechazadaError("ARCHIVO_VACIO", "El archivo está vacío")
+        if tamano > limites.max_bytes:
+            raise ImagenRechazadaError(
+                "ARCHIVO_DEMASIADO_GRANDE", f"El archivo ocupa {tamano} bytes (máximo {limites.max_bytes})"
+            )
+
+        formato, ancho, alto, fotogramas = _leer_cabecera(ruta, limites)
+
+        if ancho <= 0 or alto <= 0:
+            raise ImagenRechazadaError("DIMENSIONES_INVALIDAS", f"Dimensiones inválidas: {ancho}x{alto}")
+        if max(ancho, alto) > limites.max_lado:
+            raise ImagenRechazadaError(
+                "DIMENSIONES_EXCEDIDAS", f"Dimensiones {ancho}x{alto} superan el lado máximo {limites.max_lado}"
+            )
+        if fotogramas > limites.max_fotogramas:
+            raise ImagenRechazadaError(
+                "DEMASIADOS_FOTOGRAMAS", f"{fotogramas} fotogramas (máximo {limites.max_fotogramas})"
+            )
+        # Una animación se decodifica fotograma a fotograma: cuenta el total
+        if ancho * alto * fotogramas > limites.max_pixeles:
+            raise ImagenRechazadaError(
+                "PIXELES_EXCEDIDOS",
+                f"{ancho}x{alto}x{fotogramas} píxeles superan el máximo {limites.max_pixeles}"
+            )
+    except ImagenRechazadaError as e:
+        e.tiempo_preflight = time.perf_counter() - inicio
+        raise
+
+    return {
+        "formato": formato,
+        "ancho": ancho,
+        "alto": alto,
+        "fotogramas": fotogramas,
+        "bytes": tamano,
+        "tiempo_preflight": time.perf_counter() - inicio
+    }
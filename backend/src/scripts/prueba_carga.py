@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga de modelo_server.py (sólo contra una instancia local).
+
+Reproduce un conjunto de imágenes contra POST /analyze en niveles crecientes:
+  - lazo cerrado: N clientes concurrentes que envían una petición tras otra
+  - lazo abierto: llegadas de Poisson a una tasa fija (req/s); la latencia se
+    mide desde el instante programado, así una cola en el servidor no se oculta
+
+Por nivel registra percentiles de latencia, tasas de error y de 503, y
+throughput; marca el codo de la curva latencia/throughput (nivel con mayor
+"potencia" = throughput / latencia p50) y escribe una tabla y un JSON.
+
+El control de sobrecarga del servidor (activo por defecto) degrada el modo de
+análisis bajo carga, así que los niveles altos pueden medir análisis más
+baratos: la tabla muestra la fracción de respuestas en modo 'completo' y el
+JSON el reparto por modo_analisis. Para medir sólo análisis completos,
+arrancar el servidor con MODELO_DEGRADACION=0.
+
+Uso:
+  python prueba_carga.py --imagenes ../../uploads --concurrencias 1,2,4,8,16
+  python prueba_carga.py --imagenes ../../uploads --tasas 0.5,1,2,4 --duracion 60
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from cola_trabajos import HOSTS_CALLBACK_PERMITIDOS
+from vigilante_uploads import EXTENSIONES_IMAGEN
+
+
+def percentil(muestras, p):
+    if not muestras:
+        return None
+    ordenadas = sorted(muestras)
+    return ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))]
+
+
+class ClienteAnalisis:
+    def __init__(self, base_url: str, timeout: float, usar_cache: bool):
+        self.url = base_url.rstrip("/") + "/analyze"
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.usar_cache = usar_cache
+
+    def esperar_listo(self, max_espera: float = 120):
+        limite = time.monotonic() + max_espera
+        while time.monotonic() < limite:
+            try:
+                with urllib.request.urlopen(self.base_url + "/health", timeout=5) as r:
+                    if json.load(r).get("modelos_listos"):
+                        return True
+            except (urllib.error.URLError, OSError, ValueError):
+                pass
+            time.sleep(2)
+        return False
+
+    def analizar(self, image_path: str):
+        """Retorna (código HTTP o None si falló la conexión, latencia en segundos, modo_analisis)"""
+        cuerpo = json.dumps({
+            "image_path": image_path,
+            "fields": "es_apto,puntuacion_riesgo,modo_analisis",
+            "usar_cache": self.usar_cache,
+        }).encode("utf-8")
+        peticion = urllib.request.Request(
+            self.url, data=cuerpo, headers={"Content-Type": "application/json"}, method="POST"
+        )
+        inicio = time.perf_counter()
+        modo = None
+        try:
+            with urllib.request.urlopen(peticion, timeout=self.timeout) as r:
+                contenido = r.read()
+                codigo = r.status
+        except urllib.error.HTTPError as e:
+            codigo = e.code
+        except (urllib.error.URLError, OSError):
+            codigo = None
+        latencia = time.perf_counter() - inicio
+        if codigo == 200:
+            try:
+                modo = json.loads(contenido).get("modo_analisis")
+            except ValueError:
+                pass
+        return codigo, latencia, modo
+
+
+class Registro:
+    """Resultados de un nivel de carga"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias_ok = []
+        self.codigos = {}
+        self.modos = {}
+
+    def agregar(self, codigo, latencia, modo=None):
+        with self._lock:
+            clave = str(codigo) if codigo is not None else "conexion"
+            self.codigos[clave] = self.codigos.get(clave, 0) + 1
+            if codigo == 200:
+                self.latencias_ok.append(latencia)
+                modo = modo or "desconocido"
+                self.modos[modo] = self.modos.get(modo, 0) + 1
+
+    def resumen(self, nivel, duracion: float) -> dict:
+        total = sum(self.codigos.values())
+        ok = self.codigos.get("200", 0)
+        return {
+            "nivel": nivel,
+            "peticiones": total,
+            "throughput_rps": round(ok / duracion, 3) if duracion else 0.0,
+            "latencia_p50_ms": _ms(percentil(self.latencias_ok, 0.50)),
+            "latencia_p90_ms": _ms(percentil(self.latencias_ok, 0.90)),
+            "latencia_p99_ms": _ms(percentil(self.latencias_ok, 0.99)),
+            "tasa_error": round((total - ok) / total, 4) if total else 0.0,
+            "tasa_503": round(self.codigos.get("503", 0) / total, 4) if total else 0.0,
+            # Fracción de respuestas 200 con análisis completo (el resto, degradado por sobrecarga)
+            "fraccion_completo": round(self.modos.get("completo", 0) / ok, 4) if ok else None,
+            "codigos": dict(self.codigos),
+            "modos": dict(self.modos),
+        }
+
+
+def _ms(segundos):
+    return round(segundos * 1000, 1) if segundos is not None else None
+
+
+def nivel_cerrado(cliente, imagenes, concurrencia: int, duracion: float) -> dict:
+    registro = Registro()
+    fin = time.monotonic() + duracion
+    ciclo = itertools.cycle(imagenes)
+    lock_ciclo = threading.Lock()
+
+    def cliente_loop():
+        while time.monotonic() < fin:
+            with lock_ciclo:
+                imagen = next(ciclo)
+            registro.agregar(*cliente.analizar(imagen))
+
+    inicio = time.monotonic()
+    hilos = [threading.Thread(target=cliente_loop, daemon=True) for _ in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return registro.resumen(concurrencia, time.monotonic() - inicio)
+
+
+def nivel_abierto(cliente, imagenes, tasa: float, duracion: float, max_en_vuelo: int) -> dict:
+    registro = Registro()
+    ciclo = itertools.cycle(imagenes)
+
+    def enviar(imagen, programada):
+        codigo, _, modo = cliente.analizar(imagen)
+        # Latencia desde el instante programado (evita omisión coordinada)
+        registro.agregar(codigo, time.perf_counter() - programada, modo)
+
+    inicio = time.perf_counter()
+    siguiente = inicio
+    with ThreadPoolExecutor(max_workers=max_en_vuelo) as pool:
+        while siguiente - inicio < duracion:
+            espera = siguiente - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+            pool.submit(enviar, next(ciclo), siguiente)
+            siguiente += random.expovariate(tasa)
+    return registro.resumen(tasa, time.perf_counter() - inicio)
+
+
+def detectar_codo(niveles: list):
+    """Nivel con máxima potencia (throughput / latencia p50) entre los niveles sin errores masivos"""
+    candidatos = [n for n in niveles if n["latencia_p50_ms"] and n["tasa_error"] < 0.5]
+    if not candidatos:
+        return None
+    return max(candidatos, key=lambda n: n["throughput_rps"] / n["latencia_p50_ms"])["nivel"]
+
+
+def imprimir_tabla(modo: str, niveles: list, codo):
+    unidad = "concurrencia" if modo == "cerrado" else "tasa (rps)"
+    print(f"\n{unidad:>13}{'peticiones':>12}{'thr (rps)':>11}{'p50 (ms)':>10}"
+          f"{'p90 (ms)':>10}{'p99 (ms)':>10}{'error':>8}{'503':>8}{'completo':>10}")
+    for n in niveles:
+        marca = "  <- codo" if n["nivel"] == codo else ""
+        completo = f"{n['fraccion_completo']:.1%}" if n["fraccion_completo"] is not None else "-"
+        print(f"{n['nivel']:>13}{n['peticiones']:>12}{n['throughput_rps']:>11.2f}"
+              f"{n['latencia_p50_ms'] or 0:>10.1f}{n['latencia_p90_ms'] or 0:>10.1f}"
+              f"{n['latencia_p99_ms'] or 0:>10.1f}{n['tasa_error']:>8.1%}{n['tasa_503']:>8.1%}"
+              f"{completo:>10}{marca}")
+    degradados = [n["nivel"] for n in niveles if n["fraccion_completo"] is not None and n["fraccion_completo"] < 1.0]
+    if degradados:
+        print(f"Aviso: niveles con análisis degradados por sobrecarga: {degradados} "
+              f"(no comparables con los completos; MODELO_DEGRADACION=0 en el servidor para desactivarlo)")
+
+
+def cargar_imagenes(origen: str) -> list:
+    if os.path.isdir(origen):
+        rutas = [
+            os.path.join(raiz, nombre)
+            for raiz, _, archivos in os.walk(origen)
+            for nombre in archivos
+        ]
+    else:
+        rutas = glob.glob(origen)
+    return sorted(os.path.abspath(r) for r in rutas if r.lower().endswith(EXTENSIONES_IMAGEN))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--imagenes", required=True, help="Directorio o glob de imágenes a reproducir")
+    parser.add_argument("--concurrencias", default="1,2,4,8,16", help="Niveles de lazo cerrado")
+    parser.add_argument("--tasas", help="Niveles de lazo abierto en req/s (reemplaza --concurrencias)")
+    parser.add_argument("--duracion", type=float, default=30.0, help="Segundos por nivel")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--max-en-vuelo", type=int, default=256, help="Límite de peticiones abiertas en lazo abierto")
+    parser.add_argument("--con-cache", action="store_true", help="Permitir respuestas desde la caché de veredictos")
+    parser.add_argument("--salida", default="prueba_carga.json")
+    args = parser.parse_args()
+
+    if urlparse(args.url).hostname not in HOSTS_CALLBACK_PERMITIDOS:
+        parser.error("la prueba de carga sólo puede apuntar a una instancia local")
+
+    imagenes = cargar_imagenes(args.imagenes)
+    if not imagenes:
+        parser.error(f"no se encontraron imágenes en {args.imagenes}")
+
+    cliente = ClienteAnalisis(args.url, args.timeout, usar_cache=args.con_cache)
+    print(f"Esperando a {args.url} ...")
+    if not cliente.esperar_listo():
+        parser.error("el servidor de modelos no está listo")
+
+    modo = "abierto" if args.tasas else "cerrado"
+    niveles = []
+    for valor in (args.tasas or args.concurrencias).split(","):
+        if modo == "abierto":
+            resumen = nivel_abierto(cliente, imagenes, float(valor), args.duracion, args.max_en_vuelo)
+        else:
+            resumen = nivel_cerrado(cliente, imagenes, int(valor), args.duracion)
+        niveles.append(resumen)
+        print(f"nivel {valor}: {resumen['throughput_rps']} rps, p50 {resumen['latencia_p50_ms']} ms")
+
+    codo = detectar_codo(niveles)
+    imprimir_tabla(modo, niveles, codo)
+
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump({
+            "url": args.url,
+            "modo": modo,
+            "imagenes": len(imagenes),
+            "duracion_por_nivel_s": args.duracion,
+            "usar_cache": args.con_cache,
+            "codo": codo,
+            "niveles": niveles,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\nCodo de la curva: {codo}  |  resultados en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
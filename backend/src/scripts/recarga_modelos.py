@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Recarga en caliente de ImageAnalyzer para modelo_server.py.
+
+Cada instancia cargada es una "generación". Las peticiones toman prestada la
+generación actual (prestar()) y la devuelven al terminar; una recarga
+construye, carga y calienta la nueva generación en un hilo aparte mientras
+la actual sigue atendiendo, y luego la instala con un intercambio atómico.
+La generación anterior se libera cuando termina su última petición en vuelo.
+"""
+import contextlib
+import gc
+import logging
+import threading
+import time
+import traceback
+
+logger = logging.getLogger("RECARGA_MODELOS")
+
+
+class Generacion:
+    def __init__(self, numero: int, analizador, config: dict):
+        self.numero = numero
+        self.analizador = analizador
+        self.config = dict(config)
+        self.en_vuelo = 0
+        self.atendidas = 0
+        self.desde = time.time()
+
+    def como_dict(self) -> dict:
+        return {
+            "numero": self.numero,
+            "config": self.config,
+            "en_vuelo": self.en_vuelo,
+            "atendidas": self.atendidas,
+            "desde": self.desde,
+        }
+
+
+class GestorModelos:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._actual = None
+        self._ultimo_numero = 0
+        self._retiradas = {}  # numero -> Generacion con peticiones en vuelo
+        self._hilo_recarga = None
+        self._ultima_recarga = None
+
+    @property
+    def generacion(self):
+        """Número de la generación actual (None antes de la primera carga)"""
+        actual = self._actual
+        return actual.numero if actual else None
+
+    @property
+    def config(self) -> dict:
+        actual = self._actual
+        return dict(actual.config) if actual else {}
+
+    def analizador_actual(self):
+        actual = self._actual
+        return actual.analizador if actual else None
+
+    @contextlib.contextmanager
+    def prestar(self):
+        """Generación actual durante una petición; no se libera mientras esté prestada"""
+        with self._lock:
+            generacion = self._actual
+            if generacion is None:
+                raise RuntimeError("Modelos no cargados")
+            generacion.en_vuelo += 1
+        try:
+            yield generacion
+        finally:
+            with self._lock:
+                generacion.en_vuelo -= 1
+                generacion.atendidas += 1
+                liberar = (
+                    generacion is not self._actual and generacion.en_vuelo == 0
+                    and self._retiradas.pop(generacion.numero, None) is not None
+                )
+            if liberar:
+                self._liberar(generacion)
+
+    def instalar(self, analizador, config: dict = None) -> int:
+        """Intercambio atómico: las peticiones nuevas usan `analizador` desde ya"""
+        with self._lock:
+            self._ultimo_numero += 1
+            nueva = Generacion(self._ultimo_numero, analizador, config or {})
+            anterior, self._actual = self._actual, nueva
+            liberar = None
+            if anterior is not None:
+                if anterior.en_vuelo:
+                    self._retiradas[anterior.numero] = anterior
+                else:
+                    liberar = anterior
+        logger.info(f"🔁 Generación {nueva.numero} de modelos instalada")
+        if liberar:
+            self._liberar(liberar)
+        return nueva.numero
+
+    def _liberar(self, generacion: Generacion):
+        analizador, generacion.analizador = generacion.analizador, None
+        if hasattr(analizador, "liberar"):
+            analizador.liberar()
+        del analizador
+        gc.collect()
+        logger.info(f"🧹 Generación {generacion.numero} liberada ({generacion.atendidas} peticiones atendidas)")
+
+    def recargando(self) -> bool:
+        return self._hilo_recarga is not None and self._hilo_recarga.is_alive()
+
+    def recargar(self, config: dict, construir, calentar=None, al_instalar=None) -> bool:
+        """
+        Recarga en segundo plano. construir(config) retorna un analizador ya
+        cargado; calentar(analizador) lo ejercita antes del intercambio y su
+        resultado se pasa a al_instalar(numero, datos) justo después.
+        Retorna False si ya hay una recarga en curso.
+        """
+        with self._lock:
+            if self.recargando():
+                return False
+            self._hilo_recarga = threading.Thread(
+                target=self._recargar, args=(dict(config), construir, calentar, al_instalar),
+                name="recarga-modelos", daemon=True
+            )
+            self._hilo_recarga.start()
+        return True
+
+    def _recargar(self, config, construir, calentar, al_instalar):
+        inicio = time.time()
+        registro = {"config": config, "inicio": inicio, "estado": "recargando"}
+        self._ultima_recarga = registro
+        nuevo = None
+        try:
+            logger.info(f"🔄 Recarga de modelos iniciada: {config}")
+            nuevo = construir(config)
+            datos = calentar(nuevo) if calentar else None
+            numero = self.instalar(nuevo, config)
+            nuevo = None
+            if al_instalar:
+                al_instalar(numero, datos)
+            registro.update(estado="completada", generacion=numero)
+        except Exception as e:
+            logger.error(f"💥 Recarga de modelos fallida, se mantiene la generación {self.generacion}: {e}")
+            logger.error(traceback.format_exc())
+            registro.update(estado="fallida", error=str(e))
+            if nuevo is not None and hasattr(nuevo, "liberar"):
+                nuevo.liberar()
+        finally:
+            registro["duracion_s"] = round(time.time() - inicio, 2)
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "actual": self._actual.como_dict() if self._actual else None,
+                "retiradas": [g.como_dict() for g in self._retiradas.values()],
+                "recargando": self.recargando(),
+                "ultima_recarga": dict(self._ultima_recarga) if self._ultima_recarga else None,
+            }
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Logging no bloqueante para el camino caliente de moderación.
+
+Los handlers reales (archivo, consola) corren en un hilo QueueListener; el
+hilo de la petición sólo encola el registro, sin formatearlo: usar argumentos
+perezosos (logger.info("... %s", valor)) con valores que no muten después.
+Los volcados de predicciones por etiqueta se escriben como registros JSONL
+muestreados.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+
+# Tasa de muestreo de volcados de predicciones (0.0 - 1.0), ajustable en caliente
+_tasa_muestreo = float(os.environ.get('MODERACION_MUESTREO_PREDICCIONES', '0.01'))
+_lock_tasa = threading.Lock()
+
+_listeners = []
+_logger_predicciones = None
+
+
+class _QueueHandlerDiferido(logging.handlers.QueueHandler):
+    """
+    QueueHandler.prepare() estándar interpola msg % args y aplica el Formatter
+    en el hilo que registra; aquí eso queda para el listener. Sólo la excepción
+    se resuelve en el momento (su traceback no sobrevive al hilo).
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = _FORMATTER_EXCEPCIONES.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_FORMATTER_EXCEPCIONES = logging.Formatter()
+
+
+def configurar_logging_asincrono(handlers, nivel=logging.INFO,
+                                 formato='%(asctime)s - %(levelname)s - %(message)s'):
+    """Configura el logger raíz para escribir a través de una cola en segundo plano"""
+    raiz = logging.getLogger()
+    if any(getattr(h, '_registro_asincrono', False) for h in raiz.handlers):
+        return  # Ya configurado (p.ej. modelo_server importando analisis_imagen)
+
+    formatter = logging.Formatter(formato)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    cola = queue.SimpleQueue()
+    queue_handler = _QueueHandlerDiferido(cola)
+    queue_handler._registro_asincrono = True
+
+    listener = logging.handlers.QueueListener(cola, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+
+    raiz.handlers = [queue_handler]
+    raiz.setLevel(nivel)
+
+
+def configurar_predicciones(ruta_jsonl: str):
+    """Destino JSONL de los volcados de predicciones muestreados"""
+    global _logger_predicciones
+    if _logger_predicciones is not None:
+        return
+
+    handler = logging.FileHandler(ruta_jsonl, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+
+    cola = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(cola, handler)
+    listener.start()
+    _listeners.append(listener)
+
+    registro = logging.getLogger("PREDICCIONES")
+    registro.handlers = [_QueueHandlerDiferido(cola)]
+    registro.setLevel(logging.INFO)
+    registro.propagate = False
+    _logger_predicciones = registro
+
+
+def establecer_tasa_muestreo(tasa: float) -> float:
+    global _tasa_muestreo
+    with _lock_tasa:
+        _tasa_muestreo = min(1.0, max(0.0, float(tasa)))
+        return _tasa_muestreo
+
+
+def obtener_tasa_muestreo() -> float:
+    return _tasa_muestreo
+
+
+def registrar_predicciones(etapa: str, image_path: str, predicciones, **extra):
+    """Escribe un registro JSONL con las predicciones, sólo para una muestra de llamadas"""
+    if _logger_predicciones is None or _tasa_muestreo <= 0.0:
+        return
+    if _tasa_muestreo < 1.0 and random.random() >= _tasa_muestreo:
+        return
+
+    registro = {
+        "ts": time.time(),
+        "etapa": etapa,
+        # PIL.Image decodificada desde memoria compartida: su nombre (hash de contenido)
+        "imagen": image_path if isinstance(image_path, str) else getattr(image_path, "info", {}).get("nombre"),
+        "predicciones": [
+            {"label": p.get("label", p.get("weapon")), "score": float(p.get("score", p.get("confidence", 0.0)))}
+            for p in predicciones
+        ],
+    }
+    registro.update(extra)
+    # La serialización ocurre aquí, pero sólo para la fracción muestreada
+    _logger_predicciones.info(json.dumps(registro, ensure_ascii=False))
+
+
+def detener_logging():
+    """Vacía las colas pendientes; se llama al salir del proceso"""
+    while _listeners:
+        _listeners.pop().stop()
+
+
+atexit.register(detener_logging)
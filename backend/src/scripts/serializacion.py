@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Serialización rápida de respuestas de /analyze.
+
+- Convierte tipos numpy a nativos en una sola pasada (sin JSONEncoder.default).
+- Permite pedir sólo algunos campos ('fields') o la versión compacta ('verbose').
+- Codifica en JSON (orjson si está instalado) o MessagePack (si msgpack está instalado).
+"""
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MIME_JSON = "application/json"
+MIME_MSGPACK = "application/x-msgpack"
+
+# Campos de depuración que se omiten con verbose=false
+CAMPOS_DEPURACION = (
+    "ruta_imagen",
+    "analisis_violencia.detalles_violencia",
+    "analisis_violencia.categorias_encontradas",
+    "analisis_violencia.total_categorias_analizadas",
+    "analisis_armas.detalles_armas",
+)
+
+_NATIVOS = (str, int, float, bool, type(None))
+
+
+class FormatoNoDisponibleError(Exception):
+    """Se pidió un formato cuyo paquete no está instalado"""
+
+
+def convertir_nativos(obj):
+    """Convierte recursivamente tipos numpy (np.bool_, np.float32, ndarray...) a tipos de Python"""
+    if isinstance(obj, _NATIVOS):
+        return obj
+    if isinstance(obj, dict):
+        return {k: convertir_nativos(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [convertir_nativos(v) for v in obj]
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return obj
+
+
+def parsear_campos(fields):
+    """
+    'fields' como string separado por comas o lista de strings; None si no se
+    pidió selección. ValueError con cualquier otra cosa (se valida antes del
+    análisis para responder 400 sin gastar el modelo).
+    """
+    if not fields:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    elif not isinstance(fields, list) or not all(isinstance(f, str) for f in fields):
+        raise ValueError(f"fields debe ser un string separado por comas o una lista de strings: {fields!r}")
+    return [f.strip() for f in fields if f.strip()]
+
+
+def _parsear_bool(valor, por_defecto=True):
+    if valor is None:
+        return por_defecto
+    if isinstance(valor, bool):
+        return valor
+    return str(valor).lower() not in ("0", "false", "no", "off")
+
+
+def seleccionar_campos(resultado: dict, fields=None, verbose=True) -> dict:
+    """
+    Reduce la respuesta. 'fields' admite rutas con punto
+    (p.ej. "es_apto,analisis_violencia.probabilidad_violencia").
+    """
+    campos = parsear_campos(fields)
+    if campos:
+        salida = {}
+        for campo in campos:
+            partes = campo.split(".")
+            origen = resultado
+            for parte in partes:
+                if not isinstance(origen, dict) or parte not in origen:
+                    break
+                origen = origen[parte]
+            else:
+                # Los padres sólo se crean cuando la hoja existe
+                destino = salida
+                for parte in partes[:-1]:
+                    destino = destino.setdefault(parte, {})
+                destino[partes[-1]] = origen
+        return salida
+
+    if _parsear_bool(verbose):
+        return resultado
+
+    salida = dict(resultado)
+    for campo in CAMPOS_DEPURACION:
+        padre, _, hoja = campo.rpartition(".")
+        if not padre:
+            salida.pop(hoja, None)
+        elif isinstance(salida.get(padre), dict):
+            salida[padre] = {k: v for k, v in salida[padre].items() if k != hoja}
+    return salida
+
+
+def negociar_formato(formato=None, accept: str = "") -> str:
+    """
+    Elige el MIME de respuesta a partir de 'formato' o de la cabecera Accept.
+    Lanza FormatoNoDisponibleError si no se puede servir lo pedido; se llama
+    antes del análisis para no gastar el modelo en una respuesta imposible.
+    """
+    if formato:
+        formato = str(formato).lower()
+        if formato == "json":
+            return MIME_JSON
+        if formato not in ("msgpack", "messagepack"):
+            raise FormatoNoDisponibleError(f"Formato desconocido: {formato!r} (json o msgpack)")
+        if msgpack is None:
+            raise FormatoNoDisponibleError("msgpack no está instalado en el servidor de modelos")
+        return MIME_MSGPACK
+    if accept and "msgpack" in accept:
+        if msgpack is not None:
+            return MIME_MSGPACK
+        # Accept con alternativas: caer a JSON si el cliente lo admite
+        if MIME_JSON not in accept and "*/*" not in accept:
+            raise FormatoNoDisponibleError("msgpack no está instalado en el servidor de modelos")
+    return MIME_JSON
+
+
+def codificar(resultado: dict, mime: str = MIME_JSON) -> bytes:
+    """Codifica la respuesta en el formato pedido"""
+    if mime == MIME_MSGPACK:
+        if msgpack is None:
+            raise FormatoNoDisponibleError("msgpack no está instalado en el servidor de modelos")
+        return msgpack.packb(convertir_nativos(resultado), use_bin_type=True)
+
+    if orjson is not None:
+        return orjson.dumps(resultado, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        convertir_nativos(resultado), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Pruebas del planificador (sin modelos): python -m unittest test_planificador
+"""
+import unittest
+
+from planificador import parsear_plazo_ms
+
+
+class PruebasPlazo(unittest.TestCase):
+    def test_sin_plazo(self):
+        for valor in (None, "", 0, 0.0):
+            self.assertIsNone(parsear_plazo_ms(valor))
+
+    def test_plazo_valido(self):
+        self.assertEqual(parsear_plazo_ms(250), 250.0)
+        self.assertEqual(parsear_plazo_ms("1500.5"), 1500.5)
+
+    def test_plazo_invalido(self):
+        for valor in ("abc", -5, "-1", float("inf"), float("nan"), [100], {"ms": 1}):
+            with self.assertRaises(ValueError, msg=repr(valor)):
+                parsear_plazo_ms(valor)
+
+    def test_booleano_rechazado(self):
+        # bool es subclase de int: true no debe convertirse en un plazo de 1 ms
+        for valor in (True, False):
+            with self.assertRaises(ValueError, msg=repr(valor)):
+                parsear_plazo_ms(valor)
+
+
+if __name__ == "__main__":
+    unittest.main()
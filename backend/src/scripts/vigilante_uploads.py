@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Pre-moderación de imágenes nuevas en el directorio de uploads.
+
+Usa eventos del sistema de archivos (watchdog: inotify/FSEvents/ReadDirectoryChanges)
+y, si watchdog no está instalado, un sondeo periódico del directorio. Las
+imágenes detectadas se moderan con prioridad 'fondo' sólo cuando el
+planificador está inactivo, y el veredicto queda en la caché.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("VIGILANTE_UPLOADS")
+
+EXTENSIONES_IMAGEN = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp')
+
+# Tiempo sin cambios antes de considerar que el archivo terminó de escribirse
+ESPERA_ESTABLE = 0.5
+
+
+class VigilanteUploads:
+    """Detecta imágenes nuevas y las pre-modera en segundo plano"""
+
+    def __init__(self, directorio: str, planificador, cache, analizar, intervalo_sondeo: float = 2.0):
+        self.directorio = os.path.abspath(directorio)
+        self.planificador = planificador
+        self.cache = cache
+        self.analizar = analizar
+        self.intervalo_sondeo = intervalo_sondeo
+        self._pendientes = OrderedDict()  # ruta -> instante del último evento
+        self._cond = threading.Condition()
+        self._activo = False
+        self._observer = None
+        self.modo = None
+        self.premoderadas = 0
+        self.cedidas = 0
+
+    def iniciar(self):
+        if self._activo:
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        self._activo = True
+
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+
+            vigilante = self
+
+            class _Manejador(FileSystemEventHandler):
+                def on_created(self, event):
+                    if not event.is_directory:
+                        vigilante.notificar(event.src_path)
+
+                def on_modified(self, event):
+                    if not event.is_directory:
+                        vigilante.notificar(event.src_path)
+
+                def on_moved(self, event):
+                    if not event.is_directory:
+                        vigilante.notificar(event.dest_path)
+
+            self._observer = Observer()
+            self._observer.schedule(_Manejador(), self.directorio, recursive=True)
+            self._observer.daemon = True
+            self._observer.start()
+            self.modo = "eventos"
+        except ImportError:
+            logger.warning("watchdog no disponible, usando sondeo del directorio")
+            threading.Thread(target=self._bucle_sondeo, name="vigilante-sondeo", daemon=True).start()
+            self.modo = "sondeo"
+
+        threading.Thread(target=self._bucle_premoderacion, name="vigilante-premoderacion", daemon=True).start()
+        logger.info(f"Vigilando {self.directorio} ({self.modo})")
+
+    def detener(self):
+        self._activo = False
+        if self._observer is not None:
+            self._observer.stop()
+        with self._cond:
+            self._cond.notify_all()
+
+    def notificar(self, ruta: str):
+        """Registra (o refresca) una ruta candidata a pre-moderación"""
+        if not ruta.lower().endswith(EXTENSIONES_IMAGEN):
+            return
+        with self._cond:
+            self._pendientes[ruta] = time.monotonic()
+            self._pendientes.move_to_end(ruta)
+            self._cond.notify()
+
+    def _bucle_sondeo(self):
+        vistos = {}
+        primera_pasada = True
+        while self._activo:
+            actuales = {}
+            for raiz, _, archivos in os.walk(self.directorio):
+                for nombre in archivos:
+                    ruta = os.path.join(raiz, nombre)
+                    try:
+                        actuales[ruta] = os.stat(ruta).st_mtime_ns
+                    except OSError:
+                        continue
+                    # Lo que ya existía al arrancar no se considera nuevo
+                    if not primera_pasada and vistos.get(ruta) != actuales[ruta]:
+                        self.notificar(ruta)
+            vistos = actuales
+            primera_pasada = False
+            time.sleep(self.intervalo_sondeo)
+
+    def _siguiente_estable(self):
+        """Espera una ruta sin eventos recientes (escritura terminada)"""
+        with self._cond:
+            while self._activo:
+                ahora = time.monotonic()
+                for ruta, ultimo_evento in self._pendientes.items():
+                    if ahora - ultimo_evento >= ESPERA_ESTABLE:
+                        del self._pendientes[ruta]
+                        return ruta
+                self._cond.wait(timeout=ESPERA_ESTABLE if self._pendientes else None)
+        return None
+
+    def _esperar_inactividad(self):
+        # Ceder siempre ante peticiones en vivo
+        while self._activo and not self.planificador.inactivo():
+            time.sleep(0.1)
+
+    def _bucle_premoderacion(self):
+        while self._activo:
+            ruta = self._siguiente_estable()
+            if ruta is None or not os.path.exists(ruta):
+                continue
+
+            try:
+                hash_contenido = self.cache.hash_de(ruta)
+                if self.cache.contiene(hash_contenido):
+                    continue
+
+                self._esperar_inactividad()
+
+                def tarea():
+                    # Si llegó trabajo en vivo mientras esperábamos, devolver el turno
+                    if self.planificador.hay_trabajo_prioritario("fondo"):
+                        return None
+                    return self.analizar(ruta)
+
+                resultado = self.planificador.enviar(tarea, prioridad="fondo").esperar()
+                if resultado is None:
+                    self.cedidas += 1
+                    self.notificar(ruta)  # Reintentar cuando vuelva a haber inactividad
+                    continue
+
+                self.cache.guardar(hash_contenido, resultado)
+                self.premoderadas += 1
+                logger.debug(f"Pre-moderada: {ruta} (apto={resultado.get('es_apto')})")
+            except Exception as e:
+                logger.warning(f"Error pre-moderando {ruta}: {e}")
+
+    def estadisticas(self) -> dict:
+        with self._cond:
+            pendientes = len(self._pendientes)
+        return {
+            "directorio": self.directorio,
+            "modo": self.modo,
+            "pendientes": pendientes,
+            "premoderadas": self.premoderadas,
+            "cedidas": self.cedidas,
+        }
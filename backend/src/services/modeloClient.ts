@@ -1,5 +1,6 @@
 import fetch, { Response } from 'node-fetch';
 import path from 'path';
+import { SegmentoImagen, crearSegmento, liberarSegmento } from '../utils/memoriaCompartida';
 
 export interface AnalisisImagenResultado {
   es_apto: boolean;
@@ -9,6 +10,25 @@ export interface AnalisisImagenResultado {
   tiempo_procesamiento?: number;
   ruta_imagen?: string;
   error?: string;
+  tiempo_espera_cola?: number;
+  prioridad?: string;
+  // 'completo' salvo que el servidor esté degradado por sobrecarga
+  modo_analisis?: 'completo' | 'etiquetas_reducidas' | 'resolucion_reducida' | 'solo_yolo';
+  // Código del rechazo en preflight (p.ej. 'PIXELES_EXCEDIDOS', 'FORMATO_NO_PERMITIDO')
+  codigo?: string;
+  tiempo_preflight?: number;
+  // Generación de modelos que produjo el veredicto (cambia con cada recarga en caliente)
+  generacion_modelo?: number;
+}
+
+export interface OpcionesAnalisis {
+  tipoContenido?: string;
+  prioridad?: 'interactiva' | 'normal' | 'lote' | 'fondo';
+  plazoMs?: number;
+  // Sólo estos campos en la respuesta (p.ej. ['es_apto', 'puntuacion_riesgo'])
+  campos?: string[];
+  // false omite detalles de depuración (detalles_violencia, ruta_imagen, ...)
+  verbose?: boolean;
 }
 
 export class ModeloClient {
@@ -97,25 +117,72 @@ export class ModeloClient {
     return false;
   }
 
-  async analizarImagen(imagePath: string): Promise<AnalisisImagenResultado> {
+  async analizarImagen(imagePath: string, opciones: OpcionesAnalisis = {}): Promise<AnalisisImagenResultado> {
+    console.log(`🖼️ Analizando imagen: ${imagePath}`);
+    
+    // ✅ RESOLVER RUTA ABSOLUTA
+    const rutaAbsoluta = this.resolverRutaAbsoluta(imagePath);
+    return await this.solicitarAnalisis({ image_path: rutaAbsoluta }, opciones);
+  }
+
+  /**
+   * ✅ TRANSPORTE POR MEMORIA COMPARTIDA: los bytes van en un segmento de
+   * /dev/shm y sólo su nombre y longitud viajan en la petición. El servicio
+   * (en la misma máquina) lo decodifica y lo elimina; aquí se elimina también
+   * al terminar por si el servicio no llegó a leerlo.
+   */
+  async analizarBuffer(buffer: Buffer, opciones: OpcionesAnalisis = {}): Promise<AnalisisImagenResultado> {
+    let segmento: SegmentoImagen;
+    try {
+      segmento = await crearSegmento(buffer);
+    } catch (error) {
+      console.error('❌ Error creando segmento de memoria compartida:', error);
+      return this.resultadoError(error);
+    }
+
+    console.log(`🖼️ Analizando imagen en memoria compartida: ${segmento.nombre} (${segmento.longitud} bytes)`);
+    try {
+      return await this.solicitarAnalisis({ segmento: segmento.nombre, longitud: segmento.longitud }, opciones);
+    } finally {
+      await liberarSegmento(segmento);
+    }
+  }
+
+  private async solicitarAnalisis(
+    origen: { image_path: string } | { segmento: string; longitud: number },
+    opciones: OpcionesAnalisis
+  ): Promise<AnalisisImagenResultado> {
     const inicio = Date.now();
     
     try {
-      console.log(`🖼️ Analizando imagen: ${imagePath}`);
-      
-      // ✅ RESOLVER RUTA ABSOLUTA
-      const rutaAbsoluta = this.resolverRutaAbsoluta(imagePath);
-      
       const response = await this.fetchWithTimeout(`${this.baseUrl}/analyze`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({
-          image_path: rutaAbsoluta
+          ...origen,
+          tipo_contenido: opciones.tipoContenido,
+          prioridad: opciones.prioridad,
+          // ✅ Si el análisis no empieza antes de nuestro timeout, el servidor lo descarta
+          plazo_ms: opciones.plazoMs ?? this.timeout - 1000,
+          fields: opciones.campos,
+          verbose: opciones.verbose
         })
       });
 
+      // ✅ 422: la imagen no pasó el preflight; es un rechazo definitivo, no un fallo del servicio
+      if (response.status === 422) {
+        const rechazo = await response.json() as AnalisisImagenResultado;
+        console.log(`🚫 Imagen rechazada en preflight: ${rechazo.codigo} - ${rechazo.error}`);
+        return {
+          ...rechazo,
+          analisis_violencia: { es_violento: false, probabilidad_violencia: 0.0 },
+          analisis_armas: { armas_detectadas: false, confianza: 0.0 },
+          tiempo_procesamiento: (Date.now() - inicio) / 1000
+        };
+      }
+
       if (!response.ok) {
         const errorText = await response.text();
         throw new Error(`HTTP ${response.status}: ${response.statusText} - ${errorText}`);
@@ -134,32 +201,33 @@ export class ModeloClient {
 
     } catch (error) {
       console.error('❌ Error analizando imagen:', error);
-      
-      const errorResult: AnalisisImagenResultado = {
-        es_apto: false,
-        analisis_violencia: {
-          es_violento: false,
-          probabilidad_violencia: 0.0,
-          detalles_violencia: [],
-          total_categorias_analizadas: 0,
-          error: 'Servicio no disponible'
-        },
-        analisis_armas: {
-          armas_detectadas: false,
-          confianza: 0.0,
-          detalles_armas: [],
-          total_armas_detectadas: 0,
-          modelo_utilizado: 'none',
-          error: 'Servicio no disponible'
-        },
-        puntuacion_riesgo: 1.0,
-        error: error instanceof Error ? error.message : 'Error desconocido'
-      };
-      
-      return errorResult;
+      return this.resultadoError(error);
     }
   }
 
+  private resultadoError(error: unknown): AnalisisImagenResultado {
+    return {
+      es_apto: false,
+      analisis_violencia: {
+        es_violento: false,
+        probabilidad_violencia: 0.0,
+        detalles_violencia: [],
+        total_categorias_analizadas: 0,
+        error: 'Servicio no disponible'
+      },
+      analisis_armas: {
+        armas_detectadas: false,
+        confianza: 0.0,
+        detalles_armas: [],
+        total_armas_detectadas: 0,
+        modelo_utilizado: 'none',
+        error: 'Servicio no disponible'
+      },
+      puntuacion_riesgo: 1.0,
+      error: error instanceof Error ? error.message : 'Error desconocido'
+    };
+  }
+
   async debugPaths(): Promise<any> {
     try {
       const response = await this.fetchWithTimeout(`${this.baseUrl}/debug-paths`);
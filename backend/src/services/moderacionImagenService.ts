@@ -1,5 +1,6 @@
 // backend/src/services/moderacionImagenService.ts - VERSIÓN COMPATIBLE
 import { ModeloClient } from './modeloClient';
+import { barrerSegmentosHuerfanos, memoriaCompartidaDisponible } from '../utils/memoriaCompartida';
 import { pool } from '../utils/baseDeDatos';
 import fs from 'fs';
 import path from 'path';
@@ -28,9 +29,18 @@ export interface ImageModerationOptions {
   idContenido?: string | number | undefined;
 }
 
+// ✅ MODEL_TRANSPORT=memoria: la imagen viaja al servidor de modelos por memoria
+// compartida en vez de releerse del archivo temporal (sólo Linux, misma máquina)
+const USAR_MEMORIA_COMPARTIDA = process.env.MODEL_TRANSPORT === 'memoria' && memoriaCompartidaDisponible();
+if (USAR_MEMORIA_COMPARTIDA) {
+  barrerSegmentosHuerfanos();
+}
+
 export class ModeracionImagenService {
   private modeloClient: ModeloClient;
   private tempDir: string;
+  // Bytes de cada imagen temporal, para enviarlos por memoria compartida
+  private buffersTemporales = new Map<string, Buffer>();
 
   constructor() {
     this.modeloClient = new ModeloClient();
@@ -90,7 +100,9 @@ export class ModeracionImagenService {
         return await this.usarMetodoOriginal(imagePath, ipUsuario, hashNavegador, options);
       }
 
-      const resultado = await this.modeloClient.analizarImagen(imagePath);
+      const resultado = await this.modeloClient.analizarImagen(imagePath, {
+        tipoContenido: options.tipoContenido
+      });
 
       await this.registrarLogModeracionImagen({
         imagePath,
@@ -139,8 +151,11 @@ export class ModeracionImagenService {
       const filename = `temp_${timestamp}_${randomSuffix}${extension}`;
       const tempPath = path.join(this.tempDir, filename);
 
-      // Guardar archivo temporal
+      // Guardar archivo temporal (se mueve a su destino final si se aprueba)
       await fsPromises.writeFile(tempPath, fileBuffer);
+      if (USAR_MEMORIA_COMPARTIDA) {
+        this.buffersTemporales.set(tempPath, fileBuffer);
+      }
       
       console.log(`📥 Imagen temporal creada: ${tempPath}`);
       
@@ -168,6 +183,9 @@ export class ModeracionImagenService {
     options: ImageModerationOptions
   ): Promise<ImageModerationResult> {
     console.log(`🖼️ Moderando imagen temporal: ${tempPath} para ${options.tipoContenido}`);
+    // Tomar el buffer antes de cualquier salida (fallback o error) para no retenerlo en el Map
+    const buffer = this.buffersTemporales.get(tempPath);
+    this.buffersTemporales.delete(tempPath);
     
     try {
       // Esperar a que el servidor esté listo
@@ -179,7 +197,9 @@ export class ModeracionImagenService {
       }
 
       // Analizar imagen temporal
-      const resultado = await this.modeloClient.analizarImagen(tempPath);
+      const resultado = buffer
+        ? await this.modeloClient.analizarBuffer(buffer, { tipoContenido: options.tipoContenido })
+        : await this.modeloClient.analizarImagen(tempPath, { tipoContenido: options.tipoContenido });
 
       // Registrar log de moderación
       await this.registrarLogModeracionImagen({
@@ -0,0 +1,98 @@
+// utils/memoriaCompartida.ts
+// Transporte de imágenes al servicio Python por memoria compartida POSIX
+// (ver src/scripts/memoria_compartida.py). Node no expone shm_open: el
+// segmento se crea como archivo en /dev/shm (tmpfs, sin E/S de disco), que es
+// exactamente lo que Python abre con multiprocessing.shared_memory.
+import fs from 'fs';
+import path from 'path';
+import crypto from 'crypto';
+
+const DIRECTORIO_SEGMENTOS = '/dev/shm';
+const PREFIJO_SEGMENTO = 'moderacion_';
+const NOMBRE_VALIDO = /^moderacion_(\d+)_[A-Za-z0-9]+$/;
+
+export interface SegmentoImagen {
+  nombre: string;
+  longitud: number;
+}
+
+// Segmentos creados por este proceso y aún no liberados
+const segmentosAbiertos = new Set<string>();
+
+export function memoriaCompartidaDisponible(): boolean {
+  return process.platform === 'linux' && fs.existsSync(DIRECTORIO_SEGMENTOS);
+}
+
+/**
+ * Copia la imagen a un segmento nuevo. El nombre lleva nuestro PID para que
+ * cualquiera de los dos lados pueda barrerlo si este proceso muere.
+ */
+export async function crearSegmento(buffer: Buffer): Promise<SegmentoImagen> {
+  const nombre = `${PREFIJO_SEGMENTO}${process.pid}_${crypto.randomBytes(8).toString('hex')}`;
+  // 'wx': nunca pisar un segmento existente; 0o600: sólo el usuario del backend y del servicio
+  await fs.promises.writeFile(path.join(DIRECTORIO_SEGMENTOS, nombre), buffer, { flag: 'wx', mode: 0o600 });
+  segmentosAbiertos.add(nombre);
+  return { nombre, longitud: buffer.length };
+}
+
+/**
+ * Elimina el segmento. Python lo elimina al decodificarlo, así que lo normal
+ * es que ya no exista: ENOENT no es un error.
+ */
+export async function liberarSegmento(segmento: SegmentoImagen): Promise<void> {
+  segmentosAbiertos.delete(segmento.nombre);
+  try {
+    await fs.promises.unlink(path.join(DIRECTORIO_SEGMENTOS, segmento.nombre));
+  } catch (error: any) {
+    if (error.code !== 'ENOENT') {
+      console.warn(`⚠️ No se pudo eliminar el segmento ${segmento.nombre}: ${error.message}`);
+    }
+  }
+}
+
+function procesoVivo(pid: number): boolean {
+  try {
+    process.kill(pid, 0);
+    return true;
+  } catch (error: any) {
+    return error.code === 'EPERM'; // existe, pero es de otro usuario
+  }
+}
+
+/**
+ * Elimina los segmentos de procesos que ya no existen (p.ej. una instancia
+ * anterior del backend que murió con peticiones en vuelo).
+ */
+export function barrerSegmentosHuerfanos(): number {
+  if (!memoriaCompartidaDisponible()) {
+    return 0;
+  }
+  let eliminados = 0;
+  for (const nombre of fs.readdirSync(DIRECTORIO_SEGMENTOS)) {
+    const coincidencia = NOMBRE_VALIDO.exec(nombre);
+    if (!coincidencia || procesoVivo(Number(coincidencia[1]))) {
+      continue;
+    }
+    try {
+      fs.unlinkSync(path.join(DIRECTORIO_SEGMENTOS, nombre));
+      eliminados++;
+    } catch {
+      // Ya eliminado por el servicio Python
+    }
+  }
+  if (eliminados > 0) {
+    console.log(`🧹 ${eliminados} segmentos de memoria compartida huérfanos eliminados`);
+  }
+  return eliminados;
+}
+
+// Salida ordenada (incluye el shutdown por SIGTERM/SIGINT de index.ts): no dejar segmentos
+process.on('exit', () => {
+  for (const nombre of segmentosAbiertos) {
+    try {
+      fs.unlinkSync(path.join(DIRECTORIO_SEGMENTOS, nombre));
+    } catch {
+      // Ya eliminado por el servicio Python
+    }
+  }
+});